@@ -0,0 +1,343 @@
+"""
+Columnar archive of closed orders, one directory per month.
+
+Each archive file holds pairs of row groups (orders, then the items of those
+orders). A row group is a JSON header followed by one zlib-compressed
+column per field. Numeric columns are packed int64 arrays: ids, prices in
+cents and timestamps in epoch microseconds. Text columns are compressed JSON
+lists. Headers record each group's created_time range, so a scan skips
+groups that fall outside the requested range without decompressing them.
+
+    archive/2024-03/part-20250101T000000.col
+"""
+import json
+import os
+import struct
+import tempfile
+import time
+import zlib
+from array import array
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .changes import record_deleted
+from .models import Order
+from .models import OrderItem
+from .partitioning import add_months, month_start
+from .purge import delete_ids
+from .tenancy import DEFAULT_TENANT_ID, current_tenant
+
+MAGIC = b'OCOL1\n'
+HEADER = struct.Struct('<I')
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+ORDER_COLUMNS = [
+    # (name, type) -- 'q' is a packed int64 column, 'json' a compressed list
+    ('id', 'q'),
+    ('order_number', 'json'),
+    ('total_cents', 'q'),
+    ('created_us', 'q'),
+    ('status', 'json'),
+    ('version', 'q'),
+    ('customer_name', 'json'),
+    ('note', 'json'),
+    ('tenant_id', 'q'),
+]
+ITEM_COLUMNS = [
+    ('id', 'q'),
+    ('order_id', 'q'),
+    ('product_id', 'q'),
+    ('quantity', 'q'),
+    ('price_cents', 'q'),
+    ('created_us', 'q'),
+    ('tenant_id', 'q'),
+]
+# Orders in these statuses do not count towards revenue.
+NON_REVENUE_STATUSES = ('cancelled', 'refunded')
+
+
+def to_cents(value):
+    return int((Decimal(value) * 100).to_integral_value())
+
+
+def to_micros(value):
+    delta = value - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def from_micros(value):
+    return datetime.fromtimestamp(value / 1000000, tz=dt_timezone.utc)
+
+
+def month_dir(month):
+    return os.path.join(settings.ORDER_ARCHIVE_DIR, f"{month:%Y-%m}")
+
+
+def _encode_group(columns, rows, created_index):
+    created = [row[created_index] for row in rows]
+    header = {
+        "rows": len(rows),
+        "min_created_us": min(created) if rows else 0,
+        "max_created_us": max(created) if rows else 0,
+        "columns": [],
+    }
+    blobs = []
+    for index, (name, kind) in enumerate(columns):
+        values = [row[index] for row in rows]
+        raw = array('q', values).tobytes() if kind == 'q' else json.dumps(values).encode()
+        blob = zlib.compress(raw, 6)
+        header["columns"].append({"name": name, "type": kind, "size": len(blob)})
+        blobs.append(blob)
+    encoded = json.dumps(header).encode()
+    return HEADER.pack(len(encoded)) + encoded + b''.join(blobs)
+
+
+def _read_groups(path, start_us=None, end_us=None):
+    """Yield decoded (header, columns) row groups, skipping those outside [start_us, end_us)."""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"Not an order archive: {path}")
+        while True:
+            size = f.read(HEADER.size)
+            if not size:
+                return
+            header = json.loads(f.read(HEADER.unpack(size)[0]))
+            total = sum(column["size"] for column in header["columns"])
+            if header["rows"] and (
+                (start_us is not None and header["max_created_us"] < start_us)
+                or (end_us is not None and header["min_created_us"] >= end_us)
+            ):
+                f.seek(total, os.SEEK_CUR)
+                yield header, None
+                continue
+            columns = {}
+            for column in header["columns"]:
+                raw = zlib.decompress(f.read(column["size"]))
+                if column["type"] == 'q':
+                    values = array('q')
+                    values.frombytes(raw)
+                else:
+                    values = json.loads(raw)
+                columns[column["name"]] = values
+            yield header, columns
+
+
+def archive_files(month):
+    directory = month_dir(month)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.col'))
+
+
+def archived_months():
+    if not os.path.isdir(settings.ORDER_ARCHIVE_DIR):
+        return []
+    months = []
+    for name in sorted(os.listdir(settings.ORDER_ARCHIVE_DIR)):
+        try:
+            months.append(datetime.strptime(name, '%Y-%m').replace(tzinfo=dt_timezone.utc))
+        except ValueError:
+            continue
+    return months
+
+
+def _for_tenant(columns, tenant_id):
+    """Only `tenant_id`'s rows of a decoded group (files written before tenants belong to the default one)."""
+    tenants = columns.get('tenant_id')
+    if tenants is None:
+        return columns if tenant_id == DEFAULT_TENANT_ID else None
+    keep = [index for index, value in enumerate(tenants) if value == tenant_id]
+    if len(keep) == len(tenants):
+        return columns
+    if not keep:
+        return None
+    return {
+        name: array('q', [values[i] for i in keep]) if isinstance(values, array) else [values[i] for i in keep]
+        for name, values in columns.items()
+    }
+
+
+def iter_groups(start=None, end=None):
+    """
+    Yield (month, orders, items) column dicts for archived months overlapping [start, end).
+    Inside a tenant context only that tenant's rows are returned.
+    """
+    start_us = to_micros(start) if start else None
+    end_us = to_micros(end) if end else None
+    tenant_id = current_tenant()
+    for month in archived_months():
+        if (start and add_months(month, 1) <= start) or (end and month >= end):
+            continue
+        for path in archive_files(month):
+            groups = _read_groups(path, start_us, end_us)
+            for (_, orders), (_, items) in zip(groups, groups):
+                if orders is None:
+                    continue
+                if tenant_id is not None:
+                    orders = _for_tenant(orders, tenant_id)
+                    if orders is None:
+                        continue
+                    items = _for_tenant(items, tenant_id) or {}
+                yield month, orders, items
+
+
+def scan_orders(start=None, end=None, ids=None):
+    """Archived orders created in [start, end), as dicts shaped like list_orders rows."""
+    start_us = to_micros(start) if start else None
+    end_us = to_micros(end) if end else None
+    wanted = set(ids) if ids else None
+    for _, orders, _ in iter_groups(start, end):
+        for index, created_us in enumerate(orders['created_us']):
+            if (start_us is not None and created_us < start_us) or (end_us is not None and created_us >= end_us):
+                continue
+            if wanted is not None and orders['id'][index] not in wanted:
+                continue
+            yield {
+                "order_id": orders['id'][index],
+                "order_number": orders['order_number'][index],
+                "total_price": orders['total_cents'][index] / 100,
+                "status": orders['status'][index],
+                "version": orders['version'][index],
+                "created_time": from_micros(created_us),
+            }
+
+
+def archived_revenue_by_month(start=None, end=None):
+    """Return {month: cents} of item revenue for archived orders created in [start, end)."""
+    # Imported here so numpy is only loaded by processes that serve reports.
+    import numpy as np
+
+    start_us = to_micros(start) if start else None
+    end_us = to_micros(end) if end else None
+    totals = {}
+    for month, orders, items in iter_groups(start, end):
+        if not items or not items['id']:
+            continue
+        created = np.frombuffer(items['created_us'], dtype=np.int64)
+        mask = np.ones(len(created), dtype=bool)
+        if start_us is not None:
+            mask &= created >= start_us
+        if end_us is not None:
+            mask &= created < end_us
+        excluded = [
+            order_id for order_id, status in zip(orders['id'], orders['status'])
+            if status in NON_REVENUE_STATUSES
+        ]
+        if excluded:
+            mask &= ~np.isin(np.frombuffer(items['order_id'], dtype=np.int64), excluded)
+        quantity = np.frombuffer(items['quantity'], dtype=np.int64)
+        cents = np.frombuffer(items['price_cents'], dtype=np.int64)
+        totals[month] = totals.get(month, 0) + int(np.dot(quantity[mask], cents[mask]))
+    return totals
+
+
+def closed_orders(month):
+    """Live orders in a final status created during `month`."""
+    return Order.objects.alive().filter(
+        status__in=Order.CLOSED_STATUSES,
+        created_time__gte=month,
+        created_time__lt=add_months(month, 1),
+    )
+
+
+def archived_order_ids(month):
+    """Ids of every order already in `month`'s archive files, across tenants."""
+    ids = set()
+    for path in archive_files(month):
+        groups = _read_groups(path)
+        for (_, orders), _ in zip(groups, groups):
+            ids.update(orders['id'])
+    return ids
+
+
+def _write_part(directory, orders, items):
+    """Write one row group pair to a temporary file in `directory`; returns its path."""
+    created_by_order = {row[0]: row[3] for row in orders}
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC)
+            f.write(_encode_group(ORDER_COLUMNS, [
+                (pk, number, to_cents(total), to_micros(created), status, version, customer, note, tenant_id)
+                for pk, number, total, created, status, version, customer, note, tenant_id in orders
+            ], created_index=3))
+            f.write(_encode_group(ITEM_COLUMNS, [
+                (pk, order_id, product_id, quantity, to_cents(price),
+                 to_micros(created or created_by_order[order_id]), tenant_id)
+                for pk, order_id, product_id, quantity, price, created, tenant_id in items
+            ], created_index=5))
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return tmp_path
+
+
+def _delete_archived(orders, items):
+    """Delete archived rows, items first, and append their delete events to the changes feed."""
+    delete_ids(OrderItem, [row[0] for row in items])
+    delete_ids(Order, [row[0] for row in orders])
+    for model, rows, tenant_index in ((OrderItem, items, 6), (Order, orders, 8)):
+        by_tenant = {}
+        for row in rows:
+            by_tenant.setdefault(row[tenant_index], []).append(row[0])
+        for tenant_id, ids in by_tenant.items():
+            record_deleted(model, ids, tenant_id=tenant_id)
+
+
+def archive_month(month, chunk_size=10000, sleep=0.1):
+    """
+    Move the closed orders of `month` (and their items) into the archive.
+    - Rows are read in id order, `chunk_size` orders at a time; each chunk
+      becomes one archive file, written under a temporary name.
+    - Each chunk is one transaction: its orders are locked and deleted with
+      their items (recording delete events), and the file is renamed into
+      place just before the commit. A failure before then leaves neither the
+      file nor the deletes. Rows are never kept live once archived, since
+      reads combine the live tables with the archive.
+    - Orders already in the month's archive are not written again, only
+      deleted, so a run cut short between the rename and the commit is
+      completed by running it again.
+    - Sleeps `sleep` seconds between chunks.
+    Returns a (orders, items) tuple of newly archived row counts.
+    """
+    month = month_start(month)
+    directory = month_dir(month)
+    os.makedirs(directory, exist_ok=True)
+    already_archived = archived_order_ids(month)
+    queryset = closed_orders(month).order_by('id')
+    archived_orders = archived_items = 0
+    last_id = 0
+
+    while True:
+        with transaction.atomic():
+            orders = list(queryset.select_for_update().filter(id__gt=last_id).values_list(
+                'id', 'order_number', 'total_price', 'created_time', 'status', 'version',
+                'customer_name', 'note', 'tenant_id',
+            )[:chunk_size])
+            if not orders:
+                break
+            last_id = orders[-1][0]
+            items = list(OrderItem.objects.filter(order_id__in=[row[0] for row in orders]).order_by('id').values_list(
+                'id', 'order_id', 'product_id', 'quantity', 'price_at_order', 'order_created_time', 'tenant_id',
+            ))
+            new_orders = [row for row in orders if row[0] not in already_archived]
+            new_items = [row for row in items if row[1] not in already_archived]
+            tmp_path = _write_part(directory, new_orders, new_items) if new_orders else None
+            try:
+                _delete_archived(orders, items)
+                if tmp_path:
+                    os.replace(tmp_path, os.path.join(directory, f"part-{timezone.now():%Y%m%dT%H%M%S%f}.col"))
+            except BaseException:
+                if tmp_path and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        archived_orders += len(new_orders)
+        archived_items += len(new_items)
+        already_archived.update(row[0] for row in new_orders)
+        time.sleep(sleep)
+
+    return archived_orders, archived_items
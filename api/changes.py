@@ -0,0 +1,137 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Exists, Max, Min, OuterRef
+from django.utils import timezone
+from .models import ChangeEvent
+from .models import Order
+from .models import OrderItem
+from .models import Product
+from .purge import delete_ids
+
+
+def order_data(order):
+    return {
+        "order_id": order.id,
+        "order_number": order.order_number,
+        "total_price": float(order.total_price),
+        "status": order.status,
+        "version": order.version,
+        "created_time": order.created_time,
+    }
+
+
+def product_data(product):
+    return {
+        "id": product.id,
+        "name": product.name,
+        "price": float(product.price),
+    }
+
+
+def order_item_data(item):
+    return {
+        "id": item.id,
+        "order_id": item.order_id,
+        "product_id": item.product_id,
+        "quantity": item.quantity,
+        "price_at_order": float(item.price_at_order),
+    }
+
+
+SERIALIZERS = {
+    Order: ('order', order_data),
+    Product: ('product', product_data),
+    OrderItem: ('order_item', order_item_data),
+}
+
+
+def record(action, instances):
+    """
+    Append one event per instance.
+    Call inside the transaction that made the write, so both commit together.
+    """
+    events = []
+    for instance in instances:
+        name, serialize = SERIALIZERS[type(instance)]
+        events.append(ChangeEvent(
+            tenant_id=instance.tenant_id,
+            model=name,
+            object_id=instance.pk,
+            action=action,
+            data=None if action == ChangeEvent.DELETE else serialize(instance),
+        ))
+    ChangeEvent.objects.bulk_create(events)
+
+
+def record_deleted(model, ids, tenant_id=None):
+    """Append delete events for rows removed without loading them (in the active tenant unless `tenant_id`)."""
+    name = SERIALIZERS[model][0]
+    tenant = {} if tenant_id is None else {"tenant_id": tenant_id}
+    ChangeEvent.objects.bulk_create([
+        ChangeEvent(model=name, object_id=pk, action=ChangeEvent.DELETE, **tenant) for pk in ids
+    ])
+
+
+def record_order_deleted(order_id):
+    """An order delete also removes (or hides) its items."""
+    record_deleted(OrderItem, OrderItem.objects.filter(order_id=order_id).values_list('id', flat=True))
+    record_deleted(Order, [order_id])
+
+
+def settled(queryset, limit=None):
+    """
+    Events of `queryset` in seq order, up to the first one younger than CHANGE_FEED_SETTLE_SECONDS.
+    created_time is taken before the insert assigns seq, so a later seq can carry an earlier
+    timestamp; stopping at the first unsettled event keeps the result a gap-free prefix.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.CHANGE_FEED_SETTLE_SECONDS)
+    events = queryset.order_by('seq')
+    if limit is not None:
+        events = events[:limit]
+    prefix = []
+    for event in events:
+        if event.created_time > cutoff:
+            break
+        prefix.append(event)
+    return prefix
+
+
+def settled_seq():
+    """The feed position below which every visible event has settled (see `settled`)."""
+    cutoff = timezone.now() - timedelta(seconds=settings.CHANGE_FEED_SETTLE_SECONDS)
+    unsettled = ChangeEvent.objects.filter(created_time__gt=cutoff).aggregate(seq=Min('seq'))['seq']
+    events = ChangeEvent.objects.all()
+    if unsettled is not None:
+        events = events.filter(seq__lt=unsettled)
+    return events.aggregate(seq=Max('seq'))['seq'] or 0
+
+
+def compact(older_than=timedelta(days=7), batch_size=1000, sleep=0.1, drop_tombstones=False, on_batch=None):
+    """
+    Shrink the log while keeping the latest event for every object.
+    - Only events older than `older_than` are considered.
+    - Superseded events are removed in batches of `batch_size`.
+    - With `drop_tombstones`, old delete events are removed as well.
+    - Calls `on_batch()` after each batch (the compaction job's heartbeat).
+    Returns the number of events removed.
+    """
+    old_events = ChangeEvent.objects.filter(created_time__lt=timezone.now() - older_than)
+    superseded = old_events.filter(Exists(
+        ChangeEvent.objects.filter(model=OuterRef('model'), object_id=OuterRef('object_id'), seq__gt=OuterRef('seq'))
+    ))
+    querysets = [superseded]
+    if drop_tombstones:
+        querysets.append(old_events.filter(action=ChangeEvent.DELETE))
+
+    removed = 0
+    for queryset in querysets:
+        while True:
+            seqs = list(queryset.order_by('seq').values_list('seq', flat=True)[:batch_size])
+            if not seqs:
+                break
+            removed += delete_ids(ChangeEvent, seqs)
+            if on_batch is not None:
+                on_batch()
+            time.sleep(sleep)
+    return removed
@@ -0,0 +1,302 @@
+"""
+Write coalescing for create_order_item (opt-in, ORDER_ITEM_COALESCE).
+
+At checkout peaks most of the cost of one-row INSERTs is round trips and
+commits. With coalescing on, each request puts its item in a per-process
+buffer, and one of the waiting requests, the leader, writes the whole buffer:
+- orders and products are looked up with one query each;
+- the items go in with one multi-row INSERT ... RETURNING (bulk_create),
+  with their change events, in a single transaction;
+- stock is reserved per item in that same transaction;
+- every request still gets its own id, or its own error.
+
+The leader waits up to ORDER_ITEM_COALESCE_WINDOW_MS for the batch to fill
+up to ORDER_ITEM_COALESCE_MAX_BATCH rows and writes that one batch. Whatever
+is left goes to a request still waiting for its item, or to the next
+submitter; the leader only writes another batch when nobody takes over
+within a window, so its own latency stays bounded under steady traffic.
+Flushes run on request threads and their database connections; there is no
+background thread to lose on shutdown.
+
+Back-pressure: at most ORDER_ITEM_COALESCE_MAX_PENDING items wait in the
+buffer. Further requests block for up to ORDER_ITEM_COALESCE_QUEUE_TIMEOUT
+seconds, then get BufferFull (503).
+
+A leader that dies (any BaseException, e.g. its worker being shut down)
+fails the batch it was writing and hands the rest of the buffer to the next
+request. Waiting requests never depend on it for long: `result()` waits at
+most ORDER_ITEM_COALESCE_RESULT_TIMEOUT, then takes its item back out of the
+buffer and inserts it directly.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from .models import ChangeEvent
+from .models import Order
+from .models import OrderItem
+from .models import Product
+from . import changes
+from . import inventory
+from .tenancy import default_tenant_id
+
+logger = logging.getLogger(__name__)
+
+
+class BufferFull(Exception):
+    """Too many items are waiting to be written."""
+
+
+class ItemBuffer:
+    def __init__(self):
+        self.pending = []  # (tenant_id, order_id, product_id, quantity, future)
+        self.condition = threading.Condition()
+        self.leading = False
+        self.waiting = 0  # Requests blocked in wait(), each able to take over leading.
+
+    def submit(self, order_id, product_id, quantity):
+        """Queue one item; return (future, True if the caller must lead the flush)."""
+        future = Future()
+        future.add_done_callback(self._wake)
+        deadline = time.monotonic() + settings.ORDER_ITEM_COALESCE_QUEUE_TIMEOUT
+        with self.condition:
+            while len(self.pending) >= settings.ORDER_ITEM_COALESCE_MAX_PENDING:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise BufferFull(f"{len(self.pending)} order items are waiting to be written.")
+                self.condition.wait(remaining)
+            self.pending.append((default_tenant_id(), order_id, product_id, quantity, future))
+            if len(self.pending) >= settings.ORDER_ITEM_COALESCE_MAX_BATCH:
+                self.condition.notify_all()
+            if self.leading:
+                return future, False
+            self.leading = True
+            self.condition.notify_all()
+        return future, True
+
+    def _wake(self, future):
+        with self.condition:
+            self.condition.notify_all()
+
+    def lead(self):
+        """
+        Wait out the window (or a full batch), then write one batch.
+        Items left over go to a request blocked in `wait()` or the next
+        submitter; another batch is written only if nobody takes over in time.
+        """
+        while True:
+            deadline = time.monotonic() + settings.ORDER_ITEM_COALESCE_WINDOW_MS / 1000
+            with self.condition:
+                while len(self.pending) < settings.ORDER_ITEM_COALESCE_MAX_BATCH:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+            try:
+                self.write_batch()
+            except BaseException:
+                with self.condition:
+                    # Dying: someone else leads whatever is still queued.
+                    self.leading = False
+                    self.condition.notify_all()
+                raise
+            with self.condition:
+                self.leading = False
+                if not self.pending:
+                    return
+                self.condition.notify_all()
+                if self.waiting:
+                    return
+                deadline = time.monotonic() + settings.ORDER_ITEM_COALESCE_WINDOW_MS / 1000
+                while not self.leading and self.pending:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                if self.leading or not self.pending:
+                    return
+                self.leading = True
+
+    def wait(self, future, timeout):
+        """
+        Wait up to `timeout` seconds for `future`; return whether it is done.
+        While the item is unwritten and the buffer has no leader, lead it.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            with self.condition:
+                while not future.done() and (self.leading or not self.pending):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self.waiting += 1
+                    try:
+                        self.condition.wait(remaining)
+                    finally:
+                        self.waiting -= 1
+                if future.done():
+                    return True
+                self.leading = True
+                self.condition.notify_all()
+            self.lead()
+
+    def write_batch(self):
+        """Write up to one batch of queued items in one transaction; returns False if none were queued."""
+        with self.condition:
+            batch = self.pending[:settings.ORDER_ITEM_COALESCE_MAX_BATCH]
+            del self.pending[:len(batch)]
+            # Room in the buffer for blocked submitters.
+            self.condition.notify_all()
+        if not batch:
+            return False
+        try:
+            write_items(batch)
+        except BaseException:
+            # write_items resolves every future unless it was interrupted;
+            # its transaction rolled back, so nothing of the batch was written.
+            raise_on_all(batch)
+            raise
+        return True
+
+    def flush(self):
+        """Write everything queued so far, one batch per transaction, on the calling thread."""
+        while self.write_batch():
+            pass
+
+    def withdraw(self, future):
+        """Take a still-queued item back out of the buffer; returns its entry, or None once a batch has it."""
+        with self.condition:
+            for index, entry in enumerate(self.pending):
+                if entry[-1] is future:
+                    del self.pending[index]
+                    self.condition.notify_all()
+                    return entry
+        return None
+
+
+def write_items(batch):
+    """
+    Insert a batch of queued items and resolve each one's future.
+    A batch can mix tenants, so lookups are unscoped and checked against each item's tenant.
+    """
+    items = []
+    try:
+        with transaction.atomic():
+            # Locked so a concurrent cancel waits for these items, and then gives their stock back.
+            orders = Order.all_tenants.alive().select_for_update().in_bulk(
+                {order_id for _, order_id, _, _, _ in batch})
+            products = Product.all_tenants.in_bulk({product_id for _, _, product_id, _, _ in batch})
+            for tenant_id, order_id, product_id, quantity, future in batch:
+                order = orders.get(order_id)
+                product = products.get(product_id)
+                if order is not None and order.tenant_id != tenant_id:
+                    order = None
+                if product is not None and product.tenant_id != tenant_id:
+                    product = None
+                if order is None:
+                    future.set_exception(Order.DoesNotExist("Order not found"))
+                elif not order.accepts_items():
+                    future.set_exception(ValueError(f"Order is {order.status}."))
+                elif product is None:
+                    future.set_exception(Product.DoesNotExist("Product not found"))
+                else:
+                    try:
+                        inventory.reserve(product, quantity)
+                    except inventory.OutOfStock as e:
+                        future.set_exception(e)
+                        continue
+                    items.append((OrderItem(
+                        tenant_id=tenant_id,
+                        order=order,
+                        product=product,
+                        quantity=quantity,
+                        price_at_order=product.price,
+                        order_created_time=order.created_time,
+                    ), future))
+            OrderItem.objects.bulk_create([item for item, _ in items])
+            changes.record(ChangeEvent.CREATE, [item for item, _ in items])
+    except DatabaseError:
+        if len(batch) == 1 and not items:
+            raise_on_all(batch)
+            return
+        # One bad row fails the whole transaction; retry one at a time so only its request fails.
+        for item, future in items:
+            write_one(item, future)
+        # Entries after the failing one were never reached.
+        for entry in batch:
+            if not entry[-1].done():
+                write_items([entry])
+        return
+    except Exception:
+        raise_on_all(batch)
+        return
+    for item, future in items:
+        future.set_result(item)
+
+
+def write_one(item, future):
+    item.pk = None
+    try:
+        with transaction.atomic():
+            inventory.reserve(item.product, item.quantity)
+            item.save()
+            changes.record(ChangeEvent.CREATE, [item])
+    except Exception as e:
+        future.set_exception(e)
+    else:
+        future.set_result(item)
+
+
+def raise_on_all(batch):
+    logger.exception("Writing %d coalesced order items failed", len(batch))
+    error = DatabaseError("Order item could not be written.")
+    for *_, future in batch:
+        if not future.done():
+            future.set_exception(error)
+
+
+_buffer = ItemBuffer()
+
+
+def add_item(order_id, product_id, quantity):
+    """
+    Queue one order item and return a Future for the saved OrderItem.
+    The caller that becomes the leader writes the batch before this returns.
+    Raises BufferFull when the buffer stays full for ORDER_ITEM_COALESCE_QUEUE_TIMEOUT.
+    """
+    future, lead = _buffer.submit(order_id, product_id, quantity)
+    if lead:
+        _buffer.lead()
+    return future
+
+
+def result(future, buffer=None):
+    """
+    Wait for the OrderItem behind `future`, at most ORDER_ITEM_COALESCE_RESULT_TIMEOUT,
+    taking over as leader if the buffer is left without one meanwhile.
+    An item still queued by then is withdrawn and inserted by the caller. One
+    that a batch is already writing gets the same time again, then TimeoutError.
+    """
+    buffer = buffer or _buffer
+    timeout = settings.ORDER_ITEM_COALESCE_RESULT_TIMEOUT
+    if buffer.wait(future, timeout):
+        return future.result()
+    entry = buffer.withdraw(future)
+    if entry is None:
+        return future.result(timeout=timeout)
+    write_items([entry])
+    return future.result()
+
+
+def flush():
+    """Write everything still queued, on the calling thread."""
+    _buffer.flush()
+
+
+def log_failure(future):
+    """Done callback for items nobody waits on (ORDER_ITEM_COALESCE_DURABLE off)."""
+    error = future.exception()
+    if error is not None:
+        logger.error("Coalesced order item was not written: %s", error)
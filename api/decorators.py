@@ -1,13 +1,34 @@
 from functools import wraps
 from rest_framework.response import Response
 from rest_framework import status
-from django.conf import settings
+from rest_framework.permissions import SAFE_METHODS
+from .routers import mark_write, read_from_replica, recently_wrote
+from .tenancy import tenant_context, tenant_for_token
+
+def _request_token(request):
+    return request.data.get('access_token') or request.query_params.get('access_token')
 
 def require_token(view_func):
+    """Reject unknown tokens; run the view scoped to the token's tenant."""
     @wraps(view_func)
     def wrapped_view(request, *args, **kwargs):
-        token = request.data.get('access_token') or request.query_params.get('access_token')
-        if token != settings.ACCEPTED_TOKEN:
+        token = _request_token(request)
+        tenant_id = tenant_for_token(token)
+        if tenant_id is None:
             return Response({"error": "Invalid access token."}, status=status.HTTP_403_FORBIDDEN)
-        return view_func(request, *args, **kwargs)
+        with tenant_context(tenant_id):
+            response = view_func(request, *args, **kwargs)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            mark_write(response)
+        return response
+    return wrapped_view
+
+def replica_read(view_func):
+    """Serve the view's reads from the replica unless the token wrote recently."""
+    @wraps(view_func)
+    def wrapped_view(request, *args, **kwargs):
+        if recently_wrote(request):
+            return view_func(request, *args, **kwargs)
+        with read_from_replica():
+            return view_func(request, *args, **kwargs)
     return wrapped_view
\ No newline at end of file
@@ -0,0 +1,138 @@
+"""
+Product stock and contention-safe reservation.
+
+A reservation is one conditional UPDATE,
+
+    UPDATE api_product SET stock = stock - n WHERE id = %s AND stock >= n
+
+run in the same transaction as the item insert. There is no separate check
+that another request could race past. The row lock is held only until that
+transaction commits, and a failed reservation changes nothing.
+
+For flash-sale products every buyer queues on that one row. With
+`stock_shards` set, the stock is split over that many StockShard rows. A
+reservation starts at a random shard and moves on when one runs dry, so
+concurrent buyers mostly lock different rows. An order larger than any
+single shard locks all shards (in shard order, so two such orders cannot
+deadlock) and takes from several.
+
+Callers pass a product they have already looked up for the right tenant,
+so the updates here go through the unscoped `all_tenants` manager.
+
+Cancelling an order, or deleting one that is not cancelled, gives its
+items' stock back (release_order).
+"""
+import random
+from django.db import transaction
+from django.db.models import F, Sum
+from .models import OrderItem
+from .models import Product
+from .models import StockShard
+
+
+class OutOfStock(Exception):
+    """Not enough stock left for the requested quantity."""
+
+
+def available(product, lock=False):
+    """
+    Units left now (read from the database), or None when the product's stock is not tracked.
+    With `lock`, the product and its shards stay locked until the transaction
+    ends, so no reservation can change the figure before it is written back.
+    """
+    products = Product.all_tenants.filter(id=product.id)
+    if lock:
+        products = products.select_for_update()
+    stock, shards = products.values_list('stock', 'stock_shards').get()
+    if shards:
+        if lock:
+            return sum(StockShard.objects.select_for_update().filter(product=product).values_list('stock', flat=True))
+        return StockShard.objects.filter(product=product).aggregate(total=Sum('stock'))['total'] or 0
+    return stock
+
+
+def with_available(queryset):
+    """Annotate `shard_stock` so listing sharded products needs no query per row."""
+    return queryset.annotate(shard_stock=Sum('shards__stock'))
+
+
+def annotated_available(product):
+    if product.stock_shards:
+        return product.shard_stock or 0
+    return product.stock
+
+
+def set_stock(product, stock, shards=0):
+    """Set the stock (None to stop tracking it), split over `shards` rows when > 0."""
+    with transaction.atomic():
+        StockShard.objects.filter(product=product).delete()
+        if shards and stock is not None:
+            base, extra = divmod(stock, shards)
+            StockShard.objects.bulk_create([
+                StockShard(product=product, shard=index, stock=base + (1 if index < extra else 0))
+                for index in range(shards)
+            ])
+            product.stock = None
+            product.stock_shards = shards
+        else:
+            product.stock = stock
+            product.stock_shards = 0
+        Product.all_tenants.filter(id=product.id).update(stock=product.stock, stock_shards=product.stock_shards)
+
+
+def reserve(product, quantity):
+    """
+    Take `quantity` units of `product`; call inside the transaction that writes the item.
+    Raises OutOfStock, leaving the stock untouched, when there is not enough.
+    """
+    if quantity <= 0:
+        return
+    if product.stock_shards:
+        _reserve_sharded(product, quantity)
+    elif product.stock is not None:
+        if not Product.all_tenants.filter(id=product.id, stock__gte=quantity).update(stock=F('stock') - quantity):
+            raise OutOfStock(f"Only {available(product)} left of {product.name}.")
+
+
+def _reserve_sharded(product, quantity):
+    count = product.stock_shards
+    start = random.randrange(count)
+    for offset in range(count):
+        shard = (start + offset) % count
+        if StockShard.objects.filter(product=product, shard=shard, stock__gte=quantity).update(
+                stock=F('stock') - quantity):
+            return
+    # No single shard can cover it: lock them all and take from several.
+    shards = list(StockShard.objects.select_for_update().filter(product=product).order_by('shard'))
+    if sum(shard.stock for shard in shards) < quantity:
+        raise OutOfStock(f"Only {sum(shard.stock for shard in shards)} left of {product.name}.")
+    remaining = quantity
+    for shard in shards:
+        take = min(shard.stock, remaining)
+        if take:
+            StockShard.objects.filter(id=shard.id).update(stock=F('stock') - take)
+            remaining -= take
+        if not remaining:
+            return
+
+
+def release(product, quantity):
+    """Return `quantity` units, e.g. when an item is deleted or reduced."""
+    if quantity <= 0:
+        return
+    if product.stock_shards:
+        StockShard.objects.filter(product=product, shard=random.randrange(product.stock_shards)).update(
+            stock=F('stock') + quantity)
+    elif product.stock is not None:
+        Product.all_tenants.filter(id=product.id, stock__isnull=False).update(stock=F('stock') + quantity)
+
+
+def release_order(order_id):
+    """Give back the stock held by an order's items; call in the transaction that cancels or deletes it."""
+    totals = list(
+        OrderItem.all_tenants.filter(order_id=order_id).values('product_id')
+        .annotate(quantity=Sum('quantity')).order_by('product_id').values_list('product_id', 'quantity')
+    )
+    products = Product.all_tenants.in_bulk([product_id for product_id, _ in totals])
+    for product_id, quantity in totals:
+        release(products[product_id], quantity)
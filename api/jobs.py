@@ -0,0 +1,217 @@
+import logging
+import os
+import socket
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, close_old_connections, transaction
+from django.utils import timezone
+from .models import ChangeEvent
+from .models import Job
+from .models import Order
+from . import changes
+from .purge import purge_deleted_orders
+from .tenancy import tenant_context
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+
+
+def job_handler(kind):
+    """Register `func(job, **payload)` as the handler for jobs of `kind`."""
+    def decorator(func):
+        HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(kind, payload=None, max_attempts=3, run_at=None):
+    """Queue a job for the worker pool and return it."""
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    return Job.objects.create(
+        kind=kind,
+        payload=payload or {},
+        max_attempts=max_attempts,
+        run_at=run_at or timezone.now(),
+    )
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim_job(worker_id):
+    """
+    Lock and mark the next due job as running.
+    - SELECT ... FOR UPDATE SKIP LOCKED lets many workers poll without blocking each other.
+    - Jobs stuck in `running` past JOB_LOCK_TIMEOUT (a crashed worker; running
+      jobs heartbeat through Job.heartbeat) are picked up again, or marked
+      failed when that was their last attempt.
+    """
+    while True:
+        now = timezone.now()
+        stale = now - timedelta(seconds=settings.JOB_LOCK_TIMEOUT)
+        candidates = [
+            Job.objects.filter(status=Job.QUEUED, run_at__lte=now),
+            Job.objects.filter(status=Job.RUNNING, locked_at__lt=stale),
+        ]
+        with transaction.atomic():
+            for queryset in candidates:
+                job = (
+                    queryset.select_for_update(skip_locked=True)
+                    .order_by('run_at', 'id')
+                    .first()
+                )
+                if job is not None:
+                    break
+            else:
+                return None
+
+            job.locked_at = now
+            if job.status == Job.RUNNING and job.attempts >= job.max_attempts:
+                job.status = Job.FAILED
+                job.error = f"Worker {job.locked_by} stopped responding on the last attempt."
+                job.locked_by = ''
+                job.locked_at = None
+                job.save(update_fields=['status', 'error', 'locked_by', 'locked_at', 'updated_time'])
+                continue
+
+            job.status = Job.RUNNING
+            job.locked_by = worker_id
+            job.attempts += 1
+            job.save(update_fields=['status', 'locked_by', 'locked_at', 'attempts', 'updated_time'])
+        return job
+
+
+def run_job(job):
+    """Run a claimed job and record its outcome, rescheduling it with backoff on failure."""
+    handler = HANDLERS.get(job.kind)
+    try:
+        if handler is None:
+            raise LookupError(f"No handler registered for job kind: {job.kind}")
+        # The job runs as the tenant that queued it.
+        with tenant_context(job.tenant_id):
+            result = handler(job, **job.payload)
+    except Exception as e:
+        job.error = f"{type(e).__name__}: {e}"
+        if job.attempts < job.max_attempts:
+            delay = settings.JOB_RETRY_BACKOFF * 2 ** (job.attempts - 1)
+            job.status = Job.QUEUED
+            job.run_at = timezone.now() + timedelta(seconds=delay)
+        else:
+            job.status = Job.FAILED
+    else:
+        job.status = Job.SUCCEEDED
+        job.result = result
+        job.error = ''
+    job.locked_by = ''
+    job.locked_at = None
+    try:
+        job.save(update_fields=['status', 'result', 'error', 'run_at', 'locked_by', 'locked_at', 'updated_time'])
+    except DatabaseError:
+        # Keep the worker alive; the job stays `running` and is reclaimed after JOB_LOCK_TIMEOUT.
+        logger.exception("Could not record the outcome of job %s", job)
+        close_old_connections()
+    return job
+
+
+def work(worker_id=None, burst=False, poll_interval=1.0):
+    """
+    Process jobs until interrupted.
+    - With `burst`, return as soon as the queue is empty.
+    Returns the number of jobs processed.
+    """
+    worker_id = worker_id or default_worker_id()
+    processed = 0
+    while True:
+        try:
+            job = claim_job(worker_id)
+        except DatabaseError:
+            # Lost connection or lock contention; reconnect and poll again.
+            close_old_connections()
+            time.sleep(poll_interval)
+            continue
+        if job is None:
+            if burst:
+                return processed
+            time.sleep(poll_interval)
+            continue
+        run_job(job)
+        processed += 1
+
+
+def import_order_rows(rows, job=None, chunk_size=500):
+    """
+    Create orders from a list of {"order_number", "total_price"} dicts.
+    - Rows are inserted with bulk_create, one chunk at a time.
+    - Invalid or duplicate rows are skipped and reported by index; total_price must
+      fit the column (finite, 10 digits, 2 decimal places).
+    """
+    created = 0
+    errors = []
+    total = len(rows)
+    price_field = Order._meta.get_field('total_price')
+    if job is not None:
+        job.set_progress(0, total)
+
+    for start in range(0, total, chunk_size):
+        chunk = list(enumerate(rows[start:start + chunk_size], start=start))
+        numbers = [row.get('order_number') for _, row in chunk if isinstance(row, dict)]
+        existing = set(Order.objects.filter(order_number__in=numbers).values_list('order_number', flat=True))
+
+        orders = []
+        for index, row in chunk:
+            if not isinstance(row, dict) or not row.get('order_number') or row.get('total_price') is None:
+                errors.append({"index": index, "error": "Missing required fields."})
+                continue
+            if row['order_number'] in existing:
+                errors.append({"index": index, "error": "Order number already exists."})
+                continue
+            try:
+                total_price = price_field.clean(str(row['total_price']), None)
+            except ValidationError:
+                errors.append({"index": index, "error": "Invalid total_price."})
+                continue
+            existing.add(row['order_number'])
+            orders.append(Order(order_number=row['order_number'], total_price=total_price))
+
+        with transaction.atomic():
+            Order.objects.bulk_create(orders)
+            changes.record(ChangeEvent.CREATE, orders)
+        created += len(orders)
+        if job is not None:
+            job.set_progress(min(start + chunk_size, total))
+
+    return {"created": created, "errors": errors}
+
+
+@job_handler('import_orders')
+def import_orders_job(job, orders):
+    return import_order_rows(orders, job=job)
+
+
+@job_handler('purge_orders')
+def purge_orders_job(job, batch_size=500, sleep=0.1, older_than_days=0):
+    orders, items = purge_deleted_orders(
+        batch_size=batch_size,
+        sleep=sleep,
+        older_than=timedelta(days=older_than_days),
+        on_batch=job.heartbeat,
+    )
+    return {"orders": orders, "items": items}
+
+
+@job_handler('compact_changes')
+def compact_changes_job(job, older_than_days=7, batch_size=1000, sleep=0.1, drop_tombstones=False):
+    removed = changes.compact(
+        older_than=timedelta(days=older_than_days),
+        batch_size=batch_size,
+        sleep=sleep,
+        drop_tombstones=drop_tombstones,
+        on_batch=job.heartbeat,
+    )
+    return {"removed": removed}
+
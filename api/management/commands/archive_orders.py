@@ -0,0 +1,50 @@
+from datetime import datetime, timezone as dt_timezone
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from api import archive
+from api.models import Order
+from api.partitioning import add_months, month_start
+
+
+def parse_month(value):
+    try:
+        return datetime.strptime(value, '%Y-%m').replace(tzinfo=dt_timezone.utc)
+    except ValueError:
+        raise CommandError(f"Invalid month {value!r}; expected YYYY-MM.")
+
+
+class Command(BaseCommand):
+    help = "Move closed orders and their items into monthly columnar archive files."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', metavar='YYYY-MM',
+                            help="Archive only this month.")
+        parser.add_argument('--before', metavar='YYYY-MM',
+                            help="Archive every month before this one (default: 12 months ago).")
+        parser.add_argument('--chunk-size', type=int, default=10000,
+                            help="Orders per row group and per DELETE statement.")
+        parser.add_argument('--sleep', type=float, default=0.1,
+                            help="Seconds to pause between chunks.")
+
+    def handle(self, *args, **options):
+        if options['month']:
+            months = [parse_month(options['month'])]
+        else:
+            before = parse_month(options['before']) if options['before'] else add_months(month_start(timezone.now()), -12)
+            oldest = (
+                Order.objects.alive().filter(status__in=Order.CLOSED_STATUSES, created_time__lt=before)
+                .order_by('created_time').values_list('created_time', flat=True).first()
+            )
+            months = []
+            month = month_start(oldest) if oldest else before
+            while month < before:
+                months.append(month)
+                month = add_months(month, 1)
+
+        for month in months:
+            orders, items = archive.archive_month(
+                month,
+                chunk_size=options['chunk_size'],
+                sleep=options['sleep'],
+            )
+            self.stdout.write(f"{month:%Y-%m}: archived {orders} orders and {items} order items.")
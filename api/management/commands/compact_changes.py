@@ -0,0 +1,26 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from api.changes import compact
+
+
+class Command(BaseCommand):
+    help = "Compact the change log, keeping only the latest event per object."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=float, default=7,
+                            help="Only compact events older than this many days.")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Maximum events removed per DELETE statement.")
+        parser.add_argument('--sleep', type=float, default=0.1,
+                            help="Seconds to pause between batches.")
+        parser.add_argument('--drop-tombstones', action='store_true',
+                            help="Also remove old delete events.")
+
+    def handle(self, *args, **options):
+        removed = compact(
+            older_than=timedelta(days=options['older_than_days']),
+            batch_size=options['batch_size'],
+            sleep=options['sleep'],
+            drop_tombstones=options['drop_tombstones'],
+        )
+        self.stdout.write(f"Removed {removed} change events.")
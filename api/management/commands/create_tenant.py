@@ -0,0 +1,16 @@
+import secrets
+from django.core.management.base import BaseCommand
+from api.models import Tenant
+from api.tenancy import hash_token
+
+
+class Command(BaseCommand):
+    help = "Create a tenant and print its access token (only its hash is stored)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', help="Display name of the tenant.")
+
+    def handle(self, *args, **options):
+        token = secrets.token_urlsafe(32)
+        tenant = Tenant.objects.create(name=options['name'], token_hash=hash_token(token))
+        self.stdout.write(f"Created tenant {tenant.id}. Access token: {token}")
@@ -0,0 +1,39 @@
+from datetime import datetime, timezone as dt_timezone
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from api import partitioning
+
+
+class Command(BaseCommand):
+    help = "Manage monthly partitions of orders and order items (PostgreSQL only)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--convert', action='store_true',
+                            help="Convert the tables to partitioned tables (one-time, locks them).")
+        parser.add_argument('--months-ahead', type=int, default=3,
+                            help="Create partitions up to this many months ahead.")
+        parser.add_argument('--detach-before', metavar='YYYY-MM',
+                            help="Detach partitions for months before this one.")
+        parser.add_argument('--archive-schema',
+                            help="Move detached partitions into this schema.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("Partitioning requires PostgreSQL.")
+
+        if options['convert']:
+            converted = partitioning.convert_to_partitioned(options['months_ahead'])
+            self.stdout.write(f"Converted {', '.join(converted) or 'nothing (already partitioned)'}.")
+        elif not partitioning.is_partitioned():
+            raise CommandError("Orders are not partitioned; run with --convert first.")
+
+        created = partitioning.ensure_future_partitions(options['months_ahead'])
+        self.stdout.write(f"Ensured {len(created)} partitions.")
+
+        if options['detach_before']:
+            try:
+                before = datetime.strptime(options['detach_before'], '%Y-%m').replace(tzinfo=dt_timezone.utc)
+            except ValueError:
+                raise CommandError("--detach-before must look like YYYY-MM.")
+            detached = partitioning.detach_partitions(before, options['archive_schema'])
+            self.stdout.write(f"Detached {len(detached)} partitions: {', '.join(detached)}")
@@ -0,0 +1,23 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from api.purge import purge_deleted_orders
+
+
+class Command(BaseCommand):
+    help = "Hard-delete soft-deleted orders and their items in throttled batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Maximum rows removed per DELETE statement.")
+        parser.add_argument('--sleep', type=float, default=0.1,
+                            help="Seconds to pause between batches.")
+        parser.add_argument('--older-than-days', type=float, default=0,
+                            help="Only purge orders soft-deleted at least this many days ago.")
+
+    def handle(self, *args, **options):
+        orders, items = purge_deleted_orders(
+            batch_size=options['batch_size'],
+            sleep=options['sleep'],
+            older_than=timedelta(days=options['older_than_days']),
+        )
+        self.stdout.write(f"Purged {orders} orders and {items} order items.")
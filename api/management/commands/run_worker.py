@@ -0,0 +1,48 @@
+import multiprocessing
+from django.core.management.base import BaseCommand
+from django.db import connections
+from api import jobs
+
+
+def _work(poll_interval, burst):
+    # Each process opens its own database connection.
+    connections.close_all()
+    jobs.work(burst=burst, poll_interval=poll_interval)
+
+
+class Command(BaseCommand):
+    help = "Run background job workers backed by the database queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help="Number of worker processes.")
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Seconds to wait when the queue is empty.")
+        parser.add_argument('--burst', action='store_true',
+                            help="Exit once the queue is empty.")
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        poll_interval = options['poll_interval']
+        burst = options['burst']
+
+        if concurrency == 1:
+            processed = jobs.work(burst=burst, poll_interval=poll_interval)
+            self.stdout.write(f"Processed {processed} jobs.")
+            return
+
+        # Connections must not be shared across fork().
+        connections.close_all()
+        workers = [
+            multiprocessing.Process(target=_work, args=(poll_interval, burst), daemon=True)
+            for _ in range(concurrency)
+        ]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(f"Started {concurrency} workers.")
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.terminate()
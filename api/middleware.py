@@ -0,0 +1,136 @@
+"""
+Response compression negotiated from Accept-Encoding, and request profiling.
+
+Brotli is used when the optional `brotli` package is installed and the client
+accepts it, gzip otherwise. Bodies under RESPONSE_COMPRESSION_MIN_BYTES are
+sent as they are: for small payloads the CPU time outweighs the bytes saved.
+
+ProfilingMiddleware profiles requests on demand or 1 in PROFILE_SAMPLE_RATE
+(see api/profiling.py).
+"""
+import gzip
+import itertools
+import sys
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import patch_vary_headers
+from . import profiling
+
+try:
+    # Optional dependency (see requirements.txt); without it responses fall back to gzip.
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP_LEVEL = 6
+# Quality 4-5 is close to gzip -6 in speed while still noticeably smaller.
+BROTLI_QUALITY = 5
+
+
+def accepted_encodings(header):
+    """Content codings listed in an Accept-Encoding header with a non-zero q-value."""
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.partition(';')
+        coding = coding.strip().lower()
+        params = params.strip().lower()
+        try:
+            q = float(params[2:]) if params.startswith('q=') else 1.0
+        except ValueError:
+            q = 0.0
+        if coding and q > 0:
+            accepted.add(coding)
+    return accepted
+
+
+def choose_encoding(header):
+    accepted = accepted_encodings(header)
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (
+            response.streaming
+            or response.has_header('Content-Encoding')
+            or len(response.content) < settings.RESPONSE_COMPRESSION_MIN_BYTES
+        ):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+        compressed = compress(response.content, encoding)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        # The bytes changed, so a strong validator no longer matches them.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.counter = itertools.count(1)
+
+    def __call__(self, request):
+        mode = profiling.requested_mode(request)
+        if mode and settings.PROFILE_TOKEN:
+            if not profiling.token_ok(request):
+                return JsonResponse({"error": "Invalid profiling token."}, status=403)
+            if mode not in profiling.MODES:
+                return JsonResponse({"error": f"Unknown profile mode: {mode}."}, status=400)
+            return self.profile_request(request, mode)
+        rate = settings.PROFILE_SAMPLE_RATE
+        if rate and next(self.counter) % rate == 0:
+            return self.sample_request(request)
+        return self.get_response(request)
+
+    def profile_request(self, request, mode):
+        try:
+            with profiling.profile(mode, sys._getframe().f_code) as result:
+                response = self.get_response(request)
+        except profiling.ProfilerBusy as e:
+            return JsonResponse({"error": str(e)}, status=409)
+        name = f"{request.method} {request.path}"
+        data, content_type, extension = profiling.encode(result, name)
+        output = request.headers.get('X-Profile-Output') or request.GET.get('profile_output')
+        if output == 'store':
+            response['X-Profile-File'] = profiling.store(data, name, extension)
+        else:
+            status = response.status_code
+            response = HttpResponse(data, content_type=content_type)
+            response['Content-Disposition'] = f'attachment; filename="profile.{extension}"'
+            response['X-Profiled-Status'] = str(status)
+        response['Server-Timing'] = result.server_timing()
+        return response
+
+    def sample_request(self, request):
+        with profiling.profile('sample', sys._getframe().f_code) as result:
+            response = self.get_response(request)
+        match = request.resolver_match
+        # Reading or clearing the flame graphs should not show up in them.
+        if not (match and match.url_name == 'sampled_profiles'):
+            profiling.flame_graphs.add(match.view_name if match else request.path, result)
+        return response
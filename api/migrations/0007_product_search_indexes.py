@@ -0,0 +1,36 @@
+from django.db import migrations
+
+
+def create_indexes(apps, schema_editor):
+    # GIN and pattern-ops indexes are PostgreSQL only; SQLite falls back to scans.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS product_name_search_idx ON api_product "
+        "USING gin (to_tsvector('simple'::regconfig, COALESCE(name, '')))"
+    )
+    schema_editor.execute(
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS product_name_prefix_idx ON api_product "
+        "(UPPER(name::text) text_pattern_ops)"
+    )
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX CONCURRENTLY IF EXISTS product_name_search_idx")
+    schema_editor.execute("DROP INDEX CONCURRENTLY IF EXISTS product_name_prefix_idx")
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ('api', '0006_changeevent'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.8 on 2026-10-19 18:49
+
+from django.db import migrations, models
+
+
+def backfill_order_created_time(apps, schema_editor):
+    OrderItem = apps.get_model('api', 'OrderItem')
+    Order = apps.get_model('api', 'Order')
+    created_time = Order.objects.filter(id=models.OuterRef('order_id')).values('created_time')[:1]
+    while True:
+        ids = list(
+            OrderItem.objects.filter(order_created_time__isnull=True)
+            .values_list('id', flat=True)[:5000]
+        )
+        if not ids:
+            break
+        OrderItem.objects.filter(id__in=ids).update(order_created_time=models.Subquery(created_time))
+
+
+class Migration(migrations.Migration):
+    # Each backfill batch commits on its own rather than in one long transaction.
+    atomic = False
+
+    dependencies = [
+        ('api', '0007_product_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='order_created_time',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_order_created_time, migrations.RunPython.noop),
+    ]
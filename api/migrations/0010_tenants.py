@@ -0,0 +1,130 @@
+import api.tenancy
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_default_tenant(apps, schema_editor):
+    # Existing rows, and settings.ACCEPTED_TOKEN, belong to tenant 1.
+    Tenant = apps.get_model('api', 'Tenant')
+    Tenant.objects.create(id=api.tenancy.DEFAULT_TENANT_ID, name='default')
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            "SELECT setval(pg_get_serial_sequence('api_tenant', 'id'), (SELECT MAX(id) FROM api_tenant))"
+        )
+
+
+def order_number_unique_per_tenant(apps, schema_editor):
+    from api import partitioning
+
+    if schema_editor.connection.vendor == 'postgresql' and partitioning.is_partitioned():
+        # Partitioned tables keep order_number unique through api_order_number (see api/partitioning.py).
+        schema_editor.execute("ALTER TABLE api_order_number ADD COLUMN tenant_id bigint NOT NULL DEFAULT 1")
+        schema_editor.execute("ALTER TABLE api_order_number DROP CONSTRAINT api_order_number_pkey")
+        schema_editor.execute("ALTER TABLE api_order_number ADD PRIMARY KEY (tenant_id, order_number)")
+        schema_editor.execute(partitioning.ORDER_NUMBER_SYNC_FUNCTION)
+        # The old trigger only fired on UPDATE OF order_number; a tenant change must resync too.
+        schema_editor.execute("DROP TRIGGER IF EXISTS api_order_number_sync ON api_order")
+        schema_editor.execute(partitioning.ORDER_NUMBER_SYNC_TRIGGER)
+        return
+    Order = apps.get_model('api', 'Order')
+    old_field = Order._meta.get_field('order_number')
+    new_field = models.CharField(max_length=100)
+    new_field.set_attributes_from_name('order_number')
+    schema_editor.alter_field(Order, old_field, new_field)
+    # Not add_constraint(): on SQLite that rebuilds the table from this
+    # historical model, which still has order_number unique.
+    constraint = models.UniqueConstraint(fields=['tenant', 'order_number'], name='order_tenant_number_uniq')
+    schema_editor.execute(constraint.create_sql(Order, schema_editor))
+
+
+def tenant_prefix_index(apps, schema_editor):
+    # Autocomplete filters on tenant first; replaces the index from 0007.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS product_tenant_prefix_idx ON api_product "
+        "(tenant_id, UPPER(name::text) text_pattern_ops)"
+    )
+    schema_editor.execute("DROP INDEX IF EXISTS product_name_prefix_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_product_stock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tenant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('token_hash', models.CharField(blank=True, max_length=64, null=True, unique=True)),
+                ('created_time', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RunPython(create_default_tenant, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='changeevent',
+            name='tenant',
+            field=models.ForeignKey(db_constraint=False, db_index=False, default=api.tenancy.default_tenant_id, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='api.tenant'),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='tenant',
+            field=models.ForeignKey(db_constraint=False, db_index=False, default=api.tenancy.default_tenant_id, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='api.tenant'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='tenant',
+            field=models.ForeignKey(db_constraint=False, db_index=False, default=api.tenancy.default_tenant_id, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='api.tenant'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='tenant',
+            field=models.ForeignKey(db_constraint=False, db_index=False, default=api.tenancy.default_tenant_id, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='api.tenant'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='tenant',
+            field=models.ForeignKey(db_constraint=False, db_index=False, default=api.tenancy.default_tenant_id, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='api.tenant'),
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(order_number_unique_per_tenant, migrations.RunPython.noop),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='order',
+                    name='order_number',
+                    field=models.CharField(max_length=100),
+                ),
+                migrations.AddConstraint(
+                    model_name='order',
+                    constraint=models.UniqueConstraint(fields=('tenant', 'order_number'), name='order_tenant_number_uniq'),
+                ),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_alive_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['tenant', 'created_time'], name='order_alive_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['tenant', 'order_created_time'], name='orderitem_tenant_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['tenant', 'name'], name='product_tenant_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='changeevent',
+            index=models.Index(fields=['tenant', 'seq'], name='change_tenant_seq_idx'),
+        ),
+        migrations.RunPython(tenant_prefix_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations
+
+
+def collate_prefix_index(apps, schema_editor):
+    # A text_pattern_ops index serves LIKE 'x%' but not ORDER BY; a C-collated
+    # default-opclass index serves both. Replaces the index from 0010.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS product_tenant_name_c_idx ON api_product "
+        "(tenant_id, UPPER(name::text) COLLATE \"C\")"
+    )
+    schema_editor.execute("DROP INDEX IF EXISTS product_tenant_prefix_idx")
+
+
+def pattern_prefix_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS product_tenant_prefix_idx ON api_product "
+        "(tenant_id, UPPER(name::text) text_pattern_ops)"
+    )
+    schema_editor.execute("DROP INDEX IF EXISTS product_tenant_name_c_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_tenants'),
+    ]
+
+    operations = [
+        migrations.RunPython(collate_prefix_index, pattern_prefix_index),
+    ]
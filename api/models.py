@@ -1,32 +1,225 @@
 from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from .tenancy import TenantManager, default_tenant_id
+
+
+class OrderQuerySet(models.QuerySet):
+    def alive(self):
+        """Orders that have not been soft-deleted."""
+        return self.filter(deleted_at__isnull=True)
+
+    def deleted(self):
+        """Soft-deleted orders waiting for the background purge."""
+        return self.filter(deleted_at__isnull=False)
 
 
 # Create your models here.
+class Tenant(models.Model):
+    """A client namespace; its token maps every request to its own rows."""
+    name = models.CharField(max_length=100)
+    # SHA-256 of the access token; the default tenant uses settings.ACCEPTED_TOKEN instead.
+    token_hash = models.CharField(max_length=64, unique=True, null=True, blank=True)
+    created_time = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+
+# Tenant-owned rows reference their tenant without a database foreign key, so
+# rows can be written before the tenant table is populated (fixtures, flushes).
+# Their composite indexes lead with tenant, so the column needs no index of its own.
 class Order(models.Model):
+    # Allowed status changes; statuses with no entry are final.
+    STATUS_TRANSITIONS = {
+        'pending': {'paid', 'cancelled'},
+        'paid': {'shipped', 'cancelled', 'refunded'},
+        'shipped': {'delivered'},
+        'delivered': {'refunded'},
+    }
+    # Final statuses; orders in them may be moved to the archive.
+    CLOSED_STATUSES = ('delivered', 'cancelled', 'refunded')
+    STATUS_CHOICES = [(s, s) for s in ('pending', 'paid', 'shipped', 'delivered', 'cancelled', 'refunded')]
+
     # Add your model here
-    order_number = models.CharField(max_length=100, unique=True)
+    tenant = models.ForeignKey(Tenant, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False,
+                               default=default_tenant_id, related_name='+')
+    # Unique per tenant (see Meta.constraints).
+    order_number = models.CharField(max_length=100)
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
     created_time = models.DateTimeField(auto_now_add=True)
 
     customer_name = models.CharField(max_length=100, null=True, blank=True)
-    status = models.CharField(max_length=20, default='pending')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     note = models.TextField(blank=True)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+    # Bumped on every update; clients send it back as If-Match.
+    version = models.PositiveIntegerField(default=1)
+
+    objects = TenantManager.from_queryset(OrderQuerySet)()
+    all_tenants = OrderQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['tenant', 'order_number'], name='order_tenant_number_uniq'),
+        ]
+        indexes = [
+            # List views only ever scan one tenant's live rows, the purge only deleted ones.
+            models.Index(fields=['tenant', 'created_time'], name='order_alive_created_idx',
+                         condition=models.Q(deleted_at__isnull=True)),
+            models.Index(fields=['deleted_at'], name='order_deleted_at_idx',
+                         condition=models.Q(deleted_at__isnull=False)),
+        ]
+
+    def can_transition_to(self, new_status):
+        return new_status in self.STATUS_TRANSITIONS.get(self.status, ())
+
+    def accepts_items(self):
+        return self.status not in self.CLOSED_STATUSES
 
     def __str__(self):
         return self.order_number
     
 class Product(models.Model):
+    tenant = models.ForeignKey(Tenant, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False,
+                               default=default_tenant_id, related_name='+')
     name = models.CharField(max_length=100)
     price = models.DecimalField(max_digits=10, decimal_places=2)
+    # Units on hand; None means stock is not tracked. Ignored while sharded.
+    stock = models.PositiveIntegerField(null=True, blank=True)
+    # > 0 keeps the stock in that many StockShard rows (see api/inventory.py).
+    stock_shards = models.PositiveSmallIntegerField(default=0)
+
+    objects = TenantManager()
+    all_tenants = models.Manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['tenant', 'name'], name='product_tenant_name_idx'),
+        ]
 
     def __str__(self):
         return self.name
+
+
+class StockShard(models.Model):
+    """One slice of a hot product's stock, so concurrent reservations lock different rows."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='shards')
+    shard = models.PositiveSmallIntegerField()
+    stock = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'shard'], name='stock_shard_unique'),
+        ]
     
 class OrderItem(models.Model):
+    tenant = models.ForeignKey(Tenant, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False,
+                               default=default_tenant_id, related_name='+')
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField()
     price_at_order = models.DecimalField(max_digits=10, decimal_places=2)
+    # Copy of order.created_time: the partition key when orders are partitioned,
+    # so an order and its items always land in the same month.
+    order_created_time = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = TenantManager()
+    all_tenants = models.Manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['tenant', 'order_created_time'], name='orderitem_tenant_created_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.order_created_time is None:
+            self.order_created_time = self.order.created_time
+        # An item always belongs to its order's tenant.
+        self.tenant_id = self.order.tenant_id
+        super().save(*args, **kwargs)
 
     def subtotal(self):
-        return self.quantity * self.price_at_order
\ No newline at end of file
+        return self.quantity * self.price_at_order
+
+class Job(models.Model):
+    """A unit of background work, claimed by `manage.py run_worker`."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+
+    tenant = models.ForeignKey(Tenant, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False,
+                               default=default_tenant_id, related_name='+')
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    progress_done = models.PositiveIntegerField(default=0)
+    progress_total = models.PositiveIntegerField(default=0)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_time = models.DateTimeField(auto_now_add=True)
+    updated_time = models.DateTimeField(auto_now=True)
+
+    objects = TenantManager()
+    all_tenants = models.Manager()
+
+    class Meta:
+        indexes = [
+            # Workers only ever poll for queued jobs that are due.
+            models.Index(fields=['run_at', 'id'], name='job_queued_idx',
+                         condition=models.Q(status='queued')),
+        ]
+
+    def set_progress(self, done, total=None):
+        """Persist progress without touching the rest of the row; also a heartbeat."""
+        self.progress_done = done
+        if total is not None:
+            self.progress_total = total
+        self.heartbeat(progress_done=self.progress_done, progress_total=self.progress_total)
+
+    def heartbeat(self, **fields):
+        """
+        Refresh locked_at so a long-running job is not reclaimed as stale
+        (JOB_LOCK_TIMEOUT) and run a second time by another worker.
+        """
+        now = timezone.now()
+        if self.locked_at is not None:
+            self.locked_at = fields['locked_at'] = now
+        Job.objects.filter(id=self.id).update(updated_time=now, **fields)
+
+    def __str__(self):
+        return f"{self.kind}#{self.id}"
+
+
+class ChangeEvent(models.Model):
+    """Append-only log of writes, read incrementally through the changes feed."""
+    CREATE = 'create'
+    UPDATE = 'update'
+    DELETE = 'delete'
+
+    seq = models.BigAutoField(primary_key=True)
+    tenant = models.ForeignKey(Tenant, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False,
+                               default=default_tenant_id, related_name='+')
+    model = models.CharField(max_length=30)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=10)
+    # Row state after the write; None for deletes.
+    data = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_time = models.DateTimeField(auto_now_add=True)
+
+    objects = TenantManager()
+    all_tenants = models.Manager()
+
+    class Meta:
+        indexes = [
+            # Compaction looks for later events on the same object.
+            models.Index(fields=['model', 'object_id', 'seq'], name='change_object_idx'),
+            # Each tenant reads its own feed by sequence.
+            models.Index(fields=['tenant', 'seq'], name='change_tenant_seq_idx'),
+        ]
@@ -0,0 +1,244 @@
+"""
+Monthly range partitioning of orders and their items (PostgreSQL only).
+
+`api_order` is partitioned on created_time and `api_orderitem` on
+order_created_time, a copy of its order's created_time. An order and its items
+therefore always share a month and can be detached or archived together.
+Queries that filter on created_time (or order_created_time) only scan the
+months they need.
+
+PostgreSQL requires every unique constraint on a partitioned table to contain
+the partition key. The primary keys become (id, <partition key>). Uniqueness
+of (tenant_id, order_number) across partitions is kept by triggers on the
+small api_order_number table.
+"""
+from datetime import datetime, timezone as dt_timezone
+from django.db import connection, transaction
+from django.utils import timezone
+
+ORDER_TABLE = 'api_order'
+ITEM_TABLE = 'api_orderitem'
+PARTITIONS = [
+    # (parent table, partition key)
+    (ORDER_TABLE, 'created_time'),
+    (ITEM_TABLE, 'order_created_time'),
+]
+
+ORDER_NUMBER_SYNC_FUNCTION = """
+    CREATE OR REPLACE FUNCTION api_order_number_sync() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            DELETE FROM api_order_number
+            WHERE tenant_id = OLD.tenant_id AND order_number = OLD.order_number;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO api_order_number (tenant_id, order_number) VALUES (NEW.tenant_id, NEW.order_number);
+        END IF;
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql
+"""
+
+
+ORDER_NUMBER_SYNC_TRIGGER = f"""
+    CREATE TRIGGER api_order_number_sync AFTER INSERT OR DELETE OR UPDATE OF tenant_id, order_number
+    ON {ORDER_TABLE} FOR EACH ROW EXECUTE FUNCTION api_order_number_sync()
+"""
+
+
+def month_start(value):
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def partition_name(table, month):
+    return f"{table}_p{month:%Y%m}"
+
+
+def is_partitioned(table=ORDER_TABLE):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table p "
+            "JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = %s)",
+            [table],
+        )
+        return cursor.fetchone()[0]
+
+
+def list_partitions(table):
+    """Monthly partitions of `table` as a sorted list of (month, name)."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = %s",
+            [table],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    prefix = f"{table}_p"
+    partitions = []
+    for name in names:
+        suffix = name[len(prefix):]
+        if name.startswith(prefix) and len(suffix) == 6 and suffix.isdigit():
+            month = datetime(int(suffix[:4]), int(suffix[4:]), 1, tzinfo=dt_timezone.utc)
+            partitions.append((month, name))
+    return sorted(partitions)
+
+
+def _create_partition(cursor, table, key, month):
+    """
+    Create the partition of `table` for `month`, unless it exists.
+    PostgreSQL refuses to add a partition while the DEFAULT partition holds
+    rows in its range, so such rows are moved out first and back in through
+    the parent afterwards. Orders and their items share a month and are moved
+    in the same transaction; the deferred item -> order foreign key only
+    checks them at commit.
+    """
+    name = partition_name(table, month)
+    bounds = [month, add_months(month, 1)]
+    cursor.execute("SELECT to_regclass(%s) IS NULL, to_regclass(%s) IS NOT NULL", [name, f"{table}_default"])
+    missing, has_default = cursor.fetchone()
+    if not missing:
+        return
+    moved = False
+    if has_default:
+        # No new rows may reach the default partition between the move and the CREATE.
+        cursor.execute(f"LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE")
+        cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {table}_default WHERE {key} >= %s AND {key} < %s)", bounds)
+        moved = cursor.fetchone()[0]
+    if moved:
+        cursor.execute(f"CREATE TEMPORARY TABLE {name}_moving (LIKE {table})")
+        cursor.execute(
+            f"WITH moved AS (DELETE FROM {table}_default WHERE {key} >= %s AND {key} < %s RETURNING *) "
+            f"INSERT INTO {name}_moving SELECT * FROM moved",
+            bounds,
+        )
+    cursor.execute(f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)", bounds)
+    if moved:
+        cursor.execute(f"INSERT INTO {table} SELECT * FROM {name}_moving")
+        cursor.execute(f"DROP TABLE {name}_moving")
+
+
+def create_partitions(first_month, last_month):
+    """Create any missing monthly partitions in [first_month, last_month] for both tables."""
+    created = []
+    month = month_start(first_month)
+    last_month = month_start(last_month)
+    with transaction.atomic(), connection.cursor() as cursor:
+        while month <= last_month:
+            for table, key in PARTITIONS:
+                _create_partition(cursor, table, key, month)
+                created.append(partition_name(table, month))
+            month = add_months(month, 1)
+    return created
+
+
+def ensure_future_partitions(months_ahead=3):
+    now = timezone.now()
+    return create_partitions(now, add_months(month_start(now), months_ahead))
+
+
+def detach_partitions(before, archive_schema=None):
+    """
+    Detach every monthly partition that ends on or before `before`.
+    - Item partitions are detached first, since they reference their orders, and
+      lose their copy of the order foreign key so the order partitions can follow.
+    - Everything runs in one transaction.
+    - With `archive_schema`, detached tables move there instead of staying beside the live ones.
+    Returns the detached table names.
+    """
+    cutoff = month_start(before)
+    detached = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        if archive_schema:
+            cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {connection.ops.quote_name(archive_schema)}")
+        for table, _ in reversed(PARTITIONS):
+            for month, name in list_partitions(table):
+                if add_months(month, 1) > cutoff:
+                    continue
+                cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {name}")
+                cursor.execute(
+                    "SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass "
+                    "AND contype = 'f' AND confrelid = %s::regclass",
+                    [name, ORDER_TABLE],
+                )
+                for (constraint,) in cursor.fetchall():
+                    cursor.execute(f"ALTER TABLE {name} DROP CONSTRAINT {connection.ops.quote_name(constraint)}")
+                if archive_schema:
+                    cursor.execute(f"ALTER TABLE {name} SET SCHEMA {connection.ops.quote_name(archive_schema)}")
+                detached.append(name)
+    return detached
+
+
+def _move_to_sequence(cursor, table):
+    """Partitioned tables cannot keep identity columns (before PostgreSQL 17); use a sequence."""
+    sequence = f"{table}_part_id_seq"
+    cursor.execute(f"CREATE SEQUENCE IF NOT EXISTS {sequence} OWNED BY {table}.id")
+    cursor.execute(f"SELECT setval('{sequence}', COALESCE((SELECT MAX(id) FROM {table}_heap), 0) + 1, false)")
+    cursor.execute(f"ALTER TABLE {table} ALTER COLUMN id SET DEFAULT nextval('{sequence}')")
+
+
+def convert_to_partitioned(months_ahead=3):
+    """
+    One-time conversion of the heap tables into partitioned tables.
+    The tables are locked for the duration of the copy; run it in a maintenance window.
+    """
+    if is_partitioned(ORDER_TABLE):
+        return []
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {ORDER_TABLE}, {ITEM_TABLE} IN ACCESS EXCLUSIVE MODE")
+        cursor.execute(f"UPDATE {ITEM_TABLE} i SET order_created_time = o.created_time "
+                       f"FROM {ORDER_TABLE} o WHERE o.id = i.order_id AND i.order_created_time IS NULL")
+        cursor.execute(f"SELECT MIN(created_time) FROM {ORDER_TABLE}")
+        oldest = cursor.fetchone()[0] or timezone.now()
+
+        for table, key in PARTITIONS:
+            cursor.execute(f"ALTER TABLE {table} RENAME TO {table}_heap")
+            cursor.execute(
+                f"CREATE TABLE {table} (LIKE {table}_heap INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+                f"PARTITION BY RANGE ({key})"
+            )
+            cursor.execute(f"ALTER TABLE {table} ALTER COLUMN {key} SET NOT NULL")
+            cursor.execute(f"ALTER TABLE {table} ADD PRIMARY KEY (id, {key})")
+            _move_to_sequence(cursor, table)
+            cursor.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+
+        create_partitions(oldest, add_months(month_start(timezone.now()), months_ahead))
+
+        for table, _ in PARTITIONS:
+            cursor.execute(f"INSERT INTO {table} SELECT * FROM {table}_heap")
+        for table, _ in reversed(PARTITIONS):
+            cursor.execute(f"DROP TABLE {table}_heap CASCADE")
+
+        # Indexes declared on the models, now built per partition.
+        cursor.execute(f"CREATE INDEX order_alive_created_idx ON {ORDER_TABLE} (tenant_id, created_time) "
+                       f"WHERE deleted_at IS NULL")
+        cursor.execute(f"CREATE INDEX order_deleted_at_idx ON {ORDER_TABLE} (deleted_at) WHERE deleted_at IS NOT NULL")
+        cursor.execute(f"CREATE INDEX api_order_order_number_part_idx ON {ORDER_TABLE} (tenant_id, order_number)")
+        cursor.execute(f"CREATE INDEX api_orderitem_order_id_part_idx ON {ITEM_TABLE} (order_id)")
+        cursor.execute(f"CREATE INDEX api_orderitem_product_id_part_idx ON {ITEM_TABLE} (product_id)")
+        cursor.execute(f"CREATE INDEX orderitem_tenant_created_idx ON {ITEM_TABLE} (tenant_id, order_created_time)")
+        cursor.execute(
+            f"ALTER TABLE {ITEM_TABLE} ADD CONSTRAINT api_orderitem_order_part_fk "
+            f"FOREIGN KEY (order_id, order_created_time) REFERENCES {ORDER_TABLE} (id, created_time) "
+            f"DEFERRABLE INITIALLY DEFERRED"
+        )
+        cursor.execute(
+            f"ALTER TABLE {ITEM_TABLE} ADD CONSTRAINT api_orderitem_product_part_fk "
+            f"FOREIGN KEY (product_id) REFERENCES api_product (id) DEFERRABLE INITIALLY DEFERRED"
+        )
+
+        # order_number stays unique per tenant across all partitions.
+        cursor.execute(
+            "CREATE TABLE api_order_number (tenant_id bigint NOT NULL, order_number varchar(100) NOT NULL, "
+            "PRIMARY KEY (tenant_id, order_number))"
+        )
+        cursor.execute(f"INSERT INTO api_order_number SELECT tenant_id, order_number FROM {ORDER_TABLE}")
+        cursor.execute(ORDER_NUMBER_SYNC_FUNCTION)
+        cursor.execute(ORDER_NUMBER_SYNC_TRIGGER)
+
+    return [table for table, _ in PARTITIONS]
@@ -0,0 +1,302 @@
+"""
+Request profiling (see ProfilingMiddleware).
+
+On demand: a request carrying `X-Profile: cprofile|sample` (or
+`?profile=cprofile|sample`) plus settings.PROFILE_TOKEN in the
+`X-Profile-Token` header is profiled. The token is never accepted in the URL,
+where access logs and proxies would keep it.
+- cprofile: deterministic cProfile. The result is a pstats file that
+  `python -m pstats`, snakeviz and similar tools can open.
+- sample: the stack sampler below. The result is a speedscope file
+  (https://www.speedscope.app). Its second profile lays out the request's
+  SQL queries on the same timeline.
+With `X-Profile-Output: store` (or `?profile_output=store`) the view's own
+response is returned and the profile is written to PROFILE_DIR. Otherwise
+the profile replaces the response body. Either way, Server-Timing carries
+the total time and the SQL time.
+
+Continuous: with PROFILE_SAMPLE_RATE = N, one request in N is sampled. Its
+stacks are added to an in-memory flame graph per view, which
+GET /api/profiles/ exports as speedscope.
+
+The sampler is one shared thread. Every PROFILE_SAMPLE_INTERVAL_MS it reads
+the stacks of the threads being profiled from sys._current_frames(). The
+profiled code itself runs untraced.
+"""
+import cProfile
+import hmac
+import json
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+MODES = ('cprofile', 'sample')
+
+# cProfile cannot run two profilers at once on Python 3.12+.
+_cprofile_lock = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    """Another request is being profiled with cProfile."""
+
+
+def requested_mode(request):
+    return request.headers.get('X-Profile') or request.GET.get('profile')
+
+
+def token_ok(request):
+    """True when profiling is enabled and the request carries its token in X-Profile-Token."""
+    token = request.headers.get('X-Profile-Token') or ''
+    # Bytes: compare_digest rejects non-ASCII str.
+    return bool(settings.PROFILE_TOKEN) and hmac.compare_digest(token.encode(), settings.PROFILE_TOKEN.encode())
+
+
+def _frame_key(code):
+    return code.co_filename, code.co_firstlineno, getattr(code, 'co_qualname', code.co_name)
+
+
+class Sampler:
+    """
+    Samples the stacks of registered threads into their Counters.
+    Each sample is weighted by the milliseconds since that thread's previous
+    one: the GIL can stretch the interval, and counts alone would undercount.
+    """
+
+    def __init__(self):
+        self.targets = {}  # thread id -> [Counter of stack -> ms, root code object, last sample time]
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def add(self, thread_id, stacks, root):
+        with self.lock:
+            self.targets[thread_id] = [stacks, root, time.perf_counter()]
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='profiling-sampler', daemon=True)
+                self.thread.start()
+        self.wakeup.set()
+
+    def remove(self, thread_id):
+        with self.lock:
+            self.targets.pop(thread_id, None)
+
+    def _run(self):
+        while True:
+            with self.lock:
+                if not self.targets:
+                    self.wakeup.clear()
+            self.wakeup.wait()
+            time.sleep(settings.PROFILE_SAMPLE_INTERVAL_MS / 1000)
+            frames = sys._current_frames()
+            now = time.perf_counter()
+            # Under the lock, so a Counter is never written after remove() returns.
+            with self.lock:
+                for thread_id, target in self.targets.items():
+                    stacks, root, last = target
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stacks[_stack(frame, root)] += (now - last) * 1000
+                    target[2] = now
+
+
+def _stack(frame, root):
+    """Frame keys from `root` (exclusive) down to `frame`."""
+    stack = []
+    while frame is not None and frame.f_code is not root:
+        stack.append(_frame_key(frame.f_code))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+
+_sampler = Sampler()
+
+
+class RequestProfile:
+    """What one profiled request produced."""
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.started = time.perf_counter()
+        self.duration_ms = 0.0
+        self.queries = []  # (start ms, duration ms, sql)
+        self.stacks = Counter()  # stack -> sampled ms
+        self.stats = None
+
+    @property
+    def sql_ms(self):
+        return sum(duration for _, duration, _ in self.queries)
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            end = time.perf_counter()
+            self.queries.append(((start - self.started) * 1000, (end - start) * 1000, sql))
+
+    def server_timing(self):
+        return (f'total;dur={self.duration_ms:.1f}, '
+                f'sql;dur={self.sql_ms:.1f};desc="{len(self.queries)} queries"')
+
+
+@contextmanager
+def profile(mode, root):
+    """
+    Profile the calling thread until the block exits; yields a RequestProfile.
+    `root` is the code object of the caller, where sampled stacks are cut off.
+    Raises ProfilerBusy when cProfile is already running.
+    """
+    result = RequestProfile(mode)
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(result.record_query))
+        if mode == 'cprofile':
+            if not _cprofile_lock.acquire(blocking=False):
+                raise ProfilerBusy("Another request is being profiled.")
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield result
+            finally:
+                profiler.disable()
+                _cprofile_lock.release()
+                result.stats = pstats.Stats(profiler).stats
+        else:
+            thread_id = threading.get_ident()
+            _sampler.add(thread_id, result.stacks, root)
+            try:
+                yield result
+            finally:
+                _sampler.remove(thread_id)
+    result.duration_ms = (time.perf_counter() - result.started) * 1000
+
+
+class FrameTable:
+    """speedscope's shared frame list."""
+
+    def __init__(self):
+        self.frames = []
+        self.index = {}
+
+    def __call__(self, key):
+        if key not in self.index:
+            self.index[key] = len(self.frames)
+            filename, line, name = key
+            self.frames.append({"name": name, "file": filename, "line": line})
+        return self.index[key]
+
+
+def sampled_profile(frames, name, stacks):
+    samples = [[frames(key) for key in stack] for stack in stacks]
+    weights = list(stacks.values())
+    return {
+        "type": "sampled",
+        "name": name,
+        "unit": "milliseconds",
+        "startValue": 0,
+        "endValue": sum(weights),
+        "samples": samples,
+        "weights": weights,
+    }
+
+
+def speedscope(name, frames, profiles):
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name,
+        "exporter": "pretest api.profiling",
+        "activeProfileIndex": 0,
+        "shared": {"frames": frames.frames},
+        "profiles": profiles,
+    }
+
+
+def request_speedscope(result, name):
+    """The sampled stacks, then the SQL queries as an evented timeline."""
+    frames = FrameTable()
+    events = []
+    for start, duration, sql in result.queries:
+        frame = frames(('<sql>', 0, ' '.join(sql.split())[:300]))
+        events.append({"type": "O", "frame": frame, "at": start})
+        events.append({"type": "C", "frame": frame, "at": start + duration})
+    profiles = [sampled_profile(frames, name, result.stacks), {
+        "type": "evented",
+        "name": f"SQL ({len(result.queries)} queries, {result.sql_ms:.1f} ms)",
+        "unit": "milliseconds",
+        "startValue": 0,
+        "endValue": result.duration_ms,
+        "events": events,
+    }]
+    return speedscope(name, frames, profiles)
+
+
+def encode(result, name):
+    """(bytes, content type, file extension) for a finished RequestProfile."""
+    if result.mode == 'cprofile':
+        return marshal.dumps(result.stats), 'application/octet-stream', 'pstats'
+    return json.dumps(request_speedscope(result, name)).encode(), 'application/json', 'speedscope.json'
+
+
+def store(data, name, extension):
+    """Write a profile to PROFILE_DIR; returns the file name."""
+    os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+    slug = ''.join(c if c.isalnum() else '-' for c in name).strip('-')
+    filename = f"{timezone.now():%Y%m%dT%H%M%S%f}-{slug}.{extension}"
+    with open(os.path.join(settings.PROFILE_DIR, filename), 'wb') as f:
+        f.write(data)
+    return filename
+
+
+class FlameGraphs:
+    """Sampled stacks of the continuously profiled requests, per view."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def add(self, view, result):
+        with self.lock:
+            entry = self.views.setdefault(view, {
+                "stacks": Counter(), "requests": 0, "ms": 0.0, "sql_ms": 0.0, "queries": 0, "dropped": 0,
+            })
+            entry["requests"] += 1
+            entry["ms"] += result.duration_ms
+            entry["sql_ms"] += result.sql_ms
+            entry["queries"] += len(result.queries)
+            for stack, ms in result.stacks.items():
+                # Bounded memory: once full, only stacks already seen keep counting.
+                if stack in entry["stacks"] or len(entry["stacks"]) < settings.PROFILE_MAX_STACKS:
+                    entry["stacks"][stack] += ms
+                else:
+                    entry["dropped"] += ms
+
+    def export(self):
+        """All views as one speedscope file, busiest view first."""
+        frames = FrameTable()
+        with self.lock:
+            views = sorted(self.views.items(), key=lambda item: -item[1]["ms"])
+            profiles = [
+                sampled_profile(frames, (
+                    f"{view}: {entry['requests']} requests, {entry['ms']:.0f} ms, "
+                    f"SQL {entry['sql_ms']:.0f} ms in {entry['queries']} queries"
+                    + (f", {entry['dropped']:.0f} ms of samples dropped" if entry['dropped'] else "")
+                ), entry["stacks"])
+                for view, entry in views
+            ]
+        return speedscope("Sampled requests", frames, profiles)
+
+    def reset(self):
+        with self.lock:
+            self.views.clear()
+
+
+flame_graphs = FlameGraphs()
@@ -0,0 +1,68 @@
+import time
+from datetime import timedelta
+from django.db import connection, transaction
+from django.utils import timezone
+from .models import Order
+from .models import OrderItem
+
+
+def delete_ids(model, ids):
+    """Hard-delete rows by primary key with a single raw DELETE.
+
+    Bypasses Django's cascade collector, so nothing is loaded into memory
+    and the row locks are held only for this one statement.
+    """
+    if not ids:
+        return 0
+    table = connection.ops.quote_name(model._meta.db_table)
+    pk = connection.ops.quote_name(model._meta.pk.column)
+    placeholders = ', '.join(['%s'] * len(ids))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE {pk} IN ({placeholders})", list(ids))
+        return cursor.rowcount
+
+
+def purge_deleted_orders(batch_size=500, sleep=0.1, older_than=timedelta(0), on_batch=None):
+    """
+    Hard-delete soft-deleted orders and their items in bounded batches.
+    - Each batch of `batch_size` orders is one transaction: the orders are
+      locked, their items removed (at most `batch_size` rows per statement),
+      then the orders.
+    - Sleeps `sleep` seconds between batches to leave room for live traffic.
+    - Calls `on_batch()` after each batch (the purge job's heartbeat).
+    Returns a (orders, items) tuple of purged row counts.
+    """
+    cutoff = timezone.now() - older_than
+    purged_orders = purged_items = 0
+
+    while True:
+        order_ids = list(
+            Order.objects.deleted()
+            .filter(deleted_at__lte=cutoff)
+            .order_by('id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not order_ids:
+            break
+
+        with transaction.atomic():
+            # An item insert takes a key-share lock on its order, so with the
+            # orders locked no item can land between the two deletes and fail
+            # the order delete on its foreign key.
+            order_ids = list(
+                Order.objects.select_for_update().filter(id__in=order_ids).values_list('id', flat=True)
+            )
+            while True:
+                item_ids = list(
+                    OrderItem.objects.filter(order_id__in=order_ids)
+                    .values_list('id', flat=True)[:batch_size]
+                )
+                if not item_ids:
+                    break
+                purged_items += delete_ids(OrderItem, item_ids)
+            purged_orders += delete_ids(Order, order_ids)
+        if on_batch is not None:
+            on_batch()
+        time.sleep(sleep)
+
+    return purged_orders, purged_items
@@ -0,0 +1,103 @@
+import math
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.core import signing
+from django.db import DatabaseError, connections
+
+STICKY_COOKIE = 'replica_sticky'
+STICKY_HEADER = 'X-Replica-Sticky'
+
+_use_replica = ContextVar('use_replica', default=False)
+_lag_cache = {}
+_sticky_signer = signing.TimestampSigner(salt='api.routers.sticky')
+
+
+@contextmanager
+def read_from_replica():
+    """Send reads made inside the block to the replica, if one is configured."""
+    reset_token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(reset_token)
+
+
+def mark_write(response):
+    """
+    Pin the client that receives `response` to the primary for REPLICA_STICKY_SECONDS.
+    The signed write time travels with the client, so it holds on any worker:
+    - as a cookie, for clients that keep cookies;
+    - in X-Replica-Sticky, for clients that echo it back on their next requests.
+    """
+    if settings.REPLICA_DATABASE:
+        value = _sticky_signer.sign('primary')
+        response.set_cookie(STICKY_COOKIE, value, max_age=math.ceil(settings.REPLICA_STICKY_SECONDS),
+                            httponly=True, samesite='Lax')
+        response[STICKY_HEADER] = value
+
+
+def recently_wrote(request):
+    """True when the request carries a valid sticky value younger than REPLICA_STICKY_SECONDS."""
+    value = request.headers.get(STICKY_HEADER) or request.COOKIES.get(STICKY_COOKIE)
+    if not value:
+        return False
+    try:
+        _sticky_signer.unsign(value, max_age=settings.REPLICA_STICKY_SECONDS)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def replica_lag(alias):
+    """
+    Seconds the replica is behind the primary.
+    - Checked at most once per REPLICA_LAG_CHECK_INTERVAL per process.
+    - An unreachable replica counts as infinitely behind.
+    """
+    now = time.monotonic()
+    checked_at, seconds = _lag_cache.get(alias, (None, 0.0))
+    if checked_at is not None and now - checked_at < settings.REPLICA_LAG_CHECK_INTERVAL:
+        return seconds
+
+    seconds = 0.0
+    connection = connections[alias]
+    if connection.vendor == 'postgresql':
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+                )
+                seconds = float(cursor.fetchone()[0])
+        except DatabaseError:
+            seconds = float('inf')
+    _lag_cache[alias] = (now, seconds)
+    return seconds
+
+
+class ReplicaRouter:
+    """
+    Route reads inside `read_from_replica()` to settings.REPLICA_DATABASE.
+    - Writes, and every other read, go to the primary.
+    - Falls back to the primary while replica lag exceeds REPLICA_MAX_LAG_SECONDS.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = settings.REPLICA_DATABASE
+        if alias and _use_replica.get() and replica_lag(alias) <= settings.REPLICA_MAX_LAG_SECONDS:
+            return alias
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica receives the schema through replication.
+        if db == settings.REPLICA_DATABASE:
+            return False
+        return None
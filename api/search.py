@@ -0,0 +1,69 @@
+import re
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.functions import Collate, Upper
+from .models import Product
+
+# Must match the expression indexed by migration 0007.
+SEARCH_CONFIG = 'simple'
+
+
+def _terms(query):
+    return re.findall(r'\w+', query.lower())
+
+
+def search_products(query, limit=20, offset=0):
+    """
+    Rank products whose name matches every term of `query`.
+    - The last term is treated as a prefix, so results update as the user types.
+    - PostgreSQL uses full-text search over the GIN-indexed name vector.
+    - Other databases (SQLite test runs) fall back to icontains filtering.
+    Returns a list of products annotated with `rank`.
+    """
+    terms = _terms(query)
+    if not terms:
+        return []
+
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+        vector = SearchVector('name', config=SEARCH_CONFIG)
+        tsquery = ' & '.join(terms[:-1] + [f'{terms[-1]}:*'])
+        search = SearchQuery(tsquery, search_type='raw', config=SEARCH_CONFIG)
+        products = (
+            Product.objects.annotate(document=vector)
+            .filter(document=search)
+            .annotate(rank=SearchRank(vector, search))
+            .order_by('-rank', 'id')
+        )
+    else:
+        condition = Q()
+        for term in terms:
+            condition &= Q(name__icontains=term)
+        products = (
+            Product.objects.filter(condition)
+            .annotate(rank=Case(
+                When(name__istartswith=terms[0], then=Value(2)),
+                default=Value(1),
+                output_field=IntegerField(),
+            ))
+            .order_by('-rank', 'id')
+        )
+    return list(products.only('id', 'name', 'price')[offset:offset + limit])
+
+
+def autocomplete_products(prefix, limit=10):
+    """
+    Names starting with `prefix`, case-insensitively ordered.
+    Both the filter and the order are on UPPER(name), the expression of the
+    (tenant_id, UPPER(name) COLLATE "C") index from migration 0011. On
+    PostgreSQL the order is collated "C" too, or the index can't supply it.
+    """
+    name = Upper('name')
+    if connection.vendor == 'postgresql':
+        name = Collate(name, 'C')
+    return list(
+        Product.objects.filter(name__istartswith=prefix)
+        .order_by(name, 'id')
+        .values('id', 'name')[:limit]
+    )
@@ -0,0 +1,66 @@
+"""
+Sparse fieldsets and a columnar shape for the list endpoints.
+
+    ?fields=order_id,total_price   only these keys, and only their columns are selected
+    ?shape=columnar                {"fields": [...], "rows": [[...], ...]}
+
+Rows are read with values_list(), so no model instances are built.
+"""
+ORDER_FIELDS = {
+    # response key: (model field, converter)
+    "order_id": ("id", None),
+    "order_number": ("order_number", None),
+    "total_price": ("total_price", float),
+    "status": ("status", None),
+    "version": ("version", None),
+    "created_time": ("created_time", None),
+}
+
+ORDER_ITEM_FIELDS = {
+    "id": ("id", None),
+    "order_id": ("order_id", None),
+    "product_id": ("product_id", None),
+    "quantity": ("quantity", None),
+    "price_at_order": ("price_at_order", float),
+}
+
+SHAPES = ('objects', 'columnar')
+
+
+def parse(request, available):
+    """
+    Return (keys, columnar) from ?fields= and ?shape=.
+    Raises ValueError for an unknown field or shape.
+    """
+    shape = request.query_params.get('shape', 'objects')
+    if shape not in SHAPES:
+        raise ValueError(f"shape must be one of: {', '.join(SHAPES)}.")
+    fields = request.query_params.get('fields')
+    if not fields:
+        return list(available), shape == 'columnar'
+    keys = list(dict.fromkeys(key.strip() for key in fields.split(',') if key.strip()))
+    unknown = [key for key in keys if key not in available]
+    if unknown or not keys:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(available)}.")
+    return keys, shape == 'columnar'
+
+
+def select_rows(queryset, available, keys):
+    """Fetch only the columns behind `keys`; return rows as lists in `keys` order."""
+    columns = [available[key][0] for key in keys]
+    converters = [
+        (index, available[key][1]) for index, key in enumerate(keys) if available[key][1] is not None
+    ]
+    rows = [list(row) for row in queryset.values_list(*columns)]
+    for index, convert in converters:
+        for row in rows:
+            if row[index] is not None:
+                row[index] = convert(row[index])
+    return rows
+
+
+def render(keys, rows, columnar):
+    """Rows as a list of objects, or field names once and rows as arrays."""
+    if columnar:
+        return {"fields": keys, "rows": rows}
+    return [dict(zip(keys, row)) for row in rows]
@@ -0,0 +1,88 @@
+"""
+Tenant scoping.
+
+Every request runs inside `tenant_context()` for the tenant its token
+belongs to (see `require_token`). While one is active:
+- the default managers of tenant-owned models only see that tenant's rows;
+- new rows default to that tenant.
+
+Outside a tenant context (management commands, the job claimer, tests that
+use the ORM directly) querysets are unscoped and new rows belong to the
+default tenant, which settings.ACCEPTED_TOKEN maps to. Code that must cross
+tenants while inside a context uses the `all_tenants` managers.
+"""
+import hashlib
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import models
+
+DEFAULT_TENANT_ID = 1
+
+_current_tenant = ContextVar('current_tenant', default=None)
+_token_cache = {}
+
+
+@contextmanager
+def tenant_context(tenant_id):
+    reset_token = _current_tenant.set(tenant_id)
+    try:
+        yield
+    finally:
+        _current_tenant.reset(reset_token)
+
+
+def current_tenant():
+    """The active tenant id, or None outside a tenant context."""
+    return _current_tenant.get()
+
+
+def default_tenant_id():
+    """Field default for `tenant`: the active tenant, else the default tenant."""
+    tenant_id = _current_tenant.get()
+    return DEFAULT_TENANT_ID if tenant_id is None else tenant_id
+
+
+class TenantManager(models.Manager):
+    """Default manager that filters on the active tenant, when there is one."""
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        tenant_id = _current_tenant.get()
+        if tenant_id is not None:
+            queryset = queryset.filter(tenant_id=tenant_id)
+        return queryset
+
+
+def hash_token(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def tenant_for_token(token):
+    """
+    Resolve an access token to a tenant id, or None if it is not valid.
+    - settings.ACCEPTED_TOKEN is the default tenant's token.
+    - Lookups (including misses) are cached in memory for TENANT_CACHE_SECONDS.
+    """
+    if not token:
+        return None
+    if token == settings.ACCEPTED_TOKEN:
+        return DEFAULT_TENANT_ID
+    key = hash_token(token)
+    now = time.monotonic()
+    cached = _token_cache.get(key)
+    if cached is not None and cached[1] > now:
+        return cached[0]
+
+    # Imported here: models imports this module for the managers and field default.
+    from .models import Tenant
+    tenant_id = Tenant.objects.filter(token_hash=key).values_list('id', flat=True).first()
+    if len(_token_cache) >= settings.TENANT_CACHE_SIZE:
+        _token_cache.clear()
+    _token_cache[key] = (tenant_id, now + settings.TENANT_CACHE_SECONDS)
+    return tenant_id
+
+
+def forget_token(token):
+    _token_cache.pop(hash_token(token), None)
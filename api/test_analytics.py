@@ -0,0 +1,123 @@
+import shutil
+import tempfile
+from datetime import datetime, timezone as dt_timezone
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework import status
+from . import analytics, changes
+from .models import ChangeEvent, Order, OrderItem, Product
+
+@override_settings(ANALYTICS_REFRESH_SECONDS=0, CHANGE_FEED_SETTLE_SECONDS=0)
+class ItemReportTestCase(TestCase):
+    """Test case for the vectorized item report"""
+    def setUp(self):
+        self.client = APIClient()
+        self.token = 'omni_pretest_token'
+        analytics.reset()
+        self.addCleanup(analytics.reset)
+        self.apple = Product.objects.create(name="Apple", price=1.25)
+        self.pear = Product.objects.create(name="Pear", price=2.00)
+
+    def add_item(self, order, product, quantity):
+        response = self.client.post('/api/order-items/', {
+            "access_token": self.token, "order_id": order.id, "product_id": product.id, "quantity": quantity,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data["id"]
+
+    def report(self, query=''):
+        response = self.client.get(f'/api/reports/items/?access_token={self.token}{query}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_report_by_product(self):
+        """Test revenue per product, top products and order percentiles"""
+        first = Order.objects.create(order_number="ORD-1", total_price=0)
+        second = Order.objects.create(order_number="ORD-2", total_price=0)
+        self.add_item(first, self.apple, 4)    # 5.00
+        self.add_item(first, self.pear, 1)     # 2.00
+        self.add_item(second, self.pear, 10)   # 20.00
+
+        data = self.report('&top=1&percentiles=50,100')
+        self.assertEqual(data["rows"], [
+            {"product_id": self.apple.id, "revenue": 5.0, "quantity": 4},
+            {"product_id": self.pear.id, "revenue": 22.0, "quantity": 11},
+        ])
+        self.assertEqual(data["top_products"], [{"product_id": self.pear.id, "revenue": 22.0}])
+        self.assertEqual(data["order_value_percentiles"], {"p50": 13.5, "p100": 20.0})
+        self.assertEqual(data["total_revenue"], 27.0)
+
+    def test_incremental_refresh(self):
+        """Test new items, item updates and order status changes reach a loaded report"""
+        order = Order.objects.create(order_number="ORD-1", total_price=0)
+        other = Order.objects.create(order_number="ORD-2", total_price=0)
+        item_id = self.add_item(order, self.apple, 4)
+        self.add_item(other, self.pear, 1)
+        self.assertEqual(self.report()["total_revenue"], 7.0)
+
+        self.add_item(order, self.pear, 2)
+        self.client.put(f'/api/order-items/{item_id}/update/', {"access_token": self.token, "quantity": 8}, format='json')
+        self.assertEqual(self.report()["total_revenue"], 16.0)
+
+        self.client.put(f'/api/orders/{other.id}/update/', {"access_token": self.token, "status": "cancelled"}, format='json')
+        self.client.delete(f'/api/order-items/{item_id}/delete/', {"access_token": self.token}, format='json')
+        self.assertEqual(self.report()["total_revenue"], 4.0)
+
+    def test_late_commit_with_lower_id(self):
+        """Test an item with a lower id than one already loaded is picked up from the changes feed"""
+        order = Order.objects.create(order_number="ORD-1", total_price=0)
+        item_id = self.add_item(order, self.apple, 4)
+        later = OrderItem.objects.create(id=item_id + 10, order=order, product=self.apple, quantity=4, price_at_order=1.25)
+        changes.record(ChangeEvent.CREATE, [later])
+        self.assertEqual(self.report()["total_revenue"], 10.0)
+
+        # A transaction that took a lower id commits after the higher one was loaded.
+        late = OrderItem.objects.create(id=item_id + 5, order=order, product=self.pear, quantity=1, price_at_order=2)
+        changes.record(ChangeEvent.CREATE, [late])
+        with self.settings(CHANGE_FEED_SETTLE_SECONDS=60):
+            self.assertEqual(self.report()["total_revenue"], 10.0)
+        self.assertEqual(self.report()["total_revenue"], 12.0)
+
+    def test_archiving_after_load(self):
+        """Test items moved to the archive after the first load still count"""
+        archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, archive_dir)
+        with override_settings(ORDER_ARCHIVE_DIR=archive_dir):
+            old = Order.objects.create(order_number="ORD-OLD", total_price=0)
+            Order.objects.filter(id=old.id).update(created_time=datetime(2024, 3, 10, 12, tzinfo=dt_timezone.utc))
+            old.refresh_from_db()
+            self.add_item(old, self.apple, 2)
+            Order.objects.filter(id=old.id).update(status='delivered')
+            self.assertEqual(self.report()["total_revenue"], 2.5)
+
+            call_command('archive_orders', month='2024-03', sleep=0, stdout=StringIO())
+            self.assertEqual(OrderItem.objects.count(), 0)
+            self.assertEqual(self.report()["total_revenue"], 2.5)
+
+    def test_report_by_day_with_archive(self):
+        """Test grouping by day across archived and live items"""
+        archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, archive_dir)
+        with override_settings(ORDER_ARCHIVE_DIR=archive_dir):
+            old = Order.objects.create(order_number="ORD-OLD", total_price=0, status='delivered')
+            Order.objects.filter(id=old.id).update(created_time=datetime(2024, 3, 10, 12, tzinfo=dt_timezone.utc))
+            old.refresh_from_db()
+            OrderItem.objects.create(order=old, product=self.apple, quantity=2, price_at_order=1.25)
+            call_command('archive_orders', month='2024-03', sleep=0, stdout=StringIO())
+            self.assertEqual(OrderItem.objects.count(), 0)
+
+            new = Order.objects.create(order_number="ORD-NEW", total_price=0)
+            self.add_item(new, self.pear, 1)
+
+            data = self.report('&group_by=day')
+            self.assertEqual(data["rows"][0], {"day": "2024-03-10", "revenue": 2.5, "quantity": 2})
+            self.assertEqual(len(data["rows"]), 2)
+            data = self.report('&group_by=day&created_before=2024-04-01')
+            self.assertEqual(data["total_revenue"], 2.5)
+
+    def test_invalid_group_by(self):
+        """Test an unsupported group_by"""
+        response = self.client.get(f'/api/reports/items/?group_by=month&access_token={self.token}')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,112 @@
+import shutil
+import tempfile
+from datetime import datetime, timezone as dt_timezone
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework import status
+from . import archive
+from .models import ChangeEvent, Order, OrderItem, Product
+
+MARCH = datetime(2024, 3, 10, 12, 0, tzinfo=dt_timezone.utc)
+APRIL = datetime(2024, 4, 2, 8, 0, tzinfo=dt_timezone.utc)
+
+class ArchiveTestCase(TestCase):
+    """Test case for the columnar order archive"""
+    def setUp(self):
+        self.client = APIClient()
+        self.token = 'omni_pretest_token'
+        self.archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.archive_dir)
+        settings_override = override_settings(ORDER_ARCHIVE_DIR=self.archive_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.product = Product.objects.create(name="Widget", price=2.50)
+
+    def make_order(self, number, created, order_status='delivered', quantities=(1,)):
+        order = Order.objects.create(order_number=number, total_price=10, status=order_status)
+        Order.objects.filter(id=order.id).update(created_time=created)
+        order.refresh_from_db()
+        for quantity in quantities:
+            OrderItem.objects.create(order=order, product=self.product, quantity=quantity, price_at_order=2.50)
+        return order
+
+    def test_archive_and_read_back(self):
+        """Test closed orders move to the archive and stay visible to list and report views"""
+        delivered = self.make_order("ORD-MAR-1", MARCH, quantities=(2, 3))
+        cancelled = self.make_order("ORD-MAR-2", MARCH, order_status='cancelled', quantities=(4,))
+        pending = self.make_order("ORD-MAR-3", MARCH, order_status='pending', quantities=(1,))
+        self.make_order("ORD-APR-1", APRIL, quantities=(10,))
+
+        out = StringIO()
+        call_command('archive_orders', month='2024-03', chunk_size=1, sleep=0, stdout=out)
+        self.assertIn("2024-03: archived 2 orders and 3 order items.", out.getvalue())
+        self.assertFalse(Order.objects.filter(id__in=[delivered.id, cancelled.id]).exists())
+        self.assertTrue(Order.objects.filter(id=pending.id).exists())
+        self.assertEqual(OrderItem.objects.count(), 2)
+
+        response = self.client.get(f'/api/orders/list/?include_archived=true&access_token={self.token}')
+        self.assertEqual(len(response.data), 4)
+        self.assertEqual(sorted(order["archived"] for order in response.data), [False, False, True, True])
+        response = self.client.get(
+            f'/api/orders/list/?id={delivered.id}&include_archived=true&access_token={self.token}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]["order_number"], "ORD-MAR-1")
+        self.assertTrue(response.data[0]["archived"])
+        self.assertEqual(response.data[0]["created_time"], MARCH)
+        response = self.client.get(
+            f'/api/orders/list/?include_archived=true&shape=columnar&fields=order_id&access_token={self.token}')
+        self.assertEqual(response.data["fields"], ["order_id", "archived"])
+        response = self.client.get(f'/api/orders/list/?access_token={self.token}')
+        self.assertEqual(len(response.data), 2)
+        self.assertNotIn("archived", response.data[0])
+        self.assertEqual(
+            ChangeEvent.objects.filter(action=ChangeEvent.DELETE, model='order').count(), 2)
+
+        response = self.client.get(f'/api/reports/revenue/?access_token={self.token}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # March: 5 delivered units + 1 pending unit; the cancelled order is left out.
+        self.assertEqual(response.data["months"], [
+            {"month": "2024-03", "revenue": 15.0},
+            {"month": "2024-04", "revenue": 25.0},
+        ])
+        response = self.client.get(f'/api/reports/revenue/?created_after=2024-04-01&access_token={self.token}')
+        self.assertEqual(response.data["total_revenue"], 25.0)
+
+    def test_range_scan(self):
+        """Test scans and revenue honour the created range and leave out cancelled orders"""
+        self.make_order("ORD-MAR-1", MARCH, quantities=(2,))
+        self.make_order("ORD-MAR-2", MARCH.replace(day=20), quantities=(4,))
+        self.make_order("ORD-MAR-3", MARCH, order_status='cancelled', quantities=(8,))
+        call_command('archive_orders', month='2024-03', sleep=0, stdout=StringIO())
+        self.assertEqual(len(list(archive.scan_orders())), 3)
+        self.assertEqual(list(archive.scan_orders(start=APRIL)), [])
+        march = datetime(2024, 3, 1, tzinfo=dt_timezone.utc)
+        self.assertEqual(archive.archived_revenue_by_month(), {march: 1500})
+        self.assertEqual(archive.archived_revenue_by_month(start=MARCH.replace(day=15)), {march: 1000})
+        self.assertEqual(archive.archived_revenue_by_month(end=MARCH), {})
+
+    def test_archive_before(self):
+        """Test --before archives every earlier month"""
+        self.make_order("ORD-MAR-1", MARCH)
+        self.make_order("ORD-APR-1", APRIL)
+        out = StringIO()
+        call_command('archive_orders', before='2024-05', sleep=0, stdout=out)
+        self.assertIn("2024-03: archived 1 orders", out.getvalue())
+        self.assertIn("2024-04: archived 1 orders", out.getvalue())
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_archive_rerun_is_idempotent(self):
+        """Test rows already in the archive are deleted on a rerun but not written twice"""
+        order = self.make_order("ORD-MAR-1", MARCH, quantities=(1, 2))
+        # As if a run had renamed its file into place and then died before deleting.
+        with mock.patch.object(archive, '_delete_archived'):
+            archive.archive_month(MARCH, sleep=0)
+        self.assertEqual(archive.archive_month(MARCH, sleep=0), (0, 0))
+        self.assertFalse(Order.objects.filter(id=order.id).exists())
+        self.assertEqual(OrderItem.objects.count(), 0)
+        self.assertEqual([o["order_id"] for o in archive.scan_orders()], [order.id])
+        self.assertEqual(archive.archived_revenue_by_month(), {datetime(2024, 3, 1, tzinfo=dt_timezone.utc): 750})
+        self.assertEqual(archive.archive_month(MARCH, sleep=0), (0, 0))
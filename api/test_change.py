@@ -0,0 +1,103 @@
+from datetime import timedelta
+from io import StringIO
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase, APIClient
+from rest_framework import status
+from .models import ChangeEvent, Order, OrderItem, Product
+
+@override_settings(CHANGE_FEED_SETTLE_SECONDS=0)
+class ChangeFeedTestCase(APITestCase):
+    """Test case for the changes feed"""
+    def setUp(self):
+        self.client = APIClient()
+        self.token = 'omni_pretest_token'
+
+    def changes(self, since=0, limit=500):
+        response = self.client.get(f'/api/changes/?since={since}&limit={limit}&access_token={self.token}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_writes_are_logged_in_order(self):
+        """Test create, update and delete through the API append events in order"""
+        response = self.client.post('/api/orders/', {"access_token": self.token, "order_number": "ORD-FEED", "total_price": 10}, format='json')
+        order_id = response.data["order_id"]
+        response = self.client.post('/api/products/', {"access_token": self.token, "name": "Feed", "price": 5}, format='json')
+        product_id = response.data["product_id"]
+        response = self.client.post('/api/order-items/', {"access_token": self.token, "order_id": order_id, "product_id": product_id, "quantity": 2}, format='json')
+        item_id = response.data["id"]
+        self.client.put(f'/api/orders/{order_id}/update/', {"access_token": self.token, "total_price": 20}, format='json')
+        self.client.delete(f'/api/orders/{order_id}/delete/', {"access_token": self.token}, format='json')
+
+        data = self.changes()
+        events = [(e["model"], e["object_id"], e["action"]) for e in data["changes"]]
+        self.assertEqual(events, [
+            ("order", order_id, "create"),
+            ("product", product_id, "create"),
+            ("order_item", item_id, "create"),
+            ("order", order_id, "update"),
+            ("order_item", item_id, "delete"),
+            ("order", order_id, "delete"),
+        ])
+        self.assertEqual(data["changes"][3]["data"]["total_price"], 20.0)
+        self.assertEqual(data["changes"][3]["data"]["version"], 2)
+        self.assertIsNone(data["changes"][-1]["data"])
+        self.assertFalse(data["has_more"])
+
+    def test_feed_pagination(self):
+        """Test paging through the feed with since and limit"""
+        for n in range(5):
+            self.client.post('/api/products/', {"access_token": self.token, "name": f"P{n}", "price": n}, format='json')
+        first = self.changes(limit=3)
+        self.assertEqual(len(first["changes"]), 3)
+        self.assertTrue(first["has_more"])
+        second = self.changes(since=first["next_since"], limit=3)
+        self.assertEqual([e["data"]["name"] for e in second["changes"]], ["P3", "P4"])
+        self.assertFalse(second["has_more"])
+        self.assertEqual(self.changes(since=second["next_since"])["changes"], [])
+
+    @override_settings(CHANGE_FEED_SETTLE_SECONDS=60)
+    def test_unsettled_events_are_held_back(self):
+        """Test events younger than the settle window are not served yet"""
+        self.client.post('/api/products/', {"access_token": self.token, "name": "New", "price": 1}, format='json')
+        data = self.changes()
+        self.assertEqual(data["changes"], [])
+        self.assertEqual(data["next_since"], 0)
+
+    @override_settings(CHANGE_FEED_SETTLE_SECONDS=60)
+    def test_feed_stops_at_first_unsettled_event(self):
+        """Test a settled event behind an unsettled lower seq is not served past it"""
+        old = timezone.now() - timedelta(minutes=5)
+        for name in ("A", "B", "C"):
+            self.client.post('/api/products/', {"access_token": self.token, "name": name, "price": 1}, format='json')
+        first, second, third = ChangeEvent.objects.order_by('seq')
+        ChangeEvent.objects.filter(seq__in=[first.seq, third.seq]).update(created_time=old)
+        data = self.changes()
+        self.assertEqual([e["seq"] for e in data["changes"]], [first.seq])
+        self.assertEqual(data["next_since"], first.seq)
+        self.assertFalse(data["has_more"])
+
+    def test_invalid_since(self):
+        """Test passing invalid since format"""
+        response = self.client.get(f'/api/changes/?since=abc&access_token={self.token}')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_compact_changes(self):
+        """Test compaction keeps only the latest old event per object"""
+        product = Product.objects.create(name="Compact", price=1)
+        for price in (2, 3, 4):
+            self.client.put(f'/api/products/{product.id}/update/', {"access_token": self.token, "price": price}, format='json')
+        order = Order.objects.create(order_number="ORD-GONE", total_price=1)
+        self.client.delete(f'/api/orders/{order.id}/delete/', {"access_token": self.token}, format='json')
+        ChangeEvent.objects.update(created_time=timezone.now() - timedelta(days=30))
+        self.client.put(f'/api/products/{product.id}/update/', {"access_token": self.token, "price": 5}, format='json')
+
+        out = StringIO()
+        call_command('compact_changes', older_than_days=7, sleep=0, stdout=out)
+        self.assertIn("Removed 3 change events.", out.getvalue())
+        events = list(ChangeEvent.objects.order_by('seq').values_list('model', 'action'))
+        self.assertEqual(events, [("order", "delete"), ("product", "update")])
+
+        call_command('compact_changes', older_than_days=7, sleep=0, drop_tombstones=True, stdout=out)
+        self.assertFalse(ChangeEvent.objects.filter(action=ChangeEvent.DELETE).exists())
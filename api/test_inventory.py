@@ -0,0 +1,183 @@
+import threading
+from unittest import skipUnless
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework import status
+from . import inventory
+from .models import Order, OrderItem, Product, StockShard
+
+class InventoryTestCase(TestCase):
+    """Test case for stock tracking and reservation"""
+    def setUp(self):
+        self.client = APIClient()
+        self.token = 'omni_pretest_token'
+        self.order = Order.objects.create(order_number="ORD-001", total_price=0)
+
+    def create_product(self, **fields):
+        response = self.client.post('/api/products/', {
+            "access_token": self.token, "name": "Widget", "price": 10, **fields,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return Product.objects.get(id=response.data["product_id"])
+
+    def add_item(self, product, quantity):
+        return self.client.post('/api/order-items/', {
+            "access_token": self.token, "order_id": self.order.id, "product_id": product.id, "quantity": quantity,
+        }, format='json')
+
+    def test_untracked_stock(self):
+        """Test products without stock never run out"""
+        product = self.create_product()
+        self.assertIsNone(product.stock)
+        self.assertEqual(self.add_item(product, 1000).status_code, status.HTTP_201_CREATED)
+
+    def test_reservation_prevents_oversell(self):
+        """Test items reserve stock and a too-large quantity is rejected"""
+        product = self.create_product(stock=5)
+        self.assertEqual(self.add_item(product, 3).status_code, status.HTTP_201_CREATED)
+        response = self.add_item(product, 3)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(OrderItem.objects.count(), 1)
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 2)
+
+    def test_update_and_delete_item_adjust_stock(self):
+        """Test changing or deleting an item reserves or releases the difference"""
+        product = self.create_product(stock=5)
+        item_id = self.add_item(product, 2).data["id"]
+        url = f'/api/order-items/{item_id}/update/'
+        response = self.client.put(url, {"access_token": self.token, "quantity": 6}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        response = self.client.put(url, {"access_token": self.token, "quantity": 4}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(inventory.available(product), 1)
+
+        self.client.delete(f'/api/order-items/{item_id}/delete/', {"access_token": self.token}, format='json')
+        self.assertEqual(inventory.available(product), 5)
+
+    def test_sharded_stock(self):
+        """Test sharded stock spreads over rows and still never oversells"""
+        product = self.create_product(stock=10, stock_shards=4)
+        self.assertEqual(sorted(StockShard.objects.filter(product=product).values_list('stock', flat=True)),
+                         [2, 2, 3, 3])
+        for _ in range(3):
+            self.assertEqual(self.add_item(product, 2).status_code, status.HTTP_201_CREATED)
+        # 4 left, spread so no single shard may hold it all.
+        self.assertEqual(self.add_item(product, 4).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.add_item(product, 1).status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(inventory.available(product), 0)
+
+        response = self.client.get(f'/api/products/list/?id={product.id}&access_token={self.token}')
+        self.assertEqual(response.data[0]["stock"], 0)
+
+    def test_update_product_stock(self):
+        """Test restocking through update_product"""
+        product = self.create_product(stock=1)
+        self.client.put(f'/api/products/{product.id}/update/', {"access_token": self.token, "stock": 8}, format='json')
+        self.assertEqual(inventory.available(product), 8)
+        self.client.put(f'/api/products/{product.id}/update/', {"access_token": self.token, "stock_shards": 2},
+                        format='json')
+        product.refresh_from_db()
+        self.assertEqual((product.stock_shards, inventory.available(product)), (2, 8))
+
+    @override_settings(ORDER_ITEM_COALESCE=True, ORDER_ITEM_COALESCE_WINDOW_MS=0)
+    def test_coalesced_reservation(self):
+        """Test coalesced creates reserve stock too"""
+        product = self.create_product(stock=1)
+        self.assertEqual(self.add_item(product, 1).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.add_item(product, 1).status_code, status.HTTP_409_CONFLICT)
+
+    def test_resharding_never_oversells(self):
+        """Test re-sharding keeps the stock left after reservations, and over-demand is still refused"""
+        product = self.create_product(stock=10)
+        self.assertEqual(self.add_item(product, 3).status_code, status.HTTP_201_CREATED)
+        self.client.put(f'/api/products/{product.id}/update/', {"access_token": self.token, "stock_shards": 3},
+                        format='json')
+        self.assertEqual(inventory.available(product), 7)
+        self.assertEqual(self.add_item(product, 8).status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self.add_item(product, 7).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.add_item(product, 1).status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(sum(OrderItem.objects.values_list('quantity', flat=True)), 10)
+
+    def test_cancel_and_delete_release_stock_once(self):
+        """Test cancelling or deleting an order gives its stock back, and never twice"""
+        product = self.create_product(stock=5)
+        self.add_item(product, 2)
+        self.client.put(f'/api/orders/{self.order.id}/update/', {"access_token": self.token, "status": "cancelled"},
+                        format='json')
+        self.assertEqual(inventory.available(product), 5)
+        self.client.delete(f'/api/orders/{self.order.id}/delete/?access_token={self.token}')
+        self.assertEqual(inventory.available(product), 5)
+
+        self.order = Order.objects.create(order_number="ORD-002", total_price=0)
+        self.add_item(product, 4)
+        self.assertEqual(inventory.available(product), 1)
+        with override_settings(ORDER_SOFT_DELETE=False):
+            self.client.delete(f'/api/orders/{self.order.id}/delete/?access_token={self.token}')
+        self.assertEqual(inventory.available(product), 5)
+
+    def test_closed_order_takes_no_items(self):
+        """Test items can't be added to a cancelled order, directly or coalesced, so no stock is held"""
+        product = self.create_product(stock=5)
+        Order.objects.filter(id=self.order.id).update(status='cancelled')
+        response = self.add_item(product, 2)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data["error"], "Order is cancelled.")
+        with override_settings(ORDER_ITEM_COALESCE=True, ORDER_ITEM_COALESCE_WINDOW_MS=0):
+            response = self.add_item(product, 2)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data["error"], "Order is cancelled.")
+        self.client.delete(f'/api/orders/{self.order.id}/delete/?access_token={self.token}')
+        self.assertEqual(inventory.available(product), 5)
+        self.assertEqual(OrderItem.objects.count(), 0)
+
+    def test_delete_item_twice_releases_once(self):
+        """Test deleting an item gives its stock back once, and a second delete is a 404"""
+        product = self.create_product(stock=5)
+        item_id = self.add_item(product, 2).data["id"]
+        url = f'/api/order-items/{item_id}/delete/'
+        self.assertEqual(self.client.delete(url, {"access_token": self.token}, format='json').status_code,
+                         status.HTTP_200_OK)
+        self.assertEqual(self.client.delete(url, {"access_token": self.token}, format='json').status_code,
+                         status.HTTP_404_NOT_FOUND)
+        self.assertEqual(inventory.available(product), 5)
+
+
+@skipUnless(connection.vendor == 'postgresql', "Needs concurrent writers (PostgreSQL).")
+class ConcurrentReservationTestCase(TransactionTestCase):
+    """Test concurrent buyers and a concurrent re-shard never oversell"""
+    def test_concurrent_buyers_never_oversell(self):
+        """Test twelve buyers of 3 units share 20 units while the product is re-sharded"""
+        token = 'omni_pretest_token'
+        order = Order.objects.create(order_number="ORD-001", total_price=0)
+        product = Product.objects.create(name="Widget", price=10)
+        inventory.set_stock(product, 20)
+        statuses = []
+
+        def buy():
+            try:
+                response = APIClient().post('/api/order-items/', {
+                    "access_token": token, "order_id": order.id, "product_id": product.id, "quantity": 3,
+                }, format='json')
+                statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        def reshard():
+            try:
+                APIClient().put(f'/api/products/{product.id}/update/', {"access_token": token, "stock_shards": 4},
+                                format='json')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy) for _ in range(12)] + [threading.Thread(target=reshard)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        sold = sum(OrderItem.objects.values_list('quantity', flat=True))
+        self.assertEqual(statuses.count(status.HTTP_201_CREATED) * 3, sold)
+        self.assertLessEqual(sold, 20)
+        self.assertEqual(sold + inventory.available(product), 20)
@@ -0,0 +1,152 @@
+from datetime import timedelta
+from unittest import mock
+from django.db import DatabaseError
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase, APIClient
+from rest_framework import status
+from . import jobs
+from .models import Job, Order
+
+class JobTestCase(APITestCase):
+    """Test case for the background job queue"""
+    def setUp(self):
+        self.client = APIClient()
+        self.valid_token = 'omni_pretest_token'
+
+    def test_bulk_import_inline(self):
+        """Test small bulk imports run inline and report bad rows"""
+        Order.objects.create(order_number="ORD-DUP", total_price=1.0)
+        data = {
+            "access_token": self.valid_token,
+            "orders": [
+                {"order_number": "ORD-BULK-1", "total_price": 10.0},
+                {"order_number": "ORD-DUP", "total_price": 20.0},
+                {"order_number": "ORD-BULK-2"},
+            ],
+        }
+        response = self.client.post('/api/orders/bulk/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["created"], 1)
+        self.assertEqual([e["index"] for e in response.data["errors"]], [1, 2])
+        self.assertEqual(Job.objects.count(), 0)
+
+    def test_bulk_import_rejects_bad_prices(self):
+        """Test prices that do not fit the column are reported per row, inline and queued"""
+        rows = [
+            {"order_number": "ORD-BIG", "total_price": "1e20"},
+            {"order_number": "ORD-NAN", "total_price": "NaN"},
+            {"order_number": "ORD-CENTS", "total_price": "1.005"},
+            {"order_number": "ORD-OK", "total_price": "12.50"},
+        ]
+        response = self.client.post('/api/orders/bulk/', {"access_token": self.valid_token, "orders": rows},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["created"], 1)
+        self.assertEqual([e["index"] for e in response.data["errors"]], [0, 1, 2])
+
+        job = jobs.enqueue('import_orders', {"orders": [dict(row, order_number=row["order_number"] + "-Q")
+                                                        for row in rows]})
+        jobs.work(burst=True)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(job.result["created"], 1)
+        self.assertEqual(set(Order.objects.values_list('order_number', flat=True)), {"ORD-OK", "ORD-OK-Q"})
+
+    @override_settings(JOB_SYNC_IMPORT_LIMIT=2)
+    def test_bulk_import_queued(self):
+        """Test large bulk imports return 202 and are completed by a worker"""
+        data = {
+            "access_token": self.valid_token,
+            "orders": [{"order_number": f"ORD-Q-{n}", "total_price": n} for n in range(5)],
+        }
+        response = self.client.post('/api/orders/bulk/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        job_id = response.data["job_id"]
+        self.assertEqual(Order.objects.count(), 0)
+
+        self.assertEqual(jobs.work(burst=True), 1)
+        self.assertEqual(Order.objects.count(), 5)
+
+        response = self.client.get(f'/api/jobs/{job_id}/?access_token={self.valid_token}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["status"], Job.SUCCEEDED)
+        self.assertEqual(response.data["progress"], {"done": 5, "total": 5})
+        self.assertEqual(response.data["result"]["created"], 5)
+
+    def test_get_nonexistent_job(self):
+        """Test retrieving a job that does not exist"""
+        response = self.client.get(f'/api/jobs/99999/?access_token={self.valid_token}')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(JOB_RETRY_BACKOFF=10)
+    def test_failed_job_retries_with_backoff(self):
+        """Test a failing job is rescheduled with backoff, then marked failed"""
+        @jobs.job_handler('always_fails')
+        def always_fails(job):
+            raise RuntimeError("boom")
+        self.addCleanup(jobs.HANDLERS.pop, 'always_fails')
+
+        job = jobs.enqueue('always_fails', max_attempts=2)
+        jobs.work(burst=True)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertEqual(job.attempts, 1)
+        self.assertIn("boom", job.error)
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=5))
+
+        # Not due yet, so the worker leaves it alone.
+        self.assertEqual(jobs.work(burst=True), 0)
+
+        Job.objects.filter(id=job.id).update(run_at=timezone.now())
+        jobs.work(burst=True)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+
+    def test_stale_running_job_is_reclaimed(self):
+        """Test jobs left running by a dead worker are picked up again"""
+        job = jobs.enqueue('import_orders', {"orders": [{"order_number": "ORD-STALE", "total_price": 1}]})
+        Job.objects.filter(id=job.id).update(
+            status=Job.RUNNING, locked_by="dead", locked_at=timezone.now() - timedelta(hours=1), attempts=1,
+        )
+        self.assertEqual(jobs.work(burst=True), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertTrue(Order.objects.filter(order_number="ORD-STALE").exists())
+
+    def test_stale_job_on_last_attempt_fails(self):
+        """Test a stale job that used up its attempts is failed, not run again"""
+        job = jobs.enqueue('import_orders', {"orders": [{"order_number": "ORD-STALE", "total_price": 1}]}, max_attempts=1)
+        Job.objects.filter(id=job.id).update(
+            status=Job.RUNNING, locked_by="dead", locked_at=timezone.now() - timedelta(hours=1), attempts=1,
+        )
+        self.assertEqual(jobs.work(burst=True), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIn("dead", job.error)
+        self.assertFalse(Order.objects.filter(order_number="ORD-STALE").exists())
+
+    def test_progress_is_a_heartbeat(self):
+        """Test progress updates refresh locked_at so a long job is not reclaimed"""
+        job = jobs.enqueue('import_orders', {"orders": []})
+        job = jobs.claim_job("worker")
+        Job.objects.filter(id=job.id).update(locked_at=timezone.now() - timedelta(hours=1))
+        job.set_progress(1, 2)
+        job.refresh_from_db()
+        self.assertGreater(job.locked_at, timezone.now() - timedelta(minutes=1))
+        self.assertIsNone(jobs.claim_job("other"))
+
+    def test_failed_outcome_save_keeps_worker_alive(self):
+        """Test a database error while recording a job's outcome is logged, not raised"""
+        job = jobs.enqueue('import_orders', {"orders": []})
+        job = jobs.claim_job("worker")
+        with mock.patch.object(Job, 'save', side_effect=DatabaseError("gone")), \
+                self.assertLogs('api.jobs', level='ERROR'):
+            jobs.run_job(job)
+
+    def test_purge_orders_queued(self):
+        """Test purge endpoint queues a purge job"""
+        response = self.client.post('/api/orders/purge/', {"access_token": self.valid_token}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(Job.objects.get(id=response.data["job_id"]).kind, 'purge_orders')
@@ -0,0 +1,113 @@
+import gzip
+import json
+import marshal
+import os
+import tempfile
+from unittest import skipUnless
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework import status
+from . import middleware
+from . import profiling
+from .middleware import accepted_encodings
+from .models import Order
+
+@override_settings(RESPONSE_COMPRESSION_MIN_BYTES=200)
+class CompressionTestCase(TestCase):
+    """Test case for response compression"""
+    def setUp(self):
+        self.client = APIClient()
+        self.url = '/api/orders/list/?access_token=omni_pretest_token'
+        Order.objects.bulk_create([Order(order_number=f"ORD-{n:04}", total_price=n) for n in range(50)])
+
+    def test_gzip(self):
+        """Test a large response is gzipped when accepted"""
+        plain = self.client.get(self.url)
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertLess(len(response.content), len(plain.content))
+
+    def test_not_accepted_or_small(self):
+        """Test responses stay uncompressed without gzip in Accept-Encoding or under the threshold"""
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip;q=0, identity')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        response = self.client.get(self.url + '&id=1', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    @skipUnless(middleware.brotli, "brotli is not installed")
+    def test_brotli_preferred(self):
+        """Test brotli is chosen over gzip when both are accepted"""
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(middleware.brotli.decompress(response.content), self.client.get(self.url).content)
+
+    def test_accepted_encodings(self):
+        """Test Accept-Encoding parsing with q-values"""
+        self.assertEqual(accepted_encodings('gzip;q=0.5, br;q=0, identity'), {'gzip', 'identity'})
+
+
+@override_settings(PROFILE_TOKEN='profile_secret', PROFILE_SAMPLE_INTERVAL_MS=0.5)
+class ProfilingTestCase(TestCase):
+    """Test case for request profiling"""
+    def setUp(self):
+        self.client = APIClient()
+        self.url = '/api/orders/list/?access_token=omni_pretest_token'
+        Order.objects.bulk_create([Order(order_number=f"ORD-{n:04}", total_price=n) for n in range(20)])
+        profiling.flame_graphs.reset()
+
+    def test_token_required(self):
+        """Test profiling needs the profiling token, and is ignored when none is configured"""
+        response = self.client.get(self.url + '&profile=cprofile', HTTP_X_PROFILE_TOKEN='wrong')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.get(self.url + '&profile=cprofile', HTTP_X_PROFILE_TOKEN='wrong\u00e9')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        # Only the header counts; a token in the URL is ignored.
+        response = self.client.get(self.url + '&profile=cprofile&profile_token=profile_secret')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        with override_settings(PROFILE_TOKEN=''):
+            response = self.client.get(self.url + '&profile=cprofile', HTTP_X_PROFILE_TOKEN='')
+        self.assertEqual(len(response.json()), 20)
+
+    def test_cprofile(self):
+        """Test a cProfile run returns pstats data plus SQL timing"""
+        response = self.client.get(self.url, HTTP_X_PROFILE='cprofile', HTTP_X_PROFILE_TOKEN='profile_secret')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Profiled-Status'], '200')
+        self.assertIn('sql;dur=', response['Server-Timing'])
+        stats = marshal.loads(response.content)
+        self.assertTrue(any(name == 'list_orders' for _, _, name in stats))
+
+    def test_sample_speedscope(self):
+        """Test a sampled run returns speedscope JSON with the SQL timeline"""
+        response = self.client.get(self.url + '&profile=sample', HTTP_X_PROFILE_TOKEN='profile_secret')
+        profile = json.loads(response.content)
+        self.assertEqual([p["type"] for p in profile["profiles"]], ["sampled", "evented"])
+        sql = profile["profiles"][1]["events"]
+        self.assertTrue(sql)
+        self.assertIn("api_order", profile["shared"]["frames"][sql[0]["frame"]]["name"])
+
+    def test_store(self):
+        """Test a stored profile leaves the response alone and is written to PROFILE_DIR"""
+        with tempfile.TemporaryDirectory() as directory, override_settings(PROFILE_DIR=directory):
+            response = self.client.get(self.url + '&profile=sample&profile_output=store',
+                                       HTTP_X_PROFILE_TOKEN='profile_secret')
+            self.assertEqual(len(response.json()), 20)
+            self.assertTrue(os.path.exists(os.path.join(directory, response['X-Profile-File'])))
+
+    @override_settings(PROFILE_SAMPLE_RATE=1)
+    def test_continuous_sampling(self):
+        """Test sampled requests are aggregated per view and can be exported and cleared"""
+        self.client.get(self.url)
+        self.client.get(self.url)
+        response = self.client.get('/api/profiles/', HTTP_X_PROFILE_TOKEN='profile_secret')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        names = [p["name"] for p in response.json()["profiles"]]
+        self.assertTrue(any(name.startswith("list_orders: 2 requests") for name in names))
+
+        self.client.delete('/api/profiles/', HTTP_X_PROFILE_TOKEN='profile_secret')
+        self.assertEqual(profiling.flame_graphs.views, {})
+        response = self.client.get('/api/profiles/', HTTP_X_PROFILE_TOKEN='wrong')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
@@ -1,7 +1,12 @@
 from rest_framework.test import APITestCase
 from rest_framework.test import APIClient
 from rest_framework import status
-from .models import Order
+from datetime import timedelta
+from django.core.management import call_command, CommandError
+from django.utils import timezone
+from django.test import override_settings
+from io import StringIO
+from .models import Order, OrderItem, Product
 
 class OrderTestCase(APITestCase):
     """Test case for Order API"""
@@ -155,4 +160,157 @@ class OrderTestCase(APITestCase):
         }
         response = self.client.delete(f'/api/orders/99999/delete/', data, format='json')
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
-        self.assertIn("error", response.data)
\ No newline at end of file
+        self.assertIn("error", response.data)
+
+    @override_settings(ORDER_SOFT_DELETE=True)
+    def test_soft_delete_order(self):
+        """Test soft delete keeps the row but hides it from the list views"""
+        order = Order.objects.create(order_number="ORD-SOFT", total_price=10.0)
+        product = Product.objects.create(name="Soft Product", price=5.0)
+        OrderItem.objects.create(order=order, product=product, quantity=1, price_at_order=5.0)
+        response = self.client.delete(f'/api/orders/{order.id}/delete/', {"access_token": self.valid_token}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Order.objects.deleted().count(), 1)
+
+        response = self.client.get('/api/orders/list/?access_token=omni_pretest_token')
+        self.assertEqual(len(response.data), 0)
+        response = self.client.get('/api/order-items/list/?access_token=omni_pretest_token')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        response = self.client.delete(f'/api/orders/{order.id}/delete/', {"access_token": self.valid_token}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(ORDER_SOFT_DELETE=True)
+    def test_soft_deleted_order_items_are_read_only(self):
+        """Test items of a soft-deleted order can no longer be updated or deleted"""
+        order = Order.objects.create(order_number="ORD-SOFT", total_price=10.0)
+        product = Product.objects.create(name="Soft Product", price=5.0)
+        item = OrderItem.objects.create(order=order, product=product, quantity=1, price_at_order=5.0)
+        self.client.delete(f'/api/orders/{order.id}/delete/', {"access_token": self.valid_token}, format='json')
+
+        data = {"access_token": self.valid_token, "quantity": 3}
+        response = self.client.put(f'/api/order-items/{item.id}/update/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.delete(f'/api/order-items/{item.id}/delete/', {"access_token": self.valid_token}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        item.refresh_from_db()
+        self.assertEqual(item.quantity, 1)
+
+    @override_settings(ORDER_SOFT_DELETE=True)
+    def test_purge_orders_command(self):
+        """Test purge_orders hard-deletes soft-deleted orders and their items in batches"""
+        product = Product.objects.create(name="Purge Product", price=5.0)
+        kept = Order.objects.create(order_number="ORD-KEEP", total_price=1.0)
+        for n in range(3):
+            order = Order.objects.create(order_number=f"ORD-PURGE-{n}", total_price=1.0)
+            for _ in range(3):
+                OrderItem.objects.create(order=order, product=product, quantity=1, price_at_order=5.0)
+            self.client.delete(f'/api/orders/{order.id}/delete/', {"access_token": self.valid_token}, format='json')
+        OrderItem.objects.create(order=kept, product=product, quantity=1, price_at_order=5.0)
+
+        out = StringIO()
+        call_command('purge_orders', batch_size=2, sleep=0, stdout=out)
+        self.assertIn("Purged 3 orders and 9 order items.", out.getvalue())
+        self.assertEqual(list(Order.objects.values_list('id', flat=True)), [kept.id])
+        self.assertEqual(OrderItem.objects.count(), 1)
+
+    def test_update_order_partial(self):
+        """Test updating only some fields leaves the others untouched and bumps the version"""
+        order = Order.objects.create(order_number="ORD-PARTIAL", total_price=10.0, customer_name="Amy")
+        data = {"access_token": self.valid_token, "note": "leave at door"}
+        response = self.client.put(f'/api/orders/{order.id}/update/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["version"], 2)
+        self.assertEqual(response["ETag"], '"2"')
+        order.refresh_from_db()
+        self.assertEqual(order.note, "leave at door")
+        self.assertEqual(order.customer_name, "Amy")
+        self.assertEqual(order.version, 2)
+
+    def test_update_order_stale_version(self):
+        """Test If-Match with a stale version returns 409 and changes nothing"""
+        order = Order.objects.create(order_number="ORD-STALE", total_price=10.0)
+        data = {"access_token": self.valid_token, "total_price": 20.0}
+        response = self.client.put(f'/api/orders/{order.id}/update/', data, format='json', HTTP_IF_MATCH='"1"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.put(f'/api/orders/{order.id}/update/', data, format='json', HTTP_IF_MATCH='"1"')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data["version"], 2)
+
+    def test_update_order_if_match_any(self):
+        """Test If-Match: * accepts whatever the current version is"""
+        order = Order.objects.create(order_number="ORD-ANY", total_price=10.0)
+        data = {"access_token": self.valid_token, "note": "any"}
+        response = self.client.put(f'/api/orders/{order.id}/update/', data, format='json', HTTP_IF_MATCH='*')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["version"], 2)
+
+    def test_update_order_invalid_values(self):
+        """Test malformed field values are rejected with 400 before anything is written"""
+        order = Order.objects.create(order_number="ORD-BAD", total_price=10.0)
+        url = f'/api/orders/{order.id}/update/'
+        for data in ({"order_number": None}, {"order_number": ""}, {"status": ["paid"]},
+                     {"status": {"a": 1}}, {"total_price": "abc"}, {"total_price": "NaN"},
+                     {"total_price": "1e20"}, {"total_price": "1.005"}, {"note": None}):
+            response = self.client.put(url, {"access_token": self.valid_token, **data}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, data)
+            self.assertNotIn("already exists", str(response.data["error"]))
+        order.refresh_from_db()
+        self.assertEqual(order.version, 1)
+
+    def test_update_order_status_transitions(self):
+        """Test status changes are validated against the transition table"""
+        order = Order.objects.create(order_number="ORD-STATUS", total_price=10.0)
+        url = f'/api/orders/{order.id}/update/'
+        response = self.client.put(url, {"access_token": self.valid_token, "status": "shipped"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.put(url, {"access_token": self.valid_token, "status": "paid"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.put(url, {"access_token": self.valid_token, "status": "shipped"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        order.refresh_from_db()
+        self.assertEqual(order.status, "shipped")
+
+    def test_update_order_duplicate_number(self):
+        """Test renaming an order to an existing order_number"""
+        Order.objects.create(order_number="ORD-TAKEN", total_price=1.0)
+        order = Order.objects.create(order_number="ORD-FREE", total_price=1.0)
+        data = {"access_token": self.valid_token, "order_number": "ORD-TAKEN"}
+        response = self.client.put(f'/api/orders/{order.id}/update/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data["error"], "Order number already exists.")
+
+    def test_list_orders_created_range(self):
+        """Test filtering orders by created_after / created_before"""
+        old = Order.objects.create(order_number="ORD-OLD", total_price=1.0)
+        Order.objects.filter(id=old.id).update(created_time=timezone.now() - timedelta(days=40))
+        Order.objects.create(order_number="ORD-NEW", total_price=1.0)
+        since = (timezone.now() - timedelta(days=1)).date().isoformat()
+        response = self.client.get(f'/api/orders/list/?created_after={since}&access_token=omni_pretest_token')
+        self.assertEqual([o["order_number"] for o in response.data], ["ORD-NEW"])
+        response = self.client.get(f'/api/orders/list/?created_before={since}&access_token=omni_pretest_token')
+        self.assertEqual([o["order_number"] for o in response.data], ["ORD-OLD"])
+        response = self.client.get('/api/orders/list/?created_after=yesterday&access_token=omni_pretest_token')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_partition_orders_requires_postgres(self):
+        """Test partition management refuses to run on other databases"""
+        with self.assertRaisesMessage(CommandError, "Partitioning requires PostgreSQL."):
+            call_command('partition_orders', stdout=StringIO())
+
+    def test_list_orders_fields_and_columnar(self):
+        """Test ?fields= and ?shape=columnar on the order list"""
+        order = Order.objects.create(order_number="ORD-TEST-001", total_price=99.99)
+        response = self.client.get(f'/api/orders/list/?fields=order_id,total_price&access_token={self.valid_token}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [{"order_id": order.id, "total_price": 99.99}])
+
+        response = self.client.get(
+            f'/api/orders/list/?fields=order_number,status&shape=columnar&access_token={self.valid_token}')
+        self.assertEqual(response.data, {"fields": ["order_number", "status"], "rows": [["ORD-TEST-001", "pending"]]})
+
+    def test_list_orders_invalid_fields(self):
+        """Test an unknown field or shape"""
+        for query in ('fields=order_id,secret', 'shape=csv'):
+            response = self.client.get(f'/api/orders/list/?{query}&access_token={self.valid_token}')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
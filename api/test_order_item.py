@@ -1,7 +1,11 @@
-from django.test import TestCase
+from unittest import mock
+from django.db import DatabaseError, IntegrityError
+from django.test import TestCase, override_settings
 from rest_framework.test import APIClient
 from rest_framework import status
-from .models import Order, Product, OrderItem
+from . import coalescing
+from . import inventory
+from .models import ChangeEvent, Order, Product, OrderItem
 
 class OrderItemTestCase(TestCase):
     def setUp(self):
@@ -149,4 +153,125 @@ class OrderItemTestCase(TestCase):
             price_at_order=25.50
         )
         expected_subtotal = 3 * 25.50
-        self.assertEqual(item.subtotal(), expected_subtotal)
\ No newline at end of file
+        self.assertEqual(item.subtotal(), expected_subtotal)
+
+    def test_order_item_copies_order_created_time(self):
+        """Test items carry their order's created_time as the partition key"""
+        item = OrderItem.objects.create(order=self.order, product=self.product, quantity=1, price_at_order=50.0)
+        self.assertEqual(item.order_created_time, self.order.created_time)
+
+    def test_list_order_items_columnar(self):
+        """Test the columnar shape with a sparse fieldset"""
+        item = OrderItem.objects.create(order=self.order, product=self.product, quantity=3, price_at_order=50.0)
+        response = self.client.get(
+            f"/api/order-items/list/?fields=id,quantity,price_at_order&shape=columnar&access_token={self.token}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {"fields": ["id", "quantity", "price_at_order"], "rows": [[item.id, 3, 50.0]]})
+
+    @override_settings(ORDER_ITEM_COALESCE=True, ORDER_ITEM_COALESCE_WINDOW_MS=0)
+    def test_create_order_item_coalesced(self):
+        """Test coalesced creates return their own id or error"""
+        data = {"access_token": self.token, "order_id": self.order.id, "product_id": self.product.id, "quantity": 2}
+        response = self.client.post("/api/order-items/", data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        item = OrderItem.objects.get(id=response.data["id"])
+        self.assertEqual(item.order_created_time, self.order.created_time)
+        self.assertEqual(float(item.price_at_order), 50.0)
+        self.assertTrue(ChangeEvent.objects.filter(model='order_item', object_id=item.id).exists())
+
+        response = self.client.post("/api/order-items/", {**data, "order_id": 9999}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(ORDER_ITEM_COALESCE=True, ORDER_ITEM_COALESCE_WINDOW_MS=0, ORDER_ITEM_COALESCE_DURABLE=False)
+    def test_create_order_item_coalesced_not_durable(self):
+        """Test the non-durable mode answers 202"""
+        data = {"access_token": self.token, "order_id": self.order.id, "product_id": self.product.id, "quantity": 2}
+        response = self.client.post("/api/order-items/", data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(OrderItem.objects.count(), 1)
+
+    def test_coalesced_batch_isolates_errors(self):
+        """Test one bad row in a batch fails only its own future"""
+        buffer = coalescing.ItemBuffer()
+        good, lead = buffer.submit(self.order.id, self.product.id, 1)
+        self.assertTrue(lead)
+        bad, lead = buffer.submit(self.order.id, self.product.id, -1)
+        self.assertFalse(lead)
+        missing, _ = buffer.submit(self.order.id, 9999, 1)
+        buffer.flush()
+
+        self.assertEqual(good.result().quantity, 1)
+        self.assertIsInstance(bad.exception(), IntegrityError)
+        self.assertIsInstance(missing.exception(), Product.DoesNotExist)
+        self.assertEqual(OrderItem.objects.count(), 1)
+
+    @override_settings(ORDER_ITEM_COALESCE_MAX_PENDING=1, ORDER_ITEM_COALESCE_QUEUE_TIMEOUT=0)
+    def test_coalesced_back_pressure(self):
+        """Test a full buffer rejects new items"""
+        buffer = coalescing.ItemBuffer()
+        buffer.submit(self.order.id, self.product.id, 1)
+        with self.assertRaises(coalescing.BufferFull):
+            buffer.submit(self.order.id, self.product.id, 1)
+
+    @override_settings(ORDER_ITEM_COALESCE_RESULT_TIMEOUT=0)
+    def test_coalesced_follower_falls_back_to_direct_insert(self):
+        """Test a follower whose leader never writes inserts its own item"""
+        buffer = coalescing.ItemBuffer()
+        _, lead = buffer.submit(self.order.id, self.product.id, 1)
+        self.assertTrue(lead)
+        follower, _ = buffer.submit(self.order.id, self.product.id, 3)
+        item = coalescing.result(follower, buffer)
+        self.assertEqual(item.quantity, 3)
+        self.assertEqual(OrderItem.objects.get().id, item.id)
+        self.assertEqual(len(buffer.pending), 1)
+
+    def test_coalesced_leader_death_fails_its_batch(self):
+        """Test a leader dying mid-write fails its batch's futures and gives up leading"""
+        buffer = coalescing.ItemBuffer()
+        first, _ = buffer.submit(self.order.id, self.product.id, 1)
+        second, _ = buffer.submit(self.order.id, self.product.id, 2)
+        with mock.patch.object(coalescing, 'write_items', side_effect=KeyboardInterrupt), \
+                self.assertLogs('api.coalescing', 'ERROR'), self.assertRaises(KeyboardInterrupt):
+            buffer.lead()
+        self.assertIsInstance(first.exception(timeout=0), DatabaseError)
+        self.assertIsInstance(second.exception(timeout=0), DatabaseError)
+        self.assertFalse(buffer.leading)
+        _, lead = buffer.submit(self.order.id, self.product.id, 1)
+        self.assertTrue(lead)
+
+    def test_coalesced_failure_partway_resolves_every_future(self):
+        """Test a database error partway through a batch still resolves the entries after it"""
+        reserve = inventory.reserve
+
+        def failing_reserve(product, quantity):
+            if quantity == 2:
+                raise DatabaseError("boom")
+            return reserve(product, quantity)
+
+        buffer = coalescing.ItemBuffer()
+        futures = [buffer.submit(self.order.id, self.product.id, quantity)[0] for quantity in (1, 2, 3)]
+        with mock.patch.object(inventory, 'reserve', side_effect=failing_reserve), \
+                self.assertLogs('api.coalescing', 'ERROR'):
+            buffer.flush()
+        self.assertEqual(futures[0].result(timeout=0).quantity, 1)
+        self.assertIsInstance(futures[1].exception(timeout=0), DatabaseError)
+        self.assertEqual(futures[2].result(timeout=0).quantity, 3)
+        self.assertEqual(sorted(OrderItem.objects.values_list('quantity', flat=True)), [1, 3])
+
+    @override_settings(ORDER_ITEM_COALESCE_MAX_BATCH=1, ORDER_ITEM_COALESCE_WINDOW_MS=0)
+    def test_coalesced_leader_hands_over_after_one_batch(self):
+        """Test the leader writes one batch, then a waiting request takes over the rest"""
+        buffer = coalescing.ItemBuffer()
+        first, lead = buffer.submit(self.order.id, self.product.id, 1)
+        self.assertTrue(lead)
+        second, _ = buffer.submit(self.order.id, self.product.id, 2)
+        buffer.waiting = 1  # As if the second request were blocked in wait().
+        buffer.lead()
+        self.assertTrue(first.done())
+        self.assertFalse(second.done())
+        self.assertFalse(buffer.leading)
+
+        buffer.waiting = 0
+        self.assertEqual(coalescing.result(second, buffer).quantity, 2)
+        self.assertEqual(buffer.pending, [])
+        self.assertFalse(buffer.leading)
@@ -0,0 +1,157 @@
+import importlib
+from datetime import timedelta
+from unittest import skipUnless
+from django.apps import apps
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase
+from django.utils import timezone
+from . import partitioning
+from .models import Order, OrderItem, Product, Tenant
+from .tenancy import tenant_context
+
+# api_order_number and its trigger as convert_to_partitioned created them before tenants (0010).
+PRE_TENANT_ORDER_NUMBER = [
+    "DROP TRIGGER api_order_number_sync ON api_order",
+    "DROP TABLE api_order_number",
+    "CREATE TABLE api_order_number (order_number varchar(100) PRIMARY KEY)",
+    "INSERT INTO api_order_number SELECT order_number FROM api_order",
+    """
+    CREATE OR REPLACE FUNCTION api_order_number_sync() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            DELETE FROM api_order_number WHERE order_number = OLD.order_number;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO api_order_number VALUES (NEW.order_number);
+        END IF;
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql
+    """,
+    "CREATE TRIGGER api_order_number_sync AFTER INSERT OR DELETE OR UPDATE OF order_number "
+    "ON api_order FOR EACH ROW EXECUTE FUNCTION api_order_number_sync()",
+]
+
+@skipUnless(connection.vendor == 'postgresql', "Partitioning requires PostgreSQL.")
+class PartitioningTestCase(TestCase):
+    """Test case for converting orders and items to partitioned tables"""
+    def setUp(self):
+        self.product = Product.objects.create(name="Widget", price=5)
+        now = timezone.now()
+        for months_ago in (0, 1, 14):
+            self.create_order(f"ORD-{months_ago}", now - timedelta(days=31 * months_ago), items=2)
+
+    def create_order(self, order_number, created_time, items=1):
+        order = Order.objects.create(order_number=order_number, total_price=10)
+        Order.objects.filter(id=order.id).update(created_time=created_time)
+        order.refresh_from_db()
+        for _ in range(items):
+            OrderItem.objects.create(order=order, product=self.product, quantity=1, price_at_order=5)
+        return order
+
+    def partition_of(self, table, row_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT tableoid::regclass::text FROM {table} WHERE id = %s", [row_id])
+            return cursor.fetchone()[0]
+
+    def check_constraints(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+            cursor.execute("SET CONSTRAINTS ALL DEFERRED")
+
+    def test_convert_populated_tables(self):
+        """Test conversion keeps every row, the item foreign key and order_number uniqueness"""
+        self.assertEqual(partitioning.convert_to_partitioned(months_ahead=1), ['api_order', 'api_orderitem'])
+        self.assertTrue(partitioning.is_partitioned('api_order'))
+        self.assertTrue(partitioning.is_partitioned('api_orderitem'))
+        self.assertEqual(Order.objects.count(), 3)
+        self.assertEqual(OrderItem.objects.count(), 6)
+        old = Order.objects.get(order_number="ORD-14")
+        months = [month for month, _ in partitioning.list_partitions('api_order')]
+        self.assertEqual(months[0], partitioning.month_start(old.created_time))
+        self.assertEqual(months[-1], partitioning.add_months(partitioning.month_start(timezone.now()), 1))
+        self.assertEqual(len(months), len(partitioning.list_partitions('api_orderitem')))
+        self.assertEqual(self.partition_of('api_order', old.id),
+                         partitioning.partition_name('api_order', partitioning.month_start(old.created_time)))
+        self.assertEqual(partitioning.convert_to_partitioned(), [])
+
+        # New rows still get ids and land in their month.
+        order = self.create_order("ORD-NEW", timezone.now())
+        self.assertGreater(order.id, old.id)
+        self.check_constraints()
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Order.objects.create(order_number="ORD-NEW", total_price=1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "INSERT INTO api_orderitem (order_id, order_created_time, product_id, quantity, price_at_order, tenant_id) "
+                    "VALUES (%s, %s, %s, 1, 5, 1)",
+                    [old.id + 1000, old.created_time, self.product.id],
+                )
+            self.check_constraints()
+
+    def test_future_partition_takes_rows_from_default(self):
+        """Test a new partition moves in the rows that had landed in the DEFAULT partition"""
+        partitioning.convert_to_partitioned(months_ahead=0)
+        later = partitioning.add_months(partitioning.month_start(timezone.now()), 2) + timedelta(days=3)
+        order = self.create_order("ORD-LATER", later, items=2)
+        self.assertEqual(self.partition_of('api_order', order.id), 'api_order_default')
+
+        partitioning.ensure_future_partitions(months_ahead=3)
+        self.check_constraints()
+        self.assertEqual(self.partition_of('api_order', order.id), partitioning.partition_name('api_order', later))
+        for item in order.items.all():
+            self.assertEqual(self.partition_of('api_orderitem', item.id),
+                             partitioning.partition_name('api_orderitem', later))
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Order.objects.create(order_number="ORD-LATER", total_price=1)
+
+    def test_detach_old_month(self):
+        """Test detaching a month removes it from both tables and keeps its rows in the archive schema"""
+        partitioning.convert_to_partitioned(months_ahead=1)
+        self.check_constraints()
+        old = Order.objects.get(order_number="ORD-14")
+        month = partitioning.month_start(old.created_time)
+        names = [partitioning.partition_name(table, month) for table in ('api_orderitem', 'api_order')]
+
+        detached = partitioning.detach_partitions(partitioning.add_months(month, 1), archive_schema='archive')
+        self.assertEqual(detached, names)
+        for table in ('api_order', 'api_orderitem'):
+            self.assertNotIn(month, [m for m, _ in partitioning.list_partitions(table)])
+        self.assertFalse(Order.objects.filter(id=old.id).exists())
+        self.assertEqual(OrderItem.objects.count(), 4)
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM archive.{names[0]}")
+            self.assertEqual(cursor.fetchone()[0], 2)
+            cursor.execute(f"SELECT COUNT(*) FROM archive.{names[1]}")
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute(
+                "SELECT COUNT(*) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f' "
+                "AND confrelid = 'api_order'::regclass",
+                [f"archive.{names[0]}"],
+            )
+            self.assertEqual(cursor.fetchone()[0], 0)
+        self.check_constraints()
+
+    def test_tenant_migration_on_partitioned_tables(self):
+        """Test migration 0010 leaves a partitioned install with per-tenant order numbers"""
+        partitioning.convert_to_partitioned(months_ahead=1)
+        with connection.cursor() as cursor:
+            for sql in PRE_TENANT_ORDER_NUMBER:
+                cursor.execute(sql)
+        migration = importlib.import_module('api.migrations.0010_tenants')
+        with connection.schema_editor() as schema_editor:
+            migration.order_number_unique_per_tenant(apps, schema_editor)
+
+        other = Tenant.objects.create(name="other")
+        with tenant_context(other.id):
+            moved = Order.objects.create(order_number="ORD-0", total_price=1)
+            Order.objects.create(order_number="ORD-OTHER", total_price=1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Order.objects.create(order_number="ORD-1", total_price=1)
+        # Moving an order to another tenant re-checks its number there.
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Order.all_tenants.filter(id=moved.id).update(tenant_id=1)
+        Order.all_tenants.filter(order_number="ORD-OTHER").update(tenant_id=1)
+        with tenant_context(other.id):
+            Order.objects.create(order_number="ORD-OTHER", total_price=1)
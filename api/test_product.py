@@ -111,4 +111,42 @@ class ProductTestCase(APITestCase):
         }
         response = self.client.delete(f'/api/products/99999/delete/', data, format='json')
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
-        self.assertIn("error", response.data)
\ No newline at end of file
+        self.assertIn("error", response.data)
+
+    def test_search_products(self):
+        """Test searching products ranks name-prefix matches first"""
+        Product.objects.create(name="Red Apple Juice", price=3.0)
+        Product.objects.create(name="Apple Pie", price=5.0)
+        Product.objects.create(name="Banana", price=1.0)
+        response = self.client.get('/api/products/search/?q=appl&access_token=omni_pretest_token')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        names = [p["name"] for p in response.data["results"]]
+        self.assertEqual(names, ["Apple Pie", "Red Apple Juice"])
+        self.assertIsNone(response.data["next_offset"])
+
+    def test_search_products_all_terms_and_pagination(self):
+        """Test every term must match and results page with limit/offset"""
+        for n in range(3):
+            Product.objects.create(name=f"Green Tea {n}", price=1.0)
+        Product.objects.create(name="Green Apple", price=1.0)
+        response = self.client.get('/api/products/search/?q=green+tea&limit=2&access_token=omni_pretest_token')
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertEqual(response.data["next_offset"], 2)
+        response = self.client.get('/api/products/search/?q=green+tea&limit=2&offset=2&access_token=omni_pretest_token')
+        self.assertEqual([p["name"] for p in response.data["results"]], ["Green Tea 2"])
+        self.assertIsNone(response.data["next_offset"])
+
+    def test_search_products_missing_query(self):
+        """Test searching without a query"""
+        response = self.client.get('/api/products/search/?access_token=omni_pretest_token')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_autocomplete_products(self):
+        """Test autocomplete returns names starting with the prefix, ignoring case"""
+        Product.objects.create(name="Mango", price=1.0)
+        Product.objects.create(name="mandarin", price=1.0)
+        Product.objects.create(name="Green Mango", price=1.0)
+        response = self.client.get('/api/products/autocomplete/?prefix=MAN&access_token=omni_pretest_token')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([p["name"] for p in response.data], ["mandarin", "Mango"])
+
@@ -0,0 +1,83 @@
+from unittest import mock
+from django.conf import settings
+from django.db import connections
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework import status
+from unittest import skipUnless
+from . import routers
+from .models import Order
+
+@override_settings(REPLICA_DATABASE='replica')
+class ReplicaRouterTestCase(TestCase):
+    """Test case for read-replica routing"""
+    def setUp(self):
+        self.router = routers.ReplicaRouter()
+        self.client = APIClient()
+        self.token = 'omni_pretest_token'
+        lag = mock.patch.object(routers, 'replica_lag', return_value=0.0)
+        self.replica_lag = lag.start()
+        self.addCleanup(lag.stop)
+
+    def test_reads_go_to_primary_by_default(self):
+        """Test reads outside read_from_replica() use the primary"""
+        self.assertEqual(self.router.db_for_read(Order), 'default')
+
+    def test_replica_reads(self):
+        """Test reads inside read_from_replica() use the replica, writes never do"""
+        with routers.read_from_replica():
+            self.assertEqual(self.router.db_for_read(Order), 'replica')
+            self.assertEqual(self.router.db_for_write(Order), 'default')
+        self.assertEqual(self.router.db_for_read(Order), 'default')
+
+    def test_lagging_replica_falls_back_to_primary(self):
+        """Test reads fall back to the primary while the replica lags"""
+        self.replica_lag.return_value = settings.REPLICA_MAX_LAG_SECONDS + 1
+        with routers.read_from_replica():
+            self.assertEqual(self.router.db_for_read(Order), 'default')
+
+    @override_settings(REPLICA_DATABASE=None)
+    def test_no_replica_configured(self):
+        """Test reads use the primary when no replica is configured"""
+        with routers.read_from_replica():
+            self.assertEqual(self.router.db_for_read(Order), 'default')
+
+    def test_write_pins_client_to_primary(self):
+        """Test a successful write pins that client, and only that client, to the primary"""
+        data = {"access_token": self.token, "order_number": "ORD-STICKY", "total_price": 1.0}
+        response = self.client.post('/api/orders/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        sticky = response[routers.STICKY_HEADER]
+        self.assertEqual(response.cookies[routers.STICKY_COOKIE].value, sticky)
+
+        factory = RequestFactory()
+        self.assertTrue(routers.recently_wrote(factory.get('/', HTTP_X_REPLICA_STICKY=sticky)))
+        cookie_request = factory.get('/')
+        cookie_request.COOKIES[routers.STICKY_COOKIE] = sticky
+        self.assertTrue(routers.recently_wrote(cookie_request))
+        # Another client with the same access token still reads from the replica.
+        self.assertFalse(routers.recently_wrote(factory.get('/')))
+        self.assertFalse(routers.recently_wrote(factory.get('/', HTTP_X_REPLICA_STICKY=sticky + 'x')))
+        with override_settings(REPLICA_STICKY_SECONDS=-1):
+            self.assertFalse(routers.recently_wrote(factory.get('/', HTTP_X_REPLICA_STICKY=sticky)))
+
+    def test_failed_write_does_not_pin_client(self):
+        """Test a rejected write leaves the client on the replica"""
+        response = self.client.post('/api/orders/', {"access_token": self.token}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(response.has_header(routers.STICKY_HEADER))
+
+
+@skipUnless('replica' in settings.DATABASES, "No replica database configured.")
+class ReplicaDatabaseTestCase(TransactionTestCase):
+    """Test list views against a real (or mirrored) replica connection"""
+    # The replica is a separate connection, so rows must be committed to be seen.
+    databases = '__all__'
+
+    def test_list_orders_reads_from_replica(self):
+        Order.objects.create(order_number="ORD-REPLICA", total_price=1.0)
+        with CaptureQueriesContext(connections['replica']) as queries:
+            response = APIClient().get('/api/orders/list/?access_token=omni_pretest_token')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(queries.captured_queries)
@@ -0,0 +1,109 @@
+from io import StringIO
+from django.core.management import call_command
+from django.test import override_settings
+from rest_framework.test import APITestCase, APIClient
+from rest_framework import status
+from . import coalescing, jobs, tenancy
+from .models import ChangeEvent, Job, Order, OrderItem, Product, Tenant
+from .tenancy import hash_token, tenant_context
+
+@override_settings(CHANGE_FEED_SETTLE_SECONDS=0)
+class TenantTestCase(APITestCase):
+    """Test case for tenant isolation"""
+    def setUp(self):
+        self.client = APIClient()
+        self.default_token = 'omni_pretest_token'
+        self.other_token = 'other_tenant_token'
+        self.other = Tenant.objects.create(name="other", token_hash=hash_token(self.other_token))
+        tenancy._token_cache.clear()
+
+    def post(self, path, token, **data):
+        return self.client.post(path, {"access_token": token, **data}, format='json')
+
+    def test_lists_are_isolated(self):
+        """Test each token only sees its own tenant's rows"""
+        self.post('/api/orders/', self.default_token, order_number="ORD-1", total_price=10)
+        self.post('/api/orders/', self.other_token, order_number="ORD-2", total_price=20)
+        self.post('/api/products/', self.other_token, name="Other Widget", price=5)
+
+        response = self.client.get(f'/api/orders/list/?access_token={self.other_token}')
+        self.assertEqual([o["order_number"] for o in response.data], ["ORD-2"])
+        response = self.client.get(f'/api/products/list/?access_token={self.default_token}')
+        self.assertEqual(response.data, [])
+        self.assertEqual(Order.objects.get(order_number="ORD-2").tenant_id, self.other.id)
+
+    def test_other_tenants_rows_are_not_found(self):
+        """Test a tenant cannot update or delete another tenant's rows"""
+        order = Order.objects.create(order_number="ORD-1", total_price=10)
+        response = self.client.put(f'/api/orders/{order.id}/update/', {"access_token": self.other_token, "status": "paid"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.delete(f'/api/orders/{order.id}/delete/?access_token={self.other_token}')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertTrue(Order.objects.alive().filter(id=order.id).exists())
+
+    def test_order_number_is_unique_per_tenant(self):
+        """Test the same order number can be used by two tenants, but not twice by one"""
+        response = self.post('/api/orders/', self.default_token, order_number="ORD-SAME", total_price=10)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.post('/api/orders/', self.other_token, order_number="ORD-SAME", total_price=10)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.post('/api/orders/', self.other_token, order_number="ORD-SAME", total_price=10)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Order.objects.filter(order_number="ORD-SAME").count(), 2)
+
+    def test_unknown_token(self):
+        """Test a token that belongs to no tenant is rejected"""
+        response = self.client.get('/api/orders/list/?access_token=nobody')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_token_lookups_are_cached(self):
+        """Test a resolved token needs no query until it is forgotten"""
+        self.assertEqual(tenancy.tenant_for_token(self.other_token), self.other.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(tenancy.tenant_for_token(self.other_token), self.other.id)
+            self.assertEqual(tenancy.tenant_for_token(self.default_token), tenancy.DEFAULT_TENANT_ID)
+        self.other.delete()
+        tenancy.forget_token(self.other_token)
+        self.assertIsNone(tenancy.tenant_for_token(self.other_token))
+
+    def test_jobs_run_in_their_tenant(self):
+        """Test a queued job writes rows for the tenant that queued it"""
+        with tenant_context(self.other.id):
+            job = jobs.enqueue('import_orders', {"orders": [{"order_number": "ORD-JOB", "total_price": 1}]})
+        self.assertEqual(job.tenant_id, self.other.id)
+        self.assertEqual(jobs.work(burst=True), 1)
+        self.assertEqual(Order.objects.get(order_number="ORD-JOB").tenant_id, self.other.id)
+        response = self.client.get(f'/api/jobs/{job.id}/?access_token={self.default_token}')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_change_feed_is_isolated(self):
+        """Test the changes feed only carries the caller's tenant"""
+        self.post('/api/orders/', self.default_token, order_number="ORD-1", total_price=10)
+        self.post('/api/orders/', self.other_token, order_number="ORD-2", total_price=20)
+        response = self.client.get(f'/api/changes/?access_token={self.other_token}')
+        self.assertEqual([c["data"]["order_number"] for c in response.data["changes"]], ["ORD-2"])
+        self.assertEqual(ChangeEvent.objects.filter(tenant=self.other).count(), 1)
+
+    def test_coalesced_items_check_the_tenant(self):
+        """Test a coalesced batch rejects another tenant's product"""
+        order = Order.objects.create(order_number="ORD-1", total_price=10)
+        product = Product.objects.create(name="Widget", price=5)
+        with tenant_context(self.other.id):
+            other_product = Product.objects.create(name="Other Widget", price=5)
+        buffer = coalescing.ItemBuffer()
+        good, _ = buffer.submit(order.id, product.id, 1)
+        foreign, _ = buffer.submit(order.id, other_product.id, 1)
+        buffer.flush()
+
+        self.assertEqual(good.result().tenant_id, tenancy.DEFAULT_TENANT_ID)
+        self.assertIsInstance(foreign.exception(), Product.DoesNotExist)
+        self.assertEqual(OrderItem.objects.count(), 1)
+
+    def test_create_tenant_command(self):
+        """Test create_tenant prints a token that authenticates as the new tenant"""
+        out = StringIO()
+        call_command('create_tenant', 'acme', stdout=out)
+        token = out.getvalue().strip().rsplit(' ', 1)[-1]
+        tenant = Tenant.objects.get(name='acme')
+        self.assertEqual(tenancy.tenant_for_token(token), tenant.id)
+        self.assertNotEqual(tenant.token_hash, token)
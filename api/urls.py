@@ -1,17 +1,25 @@
-from django.contrib import admin
 from django.urls import path
 from api.views import list_orders, import_order, update_order, delete_order
 from api.views import list_products, create_product, update_product, delete_product
 from api.views import create_order_item, list_order_items, update_order_item, delete_order_item
+from api.views import import_orders_bulk, purge_orders, get_job
+from api.views import list_changes
+from api.views import search_products, autocomplete_products
+from api.views import revenue_report, item_report
+from api.views import sampled_profiles
 
 urlpatterns = [
     path('orders/', import_order, name='import_order'),
+    path('orders/bulk/', import_orders_bulk, name='import_orders_bulk'),
+    path('orders/purge/', purge_orders, name='purge_orders'),
     path('orders/list/', list_orders, name='list_orders'),
     path('orders/<int:order_id>/update/', update_order, name='update_order'),
     path('orders/<int:order_id>/delete/', delete_order, name='delete_order'),
 
     path('products/', create_product, name='create_product'),
     path('products/list/', list_products, name='list_products'),
+    path('products/search/', search_products, name='search_products'),
+    path('products/autocomplete/', autocomplete_products, name='autocomplete_products'),
     path('products/<int:product_id>/update/', update_product, name='update_product'),
     path('products/<int:product_id>/delete/', delete_product, name='delete_product'),
 
@@ -19,4 +27,13 @@ urlpatterns = [
     path('order-items/list/', list_order_items, name='list_order_items'),
     path('order-items/<int:item_id>/update/', update_order_item, name='update_order_item'),
     path('order-items/<int:item_id>/delete/', delete_order_item, name='delete_order_item'),
+
+    path('jobs/<int:job_id>/', get_job, name='get_job'),
+
+    path('changes/', list_changes, name='list_changes'),
+
+    path('reports/revenue/', revenue_report, name='revenue_report'),
+    path('reports/items/', item_report, name='item_report'),
+
+    path('profiles/', sampled_profiles, name='sampled_profiles'),
 ]
\ No newline at end of file
@@ -1,15 +1,28 @@
-from .decorators import require_token
-import os
-from dotenv import load_dotenv
+from .decorators import require_token, replica_read
+from datetime import datetime, time
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import DataError, IntegrityError, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
 from .models import Order
 from .models import Product
 from .models import OrderItem
-
-load_dotenv()
-ACCEPTED_TOKEN = os.getenv("ACCEPTED_TOKEN")
+from .models import Job
+from .models import ChangeEvent
+from . import archive
+from . import changes
+from . import coalescing
+from . import inventory
+from . import jobs
+from . import profiling
+from . import search
+from . import shaping
 
 
 @api_view(['POST'])
@@ -26,10 +39,12 @@ def import_order(request):
     if Order.objects.filter(order_number=order_number).exists():
         return Response({"error": "Order number already exists."}, status=status.HTTP_400_BAD_REQUEST)
 
-    order = Order.objects.create(
-        order_number=order_number,
-        total_price=total_price
-    )
+    with transaction.atomic():
+        order = Order.objects.create(
+            order_number=order_number,
+            total_price=total_price
+        )
+        changes.record(ChangeEvent.CREATE, [order])
 
     return Response({
         "message": "Order imported successfully.",
@@ -37,14 +52,98 @@ def import_order(request):
         "order_number": order.order_number
     }, status=status.HTTP_201_CREATED)
 
+@api_view(['POST'])
+@require_token
+def import_orders_bulk(request):
+    """
+    Import many orders at once.
+    - Small payloads are imported inline and return 201 with the result.
+    - Large payloads, or ?async=true, are queued and return 202 with a job id.
+    """
+    rows = request.data.get('orders')
+    if not isinstance(rows, list) or not rows:
+        return Response({"error": "Missing required fields."}, status=status.HTTP_400_BAD_REQUEST)
+
+    run_async = str(request.data.get('async') or request.query_params.get('async', '')).lower() == 'true'
+    if run_async or len(rows) > settings.JOB_SYNC_IMPORT_LIMIT:
+        job = jobs.enqueue('import_orders', {"orders": rows})
+        return Response({
+            "message": "Import queued.",
+            "job_id": job.id,
+        }, status=status.HTTP_202_ACCEPTED)
+
+    result = jobs.import_order_rows(rows)
+    return Response({"message": "Orders imported.", **result}, status=status.HTTP_201_CREATED)
+
+@api_view(['POST'])
+@require_token
+def purge_orders(request):
+    """Queue a background purge of soft-deleted orders."""
+    job = jobs.enqueue('purge_orders')
+    return Response({"message": "Purge queued.", "job_id": job.id}, status=status.HTTP_202_ACCEPTED)
+
 @api_view(['GET'])
 @require_token
+def get_job(request, job_id):
+    """Return the status and progress of a background job."""
+    try:
+        job = Job.objects.get(id=job_id)
+    except Job.DoesNotExist:
+        return Response({"error": "Job not found."}, status=status.HTTP_404_NOT_FOUND)
+
+    return Response({
+        "job_id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "attempts": job.attempts,
+        "progress": {"done": job.progress_done, "total": job.progress_total},
+        "result": job.result,
+        "error": job.error,
+        "created_time": job.created_time,
+        "updated_time": job.updated_time,
+    })
+
+def _created_range(request, field='created_time'):
+    """Filter kwargs for ?created_after= / ?created_before= (ISO date or datetime)."""
+    created_range = {}
+    for param, lookup in (('created_after', 'gte'), ('created_before', 'lt')):
+        value = request.query_params.get(param)
+        if not value:
+            continue
+        parsed = parse_datetime(value)
+        if parsed is None:
+            parsed_date = parse_date(value)
+            if parsed_date is None:
+                raise ValueError(f"Invalid {param}")
+            parsed = datetime.combine(parsed_date, time.min)
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        created_range[f'{field}__{lookup}'] = parsed
+    return created_range
+
+@api_view(['GET'])
+@require_token
+@replica_read
 def list_orders(request):
     """
     Handle GET request to retrieve orders.
     - If ?id= provided (one or more), return matching orders.
     - If no id provided, return all orders.
+    - ?created_after= / ?created_before= limit the range (and the partitions scanned).
+    - ?include_archived=true adds orders from the archive; every row then
+      carries an `archived` flag.
+    - ?fields= and ?shape=columnar select columns and the response shape (see api/shaping.py).
     """
+    try:
+        created_range = _created_range(request)
+    except ValueError:
+        return Response({"error": "Invalid date format."}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        keys, columnar = shaping.parse(request, shaping.ORDER_FIELDS)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    include_archived = request.query_params.get('include_archived', 'false').lower() == 'true'
+
     ids = request.GET.getlist('id')  # ?id=1&id=2 支援多個
     if ids:
         try:
@@ -52,72 +151,173 @@ def list_orders(request):
         except ValueError:
             return Response({"error": "Invalid ID format."}, status=status.HTTP_400_BAD_REQUEST)
 
-        orders = Order.objects.filter(id__in=ids)
-        if not orders.exists():
-            return Response({"error": "No matching orders found."}, status=status.HTTP_404_NOT_FOUND)
+        orders = Order.objects.alive().filter(id__in=ids, **created_range)
     else:
-        orders = Order.objects.all()
+        orders = Order.objects.alive().filter(**created_range)
 
-    data = [
-        {
-            "order_id": order.id,
-            "order_number": order.order_number,
-            "total_price": float(order.total_price),
-            "created_time": order.created_time
-        }
-        for order in orders
-    ]
-    return Response(data)
+    archived = []
+    if include_archived:
+        archived = list(archive.scan_orders(
+            created_range.get('created_time__gte'), created_range.get('created_time__lt'), ids=ids or None,
+        ))
+    if ids and not archived and not orders.exists():
+        return Response({"error": "No matching orders found."}, status=status.HTTP_404_NOT_FOUND)
+
+    rows = shaping.select_rows(orders, shaping.ORDER_FIELDS, keys)
+    if not include_archived:
+        return Response(shaping.render(keys, rows, columnar))
+    rows = [row + [False] for row in rows] + [[order[key] for key in keys] + [True] for order in archived]
+    return Response(shaping.render(keys + ["archived"], rows, columnar))
 
 
 @api_view(['PUT'])
 @require_token
 def update_order(request, order_id):
-    """Update an existing order by ID."""
+    """
+    Update an existing order by ID.
+    - Only fields present in the request are written, in one conditional UPDATE.
+    - Send the current version as If-Match (or `version`); a stale version returns 409.
+      `If-Match: *` accepts any version.
+    - Status changes must follow Order.STATUS_TRANSITIONS.
+    """
     try:
-        order = Order.objects.get(id=order_id)
+        order = Order.objects.alive().get(id=order_id)
     except Order.DoesNotExist:
         return Response({"error": "Order not found."}, status=status.HTTP_404_NOT_FOUND)
 
-    order.order_number = request.data.get('order_number', order.order_number)
-    order.total_price = request.data.get('total_price', order.total_price)
-    order.save()
-    return Response({"message": "Order updated successfully."})
+    expected_version = request.headers.get('If-Match') or request.data.get('version')
+    if expected_version is None or str(expected_version).strip() == '*':
+        expected_version = order.version
+    else:
+        try:
+            expected_version = int(str(expected_version).strip('W/" '))
+        except ValueError:
+            return Response({"error": "Invalid version format."}, status=status.HTTP_400_BAD_REQUEST)
+        if expected_version != order.version:
+            return Response({"error": "Order was modified by another request.", "version": order.version},
+                            status=status.HTTP_409_CONFLICT)
+
+    fields = {
+        field: request.data[field]
+        for field in ('order_number', 'total_price', 'customer_name', 'note')
+        if field in request.data
+    }
+    if 'order_number' in fields and not (isinstance(fields['order_number'], str) and fields['order_number'].strip()):
+        return Response({"error": "order_number must be a non-empty string."}, status=status.HTTP_400_BAD_REQUEST)
+    if 'note' in fields and not isinstance(fields['note'], str):
+        return Response({"error": "note must be a string."}, status=status.HTTP_400_BAD_REQUEST)
+    if fields.get('customer_name') is not None and not isinstance(fields['customer_name'], str):
+        return Response({"error": "customer_name must be a string."}, status=status.HTTP_400_BAD_REQUEST)
+    if 'total_price' in fields:
+        try:
+            fields['total_price'] = Order._meta.get_field('total_price').clean(str(fields['total_price']), None)
+        except ValidationError:
+            return Response({"error": "Invalid total_price."}, status=status.HTTP_400_BAD_REQUEST)
+    new_status = request.data.get('status')
+    if new_status is not None and not isinstance(new_status, str):
+        return Response({"error": "status must be a string."}, status=status.HTTP_400_BAD_REQUEST)
+    if new_status is not None and new_status != order.status:
+        if not order.can_transition_to(new_status):
+            return Response({"error": f"Invalid status transition from {order.status} to {new_status}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        fields['status'] = new_status
+
+    if fields:
+        try:
+            with transaction.atomic():
+                updated = Order.objects.alive().filter(id=order.id, version=expected_version).update(
+                    version=F('version') + 1, **fields
+                )
+                if updated:
+                    order.refresh_from_db()
+                    changes.record(ChangeEvent.UPDATE, [order])
+                    if fields.get('status') == 'cancelled':
+                        inventory.release_order(order.id)
+        except IntegrityError:
+            return Response({"error": "Order number already exists."}, status=status.HTTP_400_BAD_REQUEST)
+        except ValidationError as e:
+            return Response({"error": e.messages}, status=status.HTTP_400_BAD_REQUEST)
+        except DataError:
+            return Response({"error": "Invalid field value."}, status=status.HTTP_400_BAD_REQUEST)
+        if not updated:
+            return Response({"error": "Order was modified by another request."}, status=status.HTTP_409_CONFLICT)
+        expected_version += 1
+
+    response = Response({"message": "Order updated successfully.", "version": expected_version})
+    response['ETag'] = f'"{expected_version}"'
+    return response
 
 
 @api_view(['DELETE'])
 @require_token
 def delete_order(request, order_id):
-    """Delete an existing order by ID."""
-    try:
-        order = Order.objects.get(id=order_id)
-    except Order.DoesNotExist:
-        return Response({"error": "Order not found."}, status=status.HTTP_404_NOT_FOUND)
-
-    order.delete()
+    """
+    Delete an existing order by ID.
+    - With ORDER_SOFT_DELETE, only flag it; `manage.py purge_orders` removes it later.
+    - Otherwise delete the order and cascade to its items immediately.
+    Either way its items' stock is given back, unless cancelling already did.
+    """
+    with transaction.atomic():
+        try:
+            # Locked, so a concurrent cancel cannot release the stock a second time.
+            order = Order.objects.alive().select_for_update().get(id=order_id)
+        except Order.DoesNotExist:
+            return Response({"error": "Order not found."}, status=status.HTTP_404_NOT_FOUND)
+        changes.record_order_deleted(order.id)
+        if order.status != 'cancelled':
+            inventory.release_order(order.id)
+        if settings.ORDER_SOFT_DELETE:
+            Order.objects.filter(id=order.id).update(deleted_at=timezone.now())
+        else:
+            order.delete()
     return Response({"message": "Order deleted successfully."})
 
 @api_view(['POST'])
 @require_token
 def create_product(request):
-    """Create a new product."""
+    """
+    Create a new product.
+    - Optional `stock` (omit or null for untracked) and `stock_shards` (see api/inventory.py).
+    """
     name = request.data.get('name')
     price = request.data.get('price')
 
     if not name or price is None:
         return Response({"error": "Missing product name or price."}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        stock, shards = _stock_fields(request)
+    except ValueError:
+        return Response({"error": "stock and stock_shards must be non-negative integers."},
+                        status=status.HTTP_400_BAD_REQUEST)
 
-    product = Product.objects.create(name=name, price=price)
+    with transaction.atomic():
+        product = Product.objects.create(name=name, price=price)
+        if stock is not None:
+            inventory.set_stock(product, stock, shards or 0)
+        changes.record(ChangeEvent.CREATE, [product])
 
     return Response({
         "message": "Product created successfully.",
         "product_id": product.id,
         "name": product.name,
-        "price": float(product.price)
+        "price": float(product.price),
+        "stock": stock,
     }, status=status.HTTP_201_CREATED)
 
+
+def _stock_fields(request):
+    """(stock, stock_shards) from the request; None for fields not sent. Raises ValueError."""
+    stock = request.data.get('stock')
+    shards = request.data.get('stock_shards')
+    stock = None if stock is None else int(stock)
+    shards = None if shards is None else int(shards)
+    if (stock is not None and stock < 0) or (shards is not None and shards < 0):
+        raise ValueError("Negative stock")
+    return stock, shards
+
 @api_view(['GET'])
 @require_token
+@replica_read
 def list_products(request):
     """List products by ID or all products if no ID is provided."""
     ids = request.query_params.get('id')
@@ -139,12 +339,65 @@ def list_products(request):
             "id": product.id,
             "name": product.name,
             "price": float(product.price),
+            "stock": inventory.annotated_available(product),
         }
-        for product in products
+        for product in inventory.with_available(products)
     ]
     return Response(data)
 
 
+@api_view(['GET'])
+@require_token
+@replica_read
+def search_products(request):
+    """
+    Search products by name, best matches first.
+    - ?q= search terms; the last one may be a partial word.
+    - Page with ?limit= (default 20, max 100) and ?offset=.
+    """
+    query = request.query_params.get('q', '').strip()
+    if not query:
+        return Response({"error": "Missing search query."}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        limit = min(int(request.query_params.get('limit', 20)), 100)
+        offset = int(request.query_params.get('offset', 0))
+    except ValueError:
+        return Response({"error": "Invalid limit or offset format."}, status=status.HTTP_400_BAD_REQUEST)
+    if limit < 1 or offset < 0:
+        return Response({"error": "Invalid limit or offset format."}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Fetch one extra row to know whether another page exists without a COUNT(*).
+    products = search.search_products(query, limit=limit + 1, offset=offset)
+    data = [
+        {
+            "id": product.id,
+            "name": product.name,
+            "price": float(product.price),
+            "rank": float(product.rank),
+        }
+        for product in products[:limit]
+    ]
+    return Response({
+        "results": data,
+        "next_offset": offset + limit if len(products) > limit else None,
+    })
+
+@api_view(['GET'])
+@require_token
+@replica_read
+def autocomplete_products(request):
+    """Suggest product names starting with ?prefix= (at most ?limit=, default 10)."""
+    prefix = request.query_params.get('prefix', '').strip()
+    if not prefix:
+        return Response({"error": "Missing prefix."}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        limit = max(1, min(int(request.query_params.get('limit', 10)), 50))
+    except ValueError:
+        return Response({"error": "Invalid limit format."}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response(search.autocomplete_products(prefix, limit=limit))
+
+
 @api_view(['PUT'])
 @require_token
 def update_product(request, product_id):
@@ -156,10 +409,23 @@ def update_product(request, product_id):
 
     name = request.data.get('name', product.name)
     price = request.data.get('price', product.price)
+    try:
+        stock, shards = _stock_fields(request)
+    except ValueError:
+        return Response({"error": "stock and stock_shards must be non-negative integers."},
+                        status=status.HTTP_400_BAD_REQUEST)
 
     product.name = name
     product.price = price
-    product.save()
+    with transaction.atomic():
+        # Never write back `stock`: concurrent reservations change it under us.
+        product.save(update_fields=['name', 'price'])
+        if 'stock' in request.data or shards is not None:
+            if 'stock' not in request.data:
+                # Re-sharding keeps the current stock: lock it so no reservation slips in between.
+                stock = inventory.available(product, lock=True)
+            inventory.set_stock(product, stock, product.stock_shards if shards is None else shards)
+        changes.record(ChangeEvent.UPDATE, [product])
 
     return Response({"message": "Product updated successfully."})
 
@@ -173,7 +439,10 @@ def delete_product(request, product_id):
     except Product.DoesNotExist:
         return Response({"error": "Product not found."}, status=status.HTTP_404_NOT_FOUND)
 
-    product.delete()
+    with transaction.atomic():
+        changes.record_deleted(OrderItem, product.orderitem_set.values_list('id', flat=True))
+        changes.record_deleted(Product, [product.id])
+        product.delete()
     return Response({"message": "Product deleted successfully."})
 
 @api_view(['POST'])
@@ -190,18 +459,32 @@ def create_order_item(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        order = Order.objects.get(id=order_id)
-        product = Product.objects.get(id=product_id)
-        item = OrderItem.objects.create(
-            order=order,
-            product=product,
-            quantity=quantity,
-            price_at_order=product.price
-        )
+        if settings.ORDER_ITEM_COALESCE:
+            # Written with other requests' items in one INSERT (see api/coalescing.py).
+            future = coalescing.add_item(int(order_id), int(product_id), quantity)
+            if not settings.ORDER_ITEM_COALESCE_DURABLE:
+                future.add_done_callback(coalescing.log_failure)
+                return Response({"status": "queued"}, status=status.HTTP_202_ACCEPTED)
+            item = coalescing.result(future)
+        else:
+            with transaction.atomic():
+                # Locked so a concurrent cancel waits for this item, and then gives its stock back.
+                order = Order.objects.alive().select_for_update().get(id=order_id)
+                if not order.accepts_items():
+                    return Response({"error": f"Order is {order.status}."}, status=status.HTTP_400_BAD_REQUEST)
+                product = Product.objects.get(id=product_id)
+                inventory.reserve(product, quantity)
+                item = OrderItem.objects.create(
+                    order=order,
+                    product=product,
+                    quantity=quantity,
+                    price_at_order=product.price
+                )
+                changes.record(ChangeEvent.CREATE, [item])
         return Response({
             "id": item.id,
-            "order_id": item.order.id,
-            "product_id": item.product.id,
+            "order_id": item.order_id,
+            "product_id": item.product_id,
             "quantity": item.quantity,
             "price_at_order": float(item.price_at_order)
         }, status=status.HTTP_201_CREATED)
@@ -209,17 +492,26 @@ def create_order_item(request):
         return Response({"error": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
     except Product.DoesNotExist:
         return Response({"error": "Product not found"}, status=status.HTTP_404_NOT_FOUND)
+    except inventory.OutOfStock as e:
+        return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+    except coalescing.BufferFull:
+        return Response({"error": "Too many pending writes, retry later."},
+                        status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={"Retry-After": "1"})
+    except coalescing.TimeoutError:
+        return Response({"error": "Timed out waiting for the order item to be written; it may still be."},
+                        status=status.HTTP_503_SERVICE_UNAVAILABLE)
     except Exception as e:
         return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 @api_view(['GET'])
 @require_token
+@replica_read
 def list_order_items(request):
     item_id = request.query_params.get('id')
     
     if item_id:
         try:
-            item = OrderItem.objects.get(id=item_id)
+            item = OrderItem.objects.get(id=item_id, order__deleted_at__isnull=True)
             return Response({
                 "id": item.id,
                 "order_id": item.order.id,
@@ -230,29 +522,37 @@ def list_order_items(request):
         except OrderItem.DoesNotExist:
             return Response({"error": "Order item not found"}, status=status.HTTP_404_NOT_FOUND)
     else:
-        items = OrderItem.objects.all()
-        data = [
-            {
-                "id": item.id,
-                "order_id": item.order.id,
-                "product_id": item.product.id,
-                "quantity": item.quantity,
-                "price_at_order": float(item.price_at_order)
-            } for item in items
-        ]
-        if not data:
+        try:
+            created_range = _created_range(request, field='order_created_time')
+        except ValueError:
+            return Response({"error": "Invalid date format."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            keys, columnar = shaping.parse(request, shaping.ORDER_ITEM_FIELDS)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        items = OrderItem.objects.filter(order__deleted_at__isnull=True, **created_range)
+        rows = shaping.select_rows(items, shaping.ORDER_ITEM_FIELDS, keys)
+        if not rows:
             return Response({"message": "No order items found."}, status=status.HTTP_404_NOT_FOUND)
-        return Response(data)
+        return Response(shaping.render(keys, rows, columnar))
 
 @api_view(['PUT'])
 @require_token
 def update_order_item(request, item_id):
     try:
-        item = OrderItem.objects.get(id=item_id)
         quantity = request.data.get('quantity')
-        if quantity:
-            item.quantity = int(quantity)
-        item.save()
+        with transaction.atomic():
+            item = OrderItem.objects.select_for_update().select_related('product', 'order').get(
+                id=item_id, order__deleted_at__isnull=True)
+            if quantity:
+                # Reserve or give back only the difference; a cancelled order holds no stock.
+                delta = int(quantity) - item.quantity
+                if item.order.status != 'cancelled':
+                    inventory.reserve(item.product, delta)
+                    inventory.release(item.product, -delta)
+                item.quantity = int(quantity)
+            item.save()
+            changes.record(ChangeEvent.UPDATE, [item])
         return Response({
             "id": item.id,
             "quantity": item.quantity,
@@ -260,13 +560,177 @@ def update_order_item(request, item_id):
         })
     except OrderItem.DoesNotExist:
         return Response({"error": "Order item not found"}, status=status.HTTP_404_NOT_FOUND)
+    except inventory.OutOfStock as e:
+        return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
 
 @api_view(['DELETE'])
 @require_token
 def delete_order_item(request, item_id):
     try:
-        item = OrderItem.objects.get(id=item_id)
-        item.delete()
+        with transaction.atomic():
+            # Order first, then item: the order a cancel takes them in.
+            order_id = OrderItem.objects.filter(id=item_id).values_list('order_id', flat=True).get()
+            order = Order.objects.alive().select_for_update().get(id=order_id)
+            item = OrderItem.objects.select_for_update(of=('self',)).select_related('product').get(
+                id=item_id, order_id=order.id)
+            deleted, _ = OrderItem.objects.filter(id=item.id).delete()
+            if deleted == 1:
+                changes.record(ChangeEvent.DELETE, [item])
+                if order.status != 'cancelled':
+                    inventory.release(item.product, item.quantity)
         return Response({"message": "Order item deleted."})
-    except OrderItem.DoesNotExist:
-        return Response({"error": "Order item not found"}, status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+    except (OrderItem.DoesNotExist, Order.DoesNotExist):
+        return Response({"error": "Order item not found"}, status=status.HTTP_404_NOT_FOUND)
+
+@api_view(['GET'])
+@require_token
+def list_changes(request):
+    """
+    Return change events after ?since=<seq>, oldest first.
+    - Page with ?limit= (default 500, max 5000) and resume from `next_since`.
+    - The page stops at the first event younger than CHANGE_FEED_SETTLE_SECONDS
+      (by insert time). A transaction that commits later than that after its
+      insert can still land behind a consumer's cursor.
+    - Always read from the primary: replica lag can exceed the settle window.
+    """
+    try:
+        since = int(request.query_params.get('since', 0))
+        limit = min(int(request.query_params.get('limit', 500)), 5000)
+    except ValueError:
+        return Response({"error": "Invalid since or limit format."}, status=status.HTTP_400_BAD_REQUEST)
+    if limit < 1:
+        return Response({"error": "Invalid since or limit format."}, status=status.HTTP_400_BAD_REQUEST)
+
+    events = changes.settled(ChangeEvent.objects.filter(seq__gt=since), limit=limit + 1)
+    has_more = len(events) > limit
+    events = events[:limit]
+
+    data = [
+        {
+            "seq": event.seq,
+            "model": event.model,
+            "object_id": event.object_id,
+            "action": event.action,
+            "data": event.data,
+            "created_time": event.created_time,
+        }
+        for event in events
+    ]
+    return Response({
+        "changes": data,
+        "next_since": events[-1].seq if events else since,
+        "has_more": has_more,
+    })
+
+@api_view(['GET'])
+@require_token
+@replica_read
+def revenue_report(request):
+    """
+    Item revenue per month, from the live tables and the archive together.
+    - ?created_after= / ?created_before= limit the range.
+    - Cancelled and refunded orders are left out.
+    """
+    try:
+        created_range = _created_range(request, field='order_created_time')
+    except ValueError:
+        return Response({"error": "Invalid date format."}, status=status.HTTP_400_BAD_REQUEST)
+
+    live = (
+        OrderItem.objects.filter(order__deleted_at__isnull=True, **created_range)
+        .exclude(order__status__in=archive.NON_REVENUE_STATUSES)
+        .annotate(month=TruncMonth('order_created_time'))
+        .values('month')
+        .annotate(revenue=Sum(F('quantity') * F('price_at_order')))
+    )
+    cents = archive.archived_revenue_by_month(
+        created_range.get('order_created_time__gte'), created_range.get('order_created_time__lt'),
+    )
+    for row in live:
+        month = row['month'].replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        cents[month] = cents.get(month, 0) + archive.to_cents(row['revenue'])
+
+    months = [
+        {"month": f"{month:%Y-%m}", "revenue": total / 100}
+        for month, total in sorted(cents.items())
+    ]
+    return Response({
+        "months": months,
+        "total_revenue": sum(cents.values()) / 100,
+    })
+
+@api_view(['GET'])
+@require_token
+def item_report(request):
+    """
+    Vectorized item revenue report over live and archived items.
+    - ?group_by=product (default) or day.
+    - ?top= number of best-selling products (default 10).
+    - ?percentiles= comma-separated order value percentiles (default 50,90,99).
+    - ?created_after= / ?created_before= limit the range.
+    Figures may lag writes by up to ANALYTICS_REFRESH_SECONDS plus
+    CHANGE_FEED_SETTLE_SECONDS.
+    """
+    # Imported here so numpy is only loaded by processes that serve reports.
+    from . import analytics
+
+    group_by = request.query_params.get('group_by', 'product')
+    if group_by not in ('product', 'day'):
+        return Response({"error": "group_by must be product or day."}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        top = max(1, int(request.query_params.get('top', 10)))
+        percentiles = tuple(
+            float(p) for p in request.query_params.get('percentiles', '50,90,99').split(',') if p.strip()
+        )
+        created_range = _created_range(request)
+    except ValueError:
+        return Response({"error": "Invalid top, percentiles or date format."}, status=status.HTTP_400_BAD_REQUEST)
+    if any(p < 0 or p > 100 for p in percentiles):
+        return Response({"error": "Percentiles must be between 0 and 100."}, status=status.HTTP_400_BAD_REQUEST)
+
+    start, end = created_range.get('created_time__gte'), created_range.get('created_time__lt')
+    result = analytics.report(
+        start_day=analytics.day_index(start) if start else None,
+        end_day=analytics.day_index(end, ceil=True) if end else None,
+        group_by=group_by,
+        top=top,
+        percentiles=percentiles,
+    )
+
+    key = "product_id" if group_by == 'product' else "day"
+    rows = [
+        {
+            key: group if group_by == 'product' else analytics.day_date(group),
+            "revenue": cents / 100,
+            "quantity": quantity,
+        }
+        for group, cents, quantity in result["groups"]
+    ]
+    return Response({
+        "group_by": group_by,
+        "rows": rows,
+        "top_products": [
+            {"product_id": product_id, "revenue": cents / 100}
+            for product_id, cents in result["top_products"]
+        ],
+        "order_value_percentiles": {
+            f"p{p:g}": value / 100 for p, value in result["order_percentiles"].items()
+        },
+        "total_revenue": result["total_cents"] / 100,
+        "items": result["items"],
+    })
+
+
+@api_view(['GET', 'DELETE'])
+def sampled_profiles(request):
+    """
+    The flame graphs collected by continuous sampling (PROFILE_SAMPLE_RATE), as speedscope JSON.
+    - Guarded by PROFILE_TOKEN in the X-Profile-Token header, not the access token.
+    - DELETE clears them.
+    """
+    if not profiling.token_ok(request):
+        return Response({"error": "Invalid profiling token."}, status=status.HTTP_403_FORBIDDEN)
+    if request.method == 'DELETE':
+        profiling.flame_graphs.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    return Response(profiling.flame_graphs.export())
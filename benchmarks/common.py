@@ -0,0 +1,61 @@
+"""Shared setup for the scripts in this package.
+
+Each benchmark runs against a throwaway copy of the configured database
+(the same one `manage.py test` would create), so it can be pointed at the
+docker-compose Postgres without touching real data:
+
+    python -m benchmarks.product_search --rows 1000000
+"""
+import os
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_django():
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pretest.settings')
+    import django
+    django.setup()
+
+
+@contextmanager
+def throwaway_database():
+    """Create, migrate and finally drop a test database."""
+    from django.db import connection
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def summarize(durations):
+    """{p50, p95, p99, max} of a list of durations in ms."""
+    durations = sorted(durations)
+    return {
+        "p50": statistics.median(durations),
+        "p95": durations[min(len(durations) - 1, int(len(durations) * 0.95))],
+        "p99": durations[min(len(durations) - 1, int(len(durations) * 0.99))],
+        "max": durations[-1],
+    }
+
+
+def timed(func, repeat=20):
+    """Run `func` `repeat` times; return (result, {p50, p95, max} in ms)."""
+    durations = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        durations.append((time.perf_counter() - start) * 1000)
+    return result, summarize(durations)
+
+
+def report(name, stats):
+    print(f"{name:<40} p50 {stats['p50']:8.2f} ms   p95 {stats['p95']:8.2f} ms   max {stats['max']:8.2f} ms")
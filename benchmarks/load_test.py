@@ -0,0 +1,437 @@
+"""Load test: ramp up virtual users until the API saturates.
+
+    python -m benchmarks.load_test                                  # in-process server, throwaway database
+    python -m benchmarks.load_test --url http://localhost:8008      # the docker-compose stack
+    python -m benchmarks.load_test --mix basket=6,dashboard=3,import=1 --json load.json
+
+Every virtual user keeps one HTTP/1.1 connection open. It loops over
+scenarios picked by weight from --mix:
+- import: a burst of --import-size orders through POST /api/orders/bulk/;
+- basket: create an order, then add up to --basket-size items one at a time
+  through create_order_item;
+- dashboard: poll list_orders for the orders of the last
+  --dashboard-minutes minutes.
+
+Users are added in stages. The ramp starts at --start users and multiplies
+by --factor up to --max-users, and each stage runs for --stage-seconds. A
+stage counts as saturated when:
+- its error rate exceeds --max-error-rate, or
+- its p95 exceeds --max-p95-ms, or
+- its throughput is less than --min-gain above the best stage so far.
+The ramp stops at the first saturated stage. The best healthy stage before
+it is reported as the saturation point.
+
+Each stage reports throughput, latency percentiles, error rate and the
+peak number of database connections. The connection count comes from
+pg_stat_activity and is only available on PostgreSQL; with --url it needs
+--db-stats and settings that reach the stack's database.
+
+The in-process server is runserver's threaded server. It shares this
+process, and its GIL, with the load generator, so its numbers are good for
+comparing changes. Use --url for absolute capacity.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlencode, urlsplit
+from benchmarks.common import setup_django, summarize, throwaway_database
+
+TOKEN = 'omni_pretest_token'
+
+
+class HttpSession:
+    """One keep-alive HTTP/1.1 connection that reconnects when the server closes it."""
+
+    def __init__(self, host, port, timeout):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=None, headers=()):
+        """Return (status, body); status is 0 for connection errors and timeouts."""
+        payload = b'' if body is None else json.dumps(body).encode()
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}", f"Content-Length: {len(payload)}"]
+        if body is not None:
+            lines.append("Content-Type: application/json")
+        message = ("\r\n".join(lines + list(headers)) + "\r\n\r\n").encode() + payload
+        for _ in range(2):
+            reused = self.writer is not None
+            try:
+                return await asyncio.wait_for(self._exchange(message), self.timeout)
+            except asyncio.IncompleteReadError:
+                # The server closed an idle keep-alive connection: retry once on a new one.
+                self.close()
+                if not reused:
+                    break
+            except (OSError, asyncio.TimeoutError, ValueError):
+                self.close()
+                break
+        return 0, b''
+
+    async def _exchange(self, message):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write(message)
+        await self.writer.drain()
+        version, status = (await self.reader.readuntil(b"\r\n")).split(b" ", 2)[:2]
+        headers = {}
+        while (line := await self.reader.readuntil(b"\r\n")) != b"\r\n":
+            name, _, value = line.decode('latin-1').partition(":")
+            headers[name.strip().lower()] = value.strip().lower()
+        if 'content-length' in headers:
+            data = await self.reader.readexactly(int(headers['content-length']))
+        elif headers.get('transfer-encoding') == 'chunked':
+            data = b''
+            while size := int((await self.reader.readuntil(b"\r\n")).split(b";")[0], 16):
+                data += (await self.reader.readexactly(size + 2))[:-2]
+            await self.reader.readuntil(b"\r\n")
+        else:
+            data = await self.reader.read()
+            headers['connection'] = 'close'
+        if version != b"HTTP/1.1" or headers.get('connection') == 'close':
+            self.close()
+        return int(status), data
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class VirtualUser:
+    def __init__(self, number, session, recorder, context):
+        self.number = number
+        self.session = session
+        self.recorder = recorder
+        self.context = context
+        self.orders = 0
+
+    async def call(self, name, method, path, body=None, headers=()):
+        start = time.perf_counter()
+        status, data = await self.session.request(method, path, body, headers)
+        self.recorder.add(name, status, (time.perf_counter() - start) * 1000)
+        return status, data
+
+    async def think(self):
+        if self.context.think_ms:
+            await asyncio.sleep(random.expovariate(1000 / self.context.think_ms))
+        else:
+            await asyncio.sleep(0)
+
+    def order_number(self):
+        self.orders += 1
+        return f"LT-{self.context.run_id}-{self.number}-{self.orders}"
+
+
+async def import_burst(user):
+    orders = [
+        {"order_number": user.order_number(), "total_price": round(random.uniform(5, 500), 2)}
+        for _ in range(user.context.import_size)
+    ]
+    await user.call('import', 'POST', '/api/orders/bulk/', {"access_token": TOKEN, "orders": orders})
+
+
+async def basket(user):
+    status, data = await user.call('basket: create order', 'POST', '/api/orders/', {
+        "access_token": TOKEN, "order_number": user.order_number(), "total_price": 0,
+    })
+    if status != 201:
+        return
+    order_id = json.loads(data)["order_id"]
+    for _ in range(random.randint(1, user.context.basket_size)):
+        await user.think()
+        await user.call('basket: add item', 'POST', '/api/order-items/', {
+            "access_token": TOKEN,
+            "order_id": order_id,
+            "product_id": random.choice(user.context.product_ids),
+            "quantity": random.randint(1, 3),
+        })
+
+
+async def dashboard(user):
+    since = datetime.now(timezone.utc) - timedelta(minutes=user.context.dashboard_minutes)
+    query = urlencode({
+        "access_token": TOKEN,
+        "created_after": since.isoformat(),
+        "include_archived": "false",
+        "fields": "order_id,order_number,total_price,status,created_time",
+    })
+    await user.call('dashboard', 'GET', f'/api/orders/list/?{query}', headers=("Accept-Encoding: gzip",))
+
+
+SCENARIOS = {
+    'import': import_burst,
+    'basket': basket,
+    'dashboard': dashboard,
+}
+
+
+class Recorder:
+    """(name, status, ms) per request, bucketed by the stage it finished in."""
+
+    def __init__(self):
+        self.stage = 0
+        self.samples = defaultdict(list)
+
+    def add(self, name, status, ms):
+        self.samples[self.stage].append((name, status, ms))
+
+
+class ConnectionGauge:
+    """Peak PostgreSQL connections to the database, sampled on a background thread."""
+
+    def __init__(self, interval=0.25):
+        self.interval = interval
+        self.peak = None
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        from django.db import connection
+        try:
+            while not self.stopped.wait(self.interval):
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        "SELECT count(*) FROM pg_stat_activity "
+                        "WHERE datname = current_database() AND pid <> pg_backend_pid()"
+                    )
+                    value = cursor.fetchone()[0]
+                with self.lock:
+                    self.peak = value if self.peak is None else max(self.peak, value)
+        except Exception as e:
+            print(f"Stopped sampling database connections: {e}")
+        finally:
+            connection.close()
+
+    def take_peak(self):
+        with self.lock:
+            peak, self.peak = self.peak, None
+        return peak
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+
+def summarize_stage(users, samples, seconds, connections):
+    def stats(rows):
+        errors = sum(1 for _, status, _ in rows if not 200 <= status < 300)
+        return {
+            "requests": len(rows),
+            "throughput": len(rows) / seconds,
+            "error_rate": errors / len(rows) if rows else 0.0,
+            "latency_ms": summarize([ms for _, _, ms in rows]) if rows else None,
+        }
+
+    by_name = defaultdict(list)
+    for row in samples:
+        by_name[row[0]].append(row)
+    return {
+        "users": users,
+        **stats(samples),
+        "statuses": dict(sorted(Counter(status for _, status, _ in samples).items())),
+        "db_connections": connections,
+        "endpoints": {name: stats(rows) for name, rows in sorted(by_name.items())},
+    }
+
+
+def saturation(stages, args):
+    """Why the last stage counts as saturated, or None."""
+    last = stages[-1]
+    if not last["requests"]:
+        return "no request completed"
+    if last["error_rate"] > args.max_error_rate:
+        return f"error rate {last['error_rate']:.1%}"
+    if args.max_p95_ms and last["latency_ms"]["p95"] > args.max_p95_ms:
+        return f"p95 {last['latency_ms']['p95']:.0f} ms"
+    best = max((stage["throughput"] for stage in stages[:-1]), default=None)
+    if best is not None and last["throughput"] < best * (1 + args.min_gain):
+        return f"throughput {last['throughput'] / best - 1:+.0%} on the best stage"
+    return None
+
+
+def print_stage(stage):
+    latency = stage["latency_ms"] or {"p50": 0, "p95": 0, "p99": 0}
+    connections = "-" if stage["db_connections"] is None else stage["db_connections"]
+    print(f"{stage['users']:>6} {stage['throughput']:>9,.1f} {latency['p50']:>8.1f} {latency['p95']:>8.1f} "
+          f"{latency['p99']:>8.1f} {stage['error_rate']:>7.1%} {connections:>8}"
+          + (f"   saturated: {stage['saturated']}" if stage.get("saturated") else ""))
+
+
+async def seed_products(host, port, timeout, count):
+    session = HttpSession(host, port, timeout)
+    product_ids = []
+    for n in range(count):
+        status, data = await session.request('POST', '/api/products/', {
+            "access_token": TOKEN, "name": f"Load test product {n}", "price": round(random.uniform(1, 200), 2),
+        })
+        if status != 201:
+            raise SystemExit(f"Could not create products: HTTP {status} {data[:200]!r}")
+        product_ids.append(json.loads(data)["product_id"])
+    session.close()
+    return product_ids
+
+
+async def ramp(url, args, gauge):
+    target = urlsplit(url)
+    host, port = target.hostname, target.port or 80
+    context = argparse.Namespace(**vars(args), run_id=uuid.uuid4().hex[:8])
+    context.product_ids = await seed_products(host, port, args.timeout, args.products)
+    names, weights = zip(*args.mix.items())
+
+    recorder = Recorder()
+    stop = asyncio.Event()
+
+    async def run_user(number):
+        user = VirtualUser(number, HttpSession(host, port, args.timeout), recorder, context)
+        try:
+            while not stop.is_set():
+                await SCENARIOS[random.choices(names, weights)[0]](user)
+                await user.think()
+        finally:
+            user.session.close()
+
+    print(f"{' users':>6} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7} {'db conns':>8}")
+    tasks = []
+    stages = []
+    users = args.start
+    while True:
+        recorder.stage = len(stages)
+        tasks += [asyncio.create_task(run_user(number)) for number in range(len(tasks), users)]
+        if gauge:
+            gauge.take_peak()
+        start = time.perf_counter()
+        await asyncio.sleep(args.stage_seconds)
+        stage = summarize_stage(users, recorder.samples[len(stages)], time.perf_counter() - start,
+                                gauge.take_peak() if gauge else None)
+        stages.append(stage)
+        stage["saturated"] = saturation(stages, args)
+        print_stage(stage)
+        if stage["saturated"] or users >= args.max_users:
+            break
+        users = min(args.max_users, max(users + 1, int(users * args.factor)))
+
+    stop.set()
+    done, pending = await asyncio.wait(tasks, timeout=args.timeout)
+    for task in pending:
+        task.cancel()
+    return stages
+
+
+def report_saturation(stages):
+    healthy = [stage for stage in stages if not stage["saturated"]]
+    if not healthy:
+        print(f"\nSaturated already at {stages[0]['users']} users ({stages[0]['saturated']}).")
+        return None
+    best = max(healthy, key=lambda stage: stage["throughput"])
+    if stages[-1]["saturated"]:
+        print(f"\nSaturation point: {best['throughput']:,.1f} req/s at {best['users']} users "
+              f"(p95 {best['latency_ms']['p95']:.1f} ms); "
+              f"{stages[-1]['users']} users: {stages[-1]['saturated']}.")
+    else:
+        print(f"\nNot saturated up to {stages[-1]['users']} users; best {best['throughput']:,.1f} req/s.")
+    print(f"Per endpoint at {best['users']} users:")
+    for name, endpoint in best["endpoints"].items():
+        latency = endpoint["latency_ms"]
+        print(f"  {name:<24} {endpoint['throughput']:>9,.1f} req/s   p50 {latency['p50']:8.1f} ms   "
+              f"p95 {latency['p95']:8.1f} ms   p99 {latency['p99']:8.1f} ms   errors {endpoint['error_rate']:.1%}")
+    return best
+
+
+@contextmanager
+def local_server():
+    """runserver's threaded WSGI server on a free port, in a background thread."""
+    from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+    from django.core.wsgi import get_wsgi_application
+    server = ThreadedWSGIServer(('127.0.0.1', 0), WSGIRequestHandler)
+    server.set_app(get_wsgi_application())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"unknown scenario {name!r} (choose from {', '.join(SCENARIOS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help="Base URL of a running server; default: an in-process server on a throwaway database.")
+    parser.add_argument('--db-stats', action='store_true', help="With --url, sample pg_stat_activity through the Django settings.")
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('basket=6,dashboard=3,import=1'))
+    parser.add_argument('--start', type=int, default=2, help="users in the first stage")
+    parser.add_argument('--factor', type=float, default=2, help="user multiplier per stage")
+    parser.add_argument('--max-users', type=int, default=256)
+    parser.add_argument('--stage-seconds', type=float, default=10)
+    parser.add_argument('--think-ms', type=float, default=0, help="mean pause between a user's requests")
+    parser.add_argument('--max-error-rate', type=float, default=0.01)
+    parser.add_argument('--max-p95-ms', type=float, default=0, help="0 disables the latency limit")
+    parser.add_argument('--min-gain', type=float, default=0.1, help="throughput gain a stage needs over the best so far")
+    parser.add_argument('--timeout', type=float, default=30, help="per request, in seconds")
+    parser.add_argument('--products', type=int, default=200)
+    parser.add_argument('--import-size', type=int, default=50)
+    parser.add_argument('--basket-size', type=int, default=5)
+    parser.add_argument('--dashboard-minutes', type=float, default=5)
+    parser.add_argument('--json', help="also write the full report to this file")
+    args = parser.parse_args()
+
+    if args.url:
+        gauge = None
+        if args.db_stats:
+            setup_django()
+            gauge = ConnectionGauge()
+        print(f"Load testing {args.url}")
+        stages = asyncio.run(ramp(args.url, args, gauge))
+    else:
+        setup_django()
+        with throwaway_database() as connection, local_server() as url:
+            # Every request, and every 4xx under load, would otherwise be logged.
+            logging.getLogger('django.request').setLevel(logging.ERROR)
+            logging.getLogger('django.server').setLevel(logging.ERROR)
+            # Keeps an in-memory SQLite test database alive between requests.
+            connection.ensure_connection()
+            gauge = ConnectionGauge() if connection.vendor == 'postgresql' else None
+            print(f"Load testing an in-process server on {connection.vendor}")
+            try:
+                stages = asyncio.run(ramp(url, args, gauge))
+            finally:
+                if gauge:
+                    gauge.stop()
+                    gauge = None
+    if gauge:
+        gauge.stop()
+
+    best = report_saturation(stages)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                "target": args.url or "in-process",
+                "mix": args.mix,
+                "stages": stages,
+                "saturation_point": best,
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Bytes on the wire and response time of the large list endpoints.
+
+    python -m benchmarks.payload --orders 20000 --items-per-order 3
+
+Every shape (objects, sparse fieldset, columnar) is fetched with no
+compression, gzip and, when the brotli package is installed, brotli. The
+"instances" row re-runs the former list_orders loop (model instances, every
+column) for comparison.
+"""
+import argparse
+import random
+from benchmarks.common import report, setup_django, throwaway_database, timed
+
+TOKEN = 'omni_pretest_token'
+
+
+def populate(orders, items_per_order, batch_size=5000):
+    from api.models import Order, OrderItem, Product
+    rng = random.Random(42)
+    products = Product.objects.bulk_create([
+        Product(name=f"Product {n}", price=rng.randint(100, 10000) / 100) for n in range(100)
+    ])
+    for start in range(0, orders, batch_size):
+        created = Order.objects.bulk_create([
+            Order(order_number=f"ORD-{n:08}", total_price=rng.randint(100, 100000) / 100)
+            for n in range(start, min(start + batch_size, orders))
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=rng.randint(1, 5), price_at_order=product.price,
+                      order_created_time=order.created_time)
+            for order in created
+            for product in rng.sample(products, items_per_order)
+        ])
+
+
+def instances_baseline():
+    from rest_framework.renderers import JSONRenderer
+    from api.models import Order
+    data = [
+        {
+            "order_id": order.id,
+            "order_number": order.order_number,
+            "total_price": float(order.total_price),
+            "status": order.status,
+            "version": order.version,
+            "created_time": order.created_time,
+        }
+        for order in Order.objects.alive()
+    ]
+    return JSONRenderer().render(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--orders', type=int, default=20000)
+    parser.add_argument('--items-per-order', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.test import Client
+    from api import middleware
+
+    encodings = ['identity', 'gzip'] + (['br'] if middleware.brotli else [])
+    variants = [
+        ('orders', '/api/orders/list/?include_archived=false'),
+        ('orders fields=order_id,total_price', '/api/orders/list/?include_archived=false&fields=order_id,total_price'),
+        ('orders columnar', '/api/orders/list/?include_archived=false&shape=columnar'),
+        ('items', '/api/order-items/list/?'),
+        ('items columnar', '/api/order-items/list/?shape=columnar'),
+        ('items columnar fields=product_id,quantity', '/api/order-items/list/?shape=columnar&fields=product_id,quantity'),
+    ]
+    client = Client()
+
+    with throwaway_database() as connection:
+        print(f"Populating {args.orders} orders x {args.items_per_order} items on {connection.vendor}...")
+        populate(args.orders, args.items_per_order)
+
+        body, stats = timed(instances_baseline, args.repeat)
+        report(f"instances, identity ({len(body):,} B)", stats)
+        for name, url in variants:
+            for encoding in encodings:
+                response, stats = timed(
+                    lambda: client.get(f"{url}&access_token={TOKEN}", HTTP_ACCEPT_ENCODING=encoding), args.repeat,
+                )
+                assert response.status_code == 200, response.status_code
+                report(f"{name}, {encoding} ({len(response.content):,} B)", stats)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Product search latency on a large generated catalog.
+
+    python -m benchmarks.product_search --rows 1000000
+
+Compares the indexed search and autocomplete paths with the old approach of
+fetching the whole catalog and filtering it client-side. On PostgreSQL the
+autocomplete plan is printed too: it should read product_tenant_name_c_idx
+in order (no full Sort node above the scan) and stop at the limit.
+"""
+import argparse
+import random
+from benchmarks.common import report, setup_django, throwaway_database, timed
+
+WORDS = [
+    "apple", "banana", "cherry", "green", "red", "tea", "coffee", "organic", "juice", "pie",
+    "mango", "lemon", "honey", "almond", "milk", "dark", "chocolate", "vanilla", "oat", "rice",
+]
+
+
+def populate(rows, batch_size=10000):
+    from api.models import Product
+    rng = random.Random(42)
+    for start in range(0, rows, batch_size):
+        Product.objects.bulk_create([
+            Product(name=" ".join(rng.sample(WORDS, 3)) + f" {n}", price=rng.randint(100, 10000) / 100)
+            for n in range(start, min(start + batch_size, rows))
+        ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.test.utils import CaptureQueriesContext
+    from api import search
+    from api.models import Product
+
+    with throwaway_database() as connection:
+        print(f"Populating {args.rows} products on {connection.vendor}...")
+        populate(args.rows)
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE api_product")
+
+        _, stats = timed(lambda: search.search_products("organic choc", limit=20), args.repeat)
+        report("search: 2 terms, prefix, top 20", stats)
+        _, stats = timed(lambda: search.search_products("honey", limit=20, offset=100), args.repeat)
+        report("search: 1 term, page 6", stats)
+        _, stats = timed(lambda: search.autocomplete_products("mango alm", limit=10), args.repeat)
+        report("autocomplete: 10 names", stats)
+        if connection.vendor == 'postgresql':
+            with CaptureQueriesContext(connection) as queries:
+                search.autocomplete_products("mango alm", limit=10)
+            with connection.cursor() as cursor:
+                cursor.execute("EXPLAIN ANALYZE " + queries[-1]['sql'])
+                print("\n".join(row[0] for row in cursor.fetchall()))
+
+        def client_side():
+            return [p for p in Product.objects.values('id', 'name', 'price') if "organic" in p['name']][:20]
+        _, stats = timed(client_side, max(1, args.repeat // 10))
+        report("baseline: full catalog + client filter", stats)
+
+
+if __name__ == '__main__':
+    main()
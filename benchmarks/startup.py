@@ -0,0 +1,68 @@
+"""Worker cold start: the full settings against the API-only profile.
+
+    python -m benchmarks.startup --repeat 20
+    python -m benchmarks.startup --settings pretest.settings,pretest.settings_api
+
+Each run is a fresh interpreter, as after an autoscaling event. It measures
+building the WSGI application (settings, apps, models and middleware), the
+first request through it (a GET without a token, so no database is needed)
+and the whole process from spawn to exit.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from benchmarks.common import ROOT, report, summarize
+
+CHILD = """
+import io, json, sys, time
+start = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+setup = time.perf_counter()
+environ = {
+    'REQUEST_METHOD': 'GET', 'PATH_INFO': '/api/orders/list/', 'QUERY_STRING': '',
+    'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+    'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+}
+statuses = []
+b''.join(application(environ, lambda status, headers: statuses.append(status)))
+first = time.perf_counter()
+assert statuses[0].startswith('403'), statuses
+print(json.dumps({
+    "setup": (setup - start) * 1000,
+    "first_response": (first - setup) * 1000,
+    "modules": len(sys.modules),
+}))
+"""
+
+
+def run_once(settings_module):
+    path = os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')]))
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings_module, PYTHONPATH=path)
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, '-c', CHILD], cwd=ROOT, env=env, check=True, capture_output=True, text=True,
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["process"] = (time.perf_counter() - start) * 1000
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--settings', default='pretest.settings,pretest.settings_api')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    for settings_module in args.settings.split(','):
+        runs = [run_once(settings_module) for _ in range(args.repeat)]
+        print(f"{settings_module} ({runs[0]['modules']} modules loaded)")
+        for metric in ("setup", "first_response", "process"):
+            report(f"  {metric}", summarize([run[metric] for run in runs]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Concurrent buyers of one product: no oversell, and reservation throughput.
+
+    python -m benchmarks.stock_contention --threads 32 --requests 100 --stock 2000 --shards 16
+
+Every thread posts quantity-1 items for the same product through the full
+request stack. More units are requested than are in stock, so the run ends
+sold out. It then checks that exactly `stock` items were created and that
+no stock is left, first with the single-row counter and then sharded.
+"""
+import argparse
+import logging
+import threading
+import time
+from benchmarks.common import report, setup_django, summarize, throwaway_database
+
+TOKEN = 'omni_pretest_token'
+
+
+def run(product_id, order_ids, threads, requests):
+    from django.db import connection
+    from django.test import Client
+    latencies = []
+    statuses = []
+
+    def worker(index):
+        client = Client()
+        try:
+            for n in range(requests):
+                body = {
+                    "access_token": TOKEN,
+                    "order_id": order_ids[(index * requests + n) % len(order_ids)],
+                    "product_id": product_id,
+                    "quantity": 1,
+                }
+                start = time.perf_counter()
+                response = client.post('/api/order-items/', body, content_type='application/json')
+                latencies.append((time.perf_counter() - start) * 1000)
+                statuses.append(response.status_code)
+        finally:
+            connection.close()
+
+    start = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return len(latencies) / (time.perf_counter() - start), summarize(latencies), statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=100, help="per thread")
+    parser.add_argument('--stock', type=int, default=2000)
+    parser.add_argument('--shards', type=int, default=16)
+    args = parser.parse_args()
+
+    setup_django()
+    # Every sold-out request would log a 409 warning.
+    logging.getLogger('django.request').setLevel(logging.ERROR)
+    from api import inventory
+    from api.models import Order, OrderItem, Product
+
+    with throwaway_database() as connection:
+        order_ids = [o.id for o in Order.objects.bulk_create(
+            [Order(order_number=f"ORD-{n:06}", total_price=0) for n in range(1000)])]
+        print(f"{args.threads} threads x {args.requests} buyers for {args.stock} units on {connection.vendor}")
+
+        for name, shards in (("single row", 0), (f"{args.shards} shards", args.shards)):
+            product = Product.objects.create(name=f"Flash sale ({name})", price=10)
+            inventory.set_stock(product, args.stock, shards)
+            throughput, stats, statuses = run(product.id, order_ids, args.threads, args.requests)
+
+            sold = OrderItem.objects.filter(product=product).count()
+            left = inventory.available(product)
+            report(f"{name}: {throughput:,.0f} req/s", stats)
+            print(f"  201: {statuses.count(201)}  409: {statuses.count(409)}  "
+                  f"other: {len(statuses) - statuses.count(201) - statuses.count(409)}  "
+                  f"items: {sold}  stock left: {left}")
+            assert sold == statuses.count(201) and sold + left == args.stock and left >= 0, "oversold"
+            if len(statuses) >= args.stock:
+                assert left == 0, "stock left although buyers were turned away"
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""create_order_item throughput with and without write coalescing.
+
+    python -m benchmarks.write_coalescing --threads 32 --requests 200
+
+Each thread posts items through the full request stack (its own client and
+database connection), as the threads of a threaded WSGI worker would.
+"""
+import argparse
+import threading
+import time
+from benchmarks.common import report, setup_django, summarize, throwaway_database
+
+TOKEN = 'omni_pretest_token'
+
+
+def run(threads, requests, order_ids, product_ids):
+    from django.db import connection
+    from django.test import Client
+    latencies = []
+    failures = []
+
+    def worker(index):
+        client = Client()
+        try:
+            for n in range(requests):
+                body = {
+                    "access_token": TOKEN,
+                    "order_id": order_ids[(index + n) % len(order_ids)],
+                    "product_id": product_ids[n % len(product_ids)],
+                    "quantity": 1,
+                }
+                start = time.perf_counter()
+                response = client.post('/api/order-items/', body, content_type='application/json')
+                latencies.append((time.perf_counter() - start) * 1000)
+                if response.status_code >= 300:
+                    failures.append(response.status_code)
+        finally:
+            connection.close()
+
+    start = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return len(latencies) / (time.perf_counter() - start), summarize(latencies), failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=200, help="per thread")
+    parser.add_argument('--window-ms', type=float, default=5)
+    parser.add_argument('--max-batch', type=int, default=500)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.test import override_settings
+    from api.models import Order, OrderItem, Product
+
+    with throwaway_database() as connection:
+        order_ids = [o.id for o in Order.objects.bulk_create(
+            [Order(order_number=f"ORD-{n:06}", total_price=0) for n in range(1000)])]
+        product_ids = [p.id for p in Product.objects.bulk_create(
+            [Product(name=f"Product {n}", price=10) for n in range(100)])]
+        print(f"{args.threads} threads x {args.requests} requests on {connection.vendor}")
+
+        for name, overrides in (
+            ("one INSERT per request", {"ORDER_ITEM_COALESCE": False}),
+            (f"coalesced ({args.window_ms:g} ms window)", {
+                "ORDER_ITEM_COALESCE": True,
+                "ORDER_ITEM_COALESCE_WINDOW_MS": args.window_ms,
+                "ORDER_ITEM_COALESCE_MAX_BATCH": args.max_batch,
+            }),
+        ):
+            OrderItem.objects.all().delete()
+            with override_settings(**overrides):
+                throughput, stats, failures = run(args.threads, args.requests, order_ids, product_ids)
+            report(f"{name}: {throughput:,.0f} req/s", stats)
+            if failures:
+                print(f"  {len(failures)} failed requests, statuses {sorted(set(failures))}")
+
+
+if __name__ == '__main__':
+    main()
@@ -11,10 +11,14 @@ https://docs.djangoproject.com/en/3.0/ref/settings/
 """
 
 import os
+from dotenv import load_dotenv
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
+# Load environment variables from .env file, once, before anything reads them.
+load_dotenv(os.path.join(BASE_DIR, '.env'))
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/3.0/howto/deployment/checklist/
@@ -42,6 +46,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.CompressionMiddleware',
+    'api.middleware.ProfilingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -82,9 +88,31 @@ DATABASES = {
         'PASSWORD': os.environ.get('POSTGRES_PASSWORD'),
         'HOST': 'db',
         'PORT': os.environ.get('POSTGRES_PORT'),
+        # Keep connections open between requests instead of reconnecting each time.
+        'CONN_MAX_AGE': int(os.environ.get('POSTGRES_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Optional streaming replica for the read-heavy GET views (see api/routers.py).
+if os.environ.get('POSTGRES_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.environ.get('POSTGRES_REPLICA_HOST'),
+        'PORT': os.environ.get('POSTGRES_REPLICA_PORT', os.environ.get('POSTGRES_PORT')),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['api.routers.ReplicaRouter']
+REPLICA_DATABASE = 'replica' if 'replica' in DATABASES else None
+# A client reads from the primary for this long after its last write. The write
+# time is carried by the client (signed cookie or X-Replica-Sticky header), so
+# it holds across workers without a shared cache.
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", 5))
+# Reads fall back to the primary while the replica is further behind than this.
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", 10))
+REPLICA_LAG_CHECK_INTERVAL = float(os.getenv("REPLICA_LAG_CHECK_INTERVAL", 5))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
@@ -124,5 +152,57 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
-# Load environment variables from .env file
-ACCEPTED_TOKEN = os.getenv("ACCEPTED_TOKEN", 'omni_pretest_token') 
\ No newline at end of file
+ACCEPTED_TOKEN = os.getenv("ACCEPTED_TOKEN", 'omni_pretest_token')
+
+# When enabled, delete_order only flags the order with deleted_at and
+# `manage.py purge_orders` removes it (and its items) later in batches.
+ORDER_SOFT_DELETE = os.getenv("ORDER_SOFT_DELETE", "False") == "True"
+
+# Background jobs (`manage.py run_worker`)
+JOB_LOCK_TIMEOUT = int(os.getenv("JOB_LOCK_TIMEOUT", 300))
+JOB_RETRY_BACKOFF = float(os.getenv("JOB_RETRY_BACKOFF", 5))
+# Bulk imports larger than this are always queued and answered with 202.
+JOB_SYNC_IMPORT_LIMIT = int(os.getenv("JOB_SYNC_IMPORT_LIMIT", 100))
+
+# The changes feed stops at the first event younger than this. Event age is
+# measured from insert time, not commit time, so this bounds rather than removes
+# the risk of a cursor skipping a transaction that commits out of sequence order:
+# only a transaction that stays open longer than this after writing its events
+# can be skipped. Keep it above the longest write transaction. The feed is read
+# from the primary, since replica lag can exceed it.
+CHANGE_FEED_SETTLE_SECONDS = float(os.getenv("CHANGE_FEED_SETTLE_SECONDS", 2))
+
+# Monthly columnar files written by `manage.py archive_orders`.
+ORDER_ARCHIVE_DIR = os.getenv("ORDER_ARCHIVE_DIR", os.path.join(BASE_DIR, 'archive'))
+
+# How stale the in-memory item columns behind reports/items/ may get.
+ANALYTICS_REFRESH_SECONDS = float(os.getenv("ANALYTICS_REFRESH_SECONDS", 30))
+# How often they are rebuilt from scratch instead of refreshed from the changes feed.
+ANALYTICS_REBUILD_SECONDS = float(os.getenv("ANALYTICS_REBUILD_SECONDS", 3600))
+
+# Responses at least this large are gzip/brotli compressed when the client accepts it.
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", 1024))
+
+# Write coalescing for create_order_item (see api/coalescing.py).
+ORDER_ITEM_COALESCE = os.getenv("ORDER_ITEM_COALESCE", "False") == "True"
+ORDER_ITEM_COALESCE_WINDOW_MS = float(os.getenv("ORDER_ITEM_COALESCE_WINDOW_MS", 5))
+ORDER_ITEM_COALESCE_MAX_BATCH = int(os.getenv("ORDER_ITEM_COALESCE_MAX_BATCH", 500))
+ORDER_ITEM_COALESCE_MAX_PENDING = int(os.getenv("ORDER_ITEM_COALESCE_MAX_PENDING", 5000))
+ORDER_ITEM_COALESCE_QUEUE_TIMEOUT = float(os.getenv("ORDER_ITEM_COALESCE_QUEUE_TIMEOUT", 1))
+# A request whose item is still queued after this long inserts it itself.
+ORDER_ITEM_COALESCE_RESULT_TIMEOUT = float(os.getenv("ORDER_ITEM_COALESCE_RESULT_TIMEOUT", 5))
+# When off, requests are answered 202 as soon as the item is queued, before it is written.
+ORDER_ITEM_COALESCE_DURABLE = os.getenv("ORDER_ITEM_COALESCE_DURABLE", "True") == "True"
+
+# Token -> tenant lookups are cached in each process for this long (see api/tenancy.py).
+TENANT_CACHE_SECONDS = float(os.getenv("TENANT_CACHE_SECONDS", 60))
+TENANT_CACHE_SIZE = int(os.getenv("TENANT_CACHE_SIZE", 10000))
+
+# Request profiling (see api/profiling.py). Requests carrying X-Profile and this
+# token are profiled; empty disables on-demand profiling.
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(BASE_DIR, 'profiles'))
+# Continuously sample 1 in N requests into per-view flame graphs (0 = off).
+PROFILE_SAMPLE_RATE = int(os.getenv("PROFILE_SAMPLE_RATE", 0))
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", 2))
+PROFILE_MAX_STACKS = int(os.getenv("PROFILE_MAX_STACKS", 20000))
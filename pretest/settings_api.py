@@ -0,0 +1,39 @@
+"""
+API-only settings for the JSON workers.
+
+Everything in pretest.settings applies, minus what a token-guarded JSON API
+never uses: the admin, sessions, messages, auth, static files, templates and
+the middleware that serves them. Fewer apps and middleware mean fewer
+modules imported and less work per request, which shortens cold starts.
+
+    DJANGO_SETTINGS_MODULE=pretest.settings_api gunicorn pretest.wsgi
+"""
+from .settings import *  # noqa: F401,F403
+
+INSTALLED_APPS = [
+    'api',
+]
+
+MIDDLEWARE = [
+    'django.middleware.security.SecurityMiddleware',
+    'api.middleware.CompressionMiddleware',
+    'api.middleware.ProfilingMiddleware',
+    'django.middleware.common.CommonMiddleware',
+]
+
+ROOT_URLCONF = 'pretest.urls_api'
+
+TEMPLATES = []
+
+AUTH_PASSWORD_VALIDATORS = []
+
+# Error messages are plain English; skip loading translation catalogs.
+USE_I18N = False
+
+REST_FRAMEWORK = {
+    # The views check access_token themselves; no user lookup, no browsable API.
+    'DEFAULT_AUTHENTICATION_CLASSES': [],
+    'DEFAULT_PERMISSION_CLASSES': [],
+    'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
+    'UNAUTHENTICATED_USER': None,
+}
@@ -0,0 +1,6 @@
+"""URL configuration for pretest.settings_api: the API without the admin site."""
+from django.urls import path, include
+
+urlpatterns = [
+    path('api/', include('api.urls')),
+]